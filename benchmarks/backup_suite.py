@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+
+"""
+备份、验证和恢复各阶段的基准测试
+
+在临时目录中生成可复现的合成目录树（见 workloads.py），依次测量：
+    scan         统计目录大小（get_dir_size_gb）
+    checksum     逐个计算文件校验和（calculate_checksum）
+    backup       完整备份到空目录
+    incremental  源目录未变化时再次备份
+    verify       生成清单并按清单验证备份（与备份时的清单验证相同）
+    restore      完整恢复到空目录并按清单验证
+
+每个阶段在单独的子进程中运行，报告耗时、吞吐量、每秒文件数、峰值内存（RSS）
+和读写类系统调用次数（/proc/self/io 的 syscr/syscw，包含rsync等子进程）。
+结果可保存为基线，之后的运行与基线比较并标出退化的指标。
+
+用法：
+    python3 benchmarks/backup_suite.py [--workloads firefox,vdi,mixed] [--engines native,rsync]
+        [--scale 1.0] [--seed 0] [--repeat 1] [--drop-caches] [--workdir /tmp]
+        [--output result.json] [--save-baseline baseline.json] [--baseline baseline.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from workloads import WORKLOADS, TreeStats, generate
+
+PHASES = ["scan", "checksum", "backup", "incremental", "verify", "restore"]
+# 与复制引擎无关的阶段只对每种负载测量一次
+SHARED_PHASES = {"scan", "checksum"}
+
+# 与基线比较的指标：(字段, 数值越大越好)
+COMPARED_METRICS = [("seconds", False), ("max_rss_kb", False), ("syscalls", False)]
+
+RESULT_VERSION = 1
+
+def _read_proc_io() -> Dict[str, int]:
+    """本进程（含已结束的子进程）的I/O统计，无法读取时返回空字典"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            return {key: int(value) for key, value in (line.split(":") for line in f)}
+    except (OSError, ValueError):
+        return {}
+
+def _copy(engine: str, src: str, dst: str, restore: bool = False) -> None:
+    """用指定引擎把 src 同步到 dst，rsync使用备份和恢复时实际构建的命令"""
+    if engine == "native":
+        from core.local_copy import sync_tree
+        from core.scanner import scan_tree
+        sync_tree(scan_tree(src), dst)
+        return
+    if restore:
+        from core.restore import RestoreManager
+        manager = RestoreManager.__new__(RestoreManager)
+    else:
+        from core.backup import BackupManager
+        manager = BackupManager.__new__(BackupManager)
+    # 构建命令只用到配置，不需要初始化管理器（初始化会检查备份盘）
+    subprocess.run(manager._build_rsync_command(src, dst), check=True)
+
+def _run_phase(phase: str, engine: str, case_dir: str) -> bool:
+    """
+    在当前进程中执行一个阶段
+
+    Args:
+        phase: 阶段名称
+        engine: 复制引擎
+        case_dir: 测试目录（包含 src，以及各引擎的 backup、restore 和清单）
+
+    Returns:
+        bool: 阶段是否成功（验证发现不一致时为False）
+    """
+    from core.manifest import build_manifest, load_manifest, save_manifest, verify_manifest, verify_tree
+    from core.scanner import scan_tree
+    from core.utils import calculate_checksum, get_dir_size_gb
+
+    src = os.path.join(case_dir, "src")
+    engine_dir = os.path.join(case_dir, engine)
+    backup = os.path.join(engine_dir, "backup")
+    restore = os.path.join(engine_dir, "restore")
+    manifest_path = os.path.join(engine_dir, "manifest.json")
+
+    if phase == "scan":
+        return get_dir_size_gb(src) > 0
+    if phase == "checksum":
+        index = scan_tree(src)
+        return all(calculate_checksum(index.abspath(rel_path)) for rel_path in index.files)
+    if phase in ("backup", "incremental"):
+        _copy(engine, src, backup)
+        return True
+    if phase == "verify":
+        manifest = build_manifest(scan_tree(src))
+        if manifest is None:
+            return False
+        report = verify_manifest(manifest, scan_tree(backup), incremental=False)
+        save_manifest(manifest, manifest_path)
+        return not report["missing"] and not report["mismatched"]
+    if phase == "restore":
+        manifest = load_manifest(manifest_path)
+        if manifest is None:
+            return False
+        _copy(engine, backup, restore, restore=True)
+        report = verify_tree(manifest, scan_tree(restore), full=True)
+        return not report["missing"] and not report["mismatched"]
+    raise ValueError(f"未知的阶段: {phase}")
+
+def _phase_main(args: argparse.Namespace) -> int:
+    """子进程入口：执行一个阶段并把测量结果写入结果文件"""
+    # 只统计阶段本身的系统调用，不计解释器启动和模块导入
+    import core.backup  # noqa: F401
+    before = _read_proc_io()
+    start = time.perf_counter()
+    ok = _run_phase(args.phase, args.engine, args.case_dir)
+    seconds = time.perf_counter() - start
+    after = _read_proc_io()
+    io = {key: value - before.get(key, 0) for key, value in after.items()}
+    result = {
+        "ok": ok,
+        "seconds": seconds,
+        # ru_maxrss 单位为KB；子进程（rsync）单独计算峰值
+        "max_rss_kb": max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        ),
+        "syscr": io.get("syscr"),
+        "syscw": io.get("syscw"),
+        "read_bytes": io.get("rchar"),
+        "write_bytes": io.get("wchar")
+    }
+    with open(args.result, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+    return 0 if ok else 1
+
+def _drop_caches() -> bool:
+    """清空页缓存，使每个阶段都从磁盘读取（需要root权限）"""
+    os.sync()
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+def _measure(phase: str, engine: str, case_dir: str, verbose: bool) -> Dict:
+    """在子进程中执行一个阶段，返回测量结果"""
+    fd, result_path = tempfile.mkstemp(prefix="phase_", suffix=".json", dir=case_dir)
+    os.close(fd)
+    try:
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--phase", phase, "--engine", engine,
+             "--case-dir", case_dir, "--result", result_path],
+            stdout=None if verbose else subprocess.DEVNULL,
+            stderr=None if verbose else subprocess.PIPE,
+            text=True
+        )
+        try:
+            with open(result_path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            detail = (process.stderr or "").strip().splitlines()[-1:] if not verbose else []
+            raise RuntimeError(f"阶段 {phase} ({engine}) 运行失败: {' '.join(detail)}")
+    finally:
+        os.remove(result_path)
+    return result
+
+def run_case(workload: str, stats: TreeStats, case_dir: str, engines: List[str],
+             repeat: int, drop_caches: bool, verbose: bool) -> List[Dict]:
+    """
+    对一种负载测量全部阶段
+
+    Args:
+        workload: 负载名称
+        stats: 生成的目录树统计
+        case_dir: 测试目录
+        engines: 复制引擎列表
+        repeat: 每个阶段重复次数（取最快的一次）
+        drop_caches: 每个阶段前是否清空页缓存
+        verbose: 是否显示子进程输出
+
+    Returns:
+        List[Dict]: 各阶段的测量结果
+    """
+    best: Dict[Tuple[str, str], Dict] = {}
+    plan = [(phase, "-") for phase in PHASES if phase in SHARED_PHASES]
+    plan += [(phase, engine) for engine in engines for phase in PHASES if phase not in SHARED_PHASES]
+    for _ in range(repeat):
+        for engine in engines:
+            shutil.rmtree(os.path.join(case_dir, engine), ignore_errors=True)
+        for phase, engine in plan:
+            if drop_caches:
+                _drop_caches()
+            result = _measure(phase, engine if engine != "-" else engines[0], case_dir, verbose)
+            if not result["ok"]:
+                raise RuntimeError(f"阶段 {phase} ({engine}) 验证失败: {workload}")
+            key = (phase, engine)
+            if key not in best or result["seconds"] < best[key]["seconds"]:
+                best[key] = result
+
+    results = []
+    for (phase, engine), result in best.items():
+        seconds = max(result["seconds"], 1e-9)
+        syscalls = None
+        if result["syscr"] is not None and result["syscw"] is not None:
+            syscalls = result["syscr"] + result["syscw"]
+        results.append({
+            "workload": workload,
+            "engine": engine,
+            "phase": phase,
+            "seconds": result["seconds"],
+            "bytes": stats.bytes,
+            "files": stats.files,
+            "bytes_per_second": stats.bytes / seconds,
+            "files_per_second": stats.files / seconds,
+            "max_rss_kb": result["max_rss_kb"],
+            "syscr": result["syscr"],
+            "syscw": result["syscw"],
+            "syscalls": syscalls,
+            "read_bytes": result["read_bytes"],
+            "write_bytes": result["write_bytes"]
+        })
+    return results
+
+def print_results(results: List[Dict]) -> None:
+    """以表格输出测量结果"""
+    header = (f"{'负载':<8}{'引擎':<8}{'阶段':<12}{'耗时(秒)':>10}{'MB/s':>10}"
+              f"{'文件/秒':>10}{'峰值RSS(MB)':>13}{'读写调用':>10}")
+    print(header)
+    for r in results:
+        syscalls = "-" if r["syscalls"] is None else str(r["syscalls"])
+        print(
+            f"{r['workload']:<10}{r['engine']:<10}{r['phase']:<14}{r['seconds']:>10.3f}"
+            f"{r['bytes_per_second'] / (1024 ** 2):>10.1f}{r['files_per_second']:>12.0f}"
+            f"{r['max_rss_kb'] / 1024:>13.1f}{syscalls:>12}"
+        )
+
+def compare_with_baseline(results: List[Dict], baseline: Dict, threshold: float) -> List[str]:
+    """
+    与基线比较，返回退化超过阈值的指标说明
+
+    Args:
+        results: 本次的测量结果
+        baseline: 基线文件内容
+        threshold: 允许的相对退化（如0.1表示10%）
+
+    Returns:
+        List[str]: 退化说明，没有退化时为空列表
+    """
+    previous = {(r["workload"], r["engine"], r["phase"]): r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"与基线比较（{baseline.get('created', '未知时间')}，阈值 {threshold:.0%}）:")
+    for r in results:
+        key = (r["workload"], r["engine"], r["phase"])
+        old = previous.get(key)
+        if old is None:
+            continue
+        changes = []
+        for field, higher_is_better in COMPARED_METRICS:
+            if r.get(field) is None or not old.get(field):
+                continue
+            change = (r[field] - old[field]) / old[field]
+            changes.append(f"{field} {change:+.1%}")
+            worse = -change if higher_is_better else change
+            if worse > threshold:
+                regressions.append(
+                    f"{'/'.join(key)}: {field} {old[field]:.6g} -> {r[field]:.6g} ({change:+.1%})"
+                )
+        print(f"  {'/'.join(key)}: {', '.join(changes)}")
+    return regressions
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="备份、验证和恢复的基准测试")
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help="负载列表（逗号分隔）")
+    parser.add_argument("--engines", default=None, help="复制引擎列表（默认 native，已安装rsync时加上 rsync）")
+    parser.add_argument("--scale", type=float, default=1.0, help="目录树规模系数")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--repeat", type=int, default=1, help="每个阶段重复次数（取最快的一次）")
+    parser.add_argument("--drop-caches", action="store_true", help="每个阶段前清空页缓存（需要root权限）")
+    parser.add_argument("--workdir", default=None, help="测试目录所在位置（默认系统临时目录）")
+    parser.add_argument("--keep", action="store_true", help="保留测试目录")
+    parser.add_argument("--verbose", action="store_true", help="显示各阶段的输出")
+    parser.add_argument("--output", default=None, help="把结果写入JSON文件")
+    parser.add_argument("--save-baseline", default=None, help="把结果保存为基线文件")
+    parser.add_argument("--baseline", default=None, help="与基线文件比较，出现退化时返回非零")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定退化的相对阈值")
+    # 以下参数供子进程使用
+    parser.add_argument("--phase", help=argparse.SUPPRESS)
+    parser.add_argument("--engine", help=argparse.SUPPRESS)
+    parser.add_argument("--case-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.phase:
+        return _phase_main(args)
+
+    workloads = [name for name in args.workloads.split(",") if name]
+    unknown = [name for name in workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"未知的负载: {', '.join(unknown)}")
+    if args.engines:
+        engines = [name for name in args.engines.split(",") if name]
+    else:
+        engines = ["native"] + (["rsync"] if shutil.which("rsync") else [])
+    if "rsync" in engines and not shutil.which("rsync"):
+        parser.error("未找到rsync")
+    if args.drop_caches and not _drop_caches():
+        print("无法清空页缓存（需要root权限），各阶段将在页缓存中运行")
+        args.drop_caches = False
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        params = baseline.get("params", {})
+        if params.get("scale") != args.scale or params.get("seed") != args.seed:
+            print(f"警告: 基线的规模或种子不同（{params}），比较结果没有意义")
+
+    workdir = tempfile.mkdtemp(prefix="backup_bench_", dir=args.workdir)
+    results: List[Dict] = []
+    try:
+        for workload in workloads:
+            case_dir = os.path.join(workdir, workload)
+            stats = generate(workload, os.path.join(case_dir, "src"), args.seed, args.scale)
+            print(
+                f"负载 {workload}: {stats.files} 个文件，逻辑大小 {stats.bytes / (1024 ** 2):.1f} MB，"
+                f"实际数据 {stats.allocated / (1024 ** 2):.1f} MB"
+            )
+            results.extend(run_case(workload, stats, case_dir, engines, args.repeat,
+                                    args.drop_caches, args.verbose))
+    finally:
+        if args.keep:
+            print(f"测试目录: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    data = {
+        "version": RESULT_VERSION,
+        "created": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "params": {"scale": args.scale, "seed": args.seed, "engines": engines,
+                   "drop_caches": args.drop_caches},
+        "results": results
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            print(f"结果已保存: {path}")
+
+    if baseline is not None:
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print("发现性能退化:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("未发现超过阈值的退化")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""
+对比内置复制引擎与rsync的本地复制性能
+
+用法：
+    python3 benchmarks/copy_engines.py [--files 2000] [--size-kb 64] [--workdir /tmp]
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.local_copy import sync_tree
+from core.scanner import scan_tree
+
+def make_tree(root: str, files: int, size_kb: int) -> int:
+    """生成包含多级目录的测试目录树，返回总字节数"""
+    total = 0
+    for i in range(files):
+        path = os.path.join(root, f"d{i % 37}", f"s{i % 5}", f"f{i}.bin")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = os.urandom(size_kb * 1024)
+        with open(path, "wb") as f:
+            f.write(data)
+        total += len(data)
+    return total
+
+def run_native(src: str, dst: str) -> float:
+    start = time.perf_counter()
+    sync_tree(scan_tree(src), dst)
+    return time.perf_counter() - start
+
+def run_rsync(src: str, dst: str) -> float:
+    start = time.perf_counter()
+    subprocess.run(["rsync", "-a", "--delete", src.rstrip("/") + "/", dst], check=True)
+    return time.perf_counter() - start
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="内置复制引擎与rsync性能对比")
+    parser.add_argument("--files", type=int, default=2000, help="文件数量")
+    parser.add_argument("--size-kb", type=int, default=64, help="每个文件的大小（KB）")
+    parser.add_argument("--workdir", default=None, help="测试目录所在位置（默认系统临时目录）")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="copy_bench_", dir=args.workdir)
+    try:
+        src = os.path.join(workdir, "src")
+        total = make_tree(src, args.files, args.size_kb)
+        print(f"测试数据: {args.files} 个文件, {total / (1024 ** 2):.1f} MB")
+
+        engines = {"native": run_native}
+        if shutil.which("rsync"):
+            engines["rsync"] = run_rsync
+        else:
+            print("未找到rsync，只测试内置引擎")
+
+        for name, func in engines.items():
+            dst = os.path.join(workdir, f"dst_{name}")
+            full = func(src, dst)
+            noop = func(src, dst)
+            print(
+                f"{name:>7}: 全量 {full:.2f} 秒 ({total / (1024 ** 2) / full:.1f} MB/s, "
+                f"{args.files / full:.0f} 文件/秒), 无变化 {noop:.2f} 秒"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
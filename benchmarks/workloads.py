@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+"""
+基准测试用的合成目录树
+
+每种负载由随机种子完全确定：同样的种子和规模总是生成相同的路径、大小和内容，
+不同机器、不同版本之间的测试结果可以直接比较。
+"""
+
+import os
+import random
+from typing import Callable, Dict, NamedTuple
+
+MB = 1024 ** 2
+
+_WORDS = (
+    "backup restore snapshot manifest checksum archive device config kernel module "
+    "service network package library profile session cache storage index record"
+).split()
+
+class TreeStats(NamedTuple):
+    """生成的目录树统计"""
+    files: int
+    bytes: int          # 文件的逻辑大小之和
+    allocated: int      # 实际写入的数据量（稀疏文件的空洞不计）
+
+def _random_bytes(rng: random.Random, size: int) -> bytes:
+    """不可压缩的数据"""
+    return rng.getrandbits(size * 8).to_bytes(size, "little") if size else b""
+
+def _random_text(rng: random.Random, size: int) -> bytes:
+    """可压缩的文本数据"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words).encode("ascii")[:size]
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+def make_firefox_tree(root: str, rng: random.Random, scale: float = 1.0) -> TreeStats:
+    """
+    类似Firefox配置目录的目录树：大量很小的缓存和站点存储文件，加上几个较大的数据库
+
+    Args:
+        root: 根目录
+        rng: 随机数生成器
+        scale: 规模系数
+
+    Returns:
+        TreeStats: 生成的目录树统计
+    """
+    files = total = 0
+    for name, size in (("places.sqlite", 8 * MB), ("favicons.sqlite", 4 * MB),
+                       ("cookies.sqlite", MB), ("webappsstore.sqlite", 2 * MB)):
+        data = _random_bytes(rng, max(4096, int(size * scale)))
+        _write(os.path.join(root, name), data)
+        files += 1
+        total += len(data)
+    for i in range(max(1, int(3000 * scale))):
+        key = "%040X" % rng.getrandbits(160)
+        data = _random_bytes(rng, rng.randint(200, 16 * 1024))
+        _write(os.path.join(root, "cache2", "entries", key), data)
+        files += 1
+        total += len(data)
+    for i in range(max(1, int(1500 * scale))):
+        origin = f"https+++site{i % 120}.example.com"
+        data = _random_text(rng, rng.randint(100, 4096))
+        _write(os.path.join(root, "storage", "default", origin, "ls", f"data{i}.sqlite"), data)
+        files += 1
+        total += len(data)
+    for i in range(max(1, int(200 * scale))):
+        data = _random_text(rng, rng.randint(50, 2048))
+        _write(os.path.join(root, "sessionstore-backups", f"recovery{i}.jsonlz4"), data)
+        files += 1
+        total += len(data)
+    return TreeStats(files, total, total)
+
+def make_vdi_tree(root: str, rng: random.Random, scale: float = 1.0) -> TreeStats:
+    """
+    类似VirtualBox虚拟机目录的目录树：一个大部分为空洞的稀疏磁盘镜像和几个小配置文件
+
+    Args:
+        root: 根目录
+        rng: 随机数生成器
+        scale: 规模系数
+
+    Returns:
+        TreeStats: 生成的目录树统计
+    """
+    os.makedirs(os.path.join(root, "ubuntu"), exist_ok=True)
+    disk = os.path.join(root, "ubuntu", "ubuntu.vdi")
+    size = max(64 * MB, int(1024 * MB * scale))
+    extents = max(4, int(24 * scale))
+    written = 0
+    with open(disk, "wb") as f:
+        f.truncate(size)
+        # 镜像头部，随后是散布在整个镜像中的已分配区域（按MB对齐）
+        f.write(_random_bytes(rng, MB))
+        written += MB
+        for offset in sorted(rng.sample(range(1, size // MB), min(extents, size // MB - 1))):
+            f.seek(offset * MB)
+            f.write(_random_bytes(rng, MB))
+            written += MB
+    files = 1
+    total = size
+    for name in ("ubuntu.vbox", "ubuntu.vbox-prev", "Logs/VBox.log"):
+        data = _random_text(rng, rng.randint(2048, 64 * 1024))
+        _write(os.path.join(root, "ubuntu", name), data)
+        files += 1
+        total += len(data)
+        written += len(data)
+    return TreeStats(files, total, written)
+
+def make_mixed_tree(root: str, rng: random.Random, scale: float = 1.0) -> TreeStats:
+    """
+    类似操作系统目录的混合目录树：二进制库、文本配置和文档、符号链接和空目录
+
+    Args:
+        root: 根目录
+        rng: 随机数生成器
+        scale: 规模系数
+
+    Returns:
+        TreeStats: 生成的目录树统计
+    """
+    files = total = 0
+    for i in range(max(1, int(150 * scale))):
+        name = f"libbench{i}.so"
+        data = _random_bytes(rng, rng.randint(16 * 1024, 768 * 1024))
+        _write(os.path.join(root, "usr", "lib", f"{name}.{i % 3}"), data)
+        os.symlink(f"{name}.{i % 3}", os.path.join(root, "usr", "lib", name))
+        files += 1
+        total += len(data)
+    for i in range(max(1, int(60 * scale))):
+        data = _random_bytes(rng, rng.randint(64 * 1024, 2 * MB))
+        _write(os.path.join(root, "usr", "bin", f"tool{i}"), data)
+        files += 1
+        total += len(data)
+    for i in range(max(1, int(800 * scale))):
+        data = _random_text(rng, rng.randint(100, 8 * 1024))
+        _write(os.path.join(root, "etc", f"conf{i % 40}.d", f"setting{i}.conf"), data)
+        files += 1
+        total += len(data)
+    for i in range(max(1, int(600 * scale))):
+        data = _random_text(rng, rng.randint(1024, 64 * 1024))
+        _write(os.path.join(root, "usr", "share", "doc", f"package{i % 90}", f"README{i}"), data)
+        files += 1
+        total += len(data)
+    for i in range(max(1, int(20 * scale))):
+        os.makedirs(os.path.join(root, "var", "empty", f"dir{i}"), exist_ok=True)
+    return TreeStats(files, total, total)
+
+WORKLOADS: Dict[str, Callable[[str, random.Random, float], TreeStats]] = {
+    "firefox": make_firefox_tree,
+    "vdi": make_vdi_tree,
+    "mixed": make_mixed_tree
+}
+
+def generate(name: str, root: str, seed: int = 0, scale: float = 1.0) -> TreeStats:
+    """
+    生成一种负载的目录树
+
+    Args:
+        name: 负载名称（WORKLOADS 中的键）
+        root: 根目录（应不存在或为空）
+        seed: 随机种子
+        scale: 规模系数
+
+    Returns:
+        TreeStats: 生成的目录树统计
+    """
+    os.makedirs(root, exist_ok=True)
+    # 种子与负载名称一起决定随机序列，单独生成某一种负载时结果不变
+    return WORKLOADS[name](root, random.Random(f"{name}:{seed}"), scale)
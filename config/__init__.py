@@ -9,36 +9,176 @@ from .settings import (
     VERSION,
     SOURCE_DISK_MODEL,
     RESTORE_PATHS,
+    RESTORE_SOURCES,
     SOURCE_PATHS,
     USB_MOUNT,
     BACKUP_ROOT,
-    #BACKUP_PREFIX,
+    BACKUP_PREFIX,
+    BACKUP_MODE,
     MIN_FREE_SPACE_GB,
+    SPACE_CHECK_MODE,
     MAX_BACKUPS,
     MIN_BACKUP_INTERVAL_DAYS,
+    CATALOG_FILE,
+    RUN_JOURNAL_FILE,
+    JOURNAL_CHECKPOINT_SECONDS,
+    WATCH_JOURNAL_FILE,
+    WATCH_FLUSH_SECONDS,
+    WATCH_INCREMENTAL,
+    PARALLEL_BACKUP,
+    BACKUP_WORKERS,
+    MAX_JOBS_PER_DEVICE,
+    SCAN_WORKERS,
+    PARALLEL_RESTORE,
+    RESTORE_WORKERS,
+    PIPELINE_VERIFY,
+    JOB_TIMEOUT,
+    PROCESS_IDLE_TIMEOUT,
+    PROCESS_KILL_GRACE,
+    COMMAND_TIMEOUT,
+    PROGRESS_INTERVAL,
+    PROGRESS_BARS,
+    METRICS_DIR,
+    BACKUP_ENGINES,
+    RESTORE_ENGINES,
+    RESTORE_PLAN,
+    COPY_WORKERS,
+    COPY_CHUNK_SIZE,
+    HASH_WHILE_COPY,
+    CHUNKSTORE_DIR,
+    RECIPE_DIR_NAME,
+    CHUNK_MIN_SIZE,
+    CHUNK_AVG_SIZE,
+    CHUNK_MAX_SIZE,
+    CHUNK_SEGMENT_SIZE,
+    CHUNK_WORKERS,
+    ARCHIVE_DIR_NAME,
+    ARCHIVE_FRAME_SIZE,
+    ARCHIVE_THREADS,
+    ARCHIVE_LEVEL,
+    ARCHIVE_MIN_LEVEL,
+    ARCHIVE_MAX_LEVEL,
+    ARCHIVE_ADAPTIVE,
+    PACK_DIR_NAME,
+    PACK_FILE_SIZE,
+    PACK_COMPACT_RATIO,
+    PACK_IO_BUFFER,
+    SQLITE_CAPTURE_SOURCES,
+    SQLITE_CAPTURE_METHOD,
+    SQLITE_STAGING_DIR,
+    SQLITE_BUSY_TIMEOUT,
+    IO_PRIORITY_CLASS,
+    IO_PRIORITY_LEVEL,
+    CPU_NICE,
+    PHASE_BANDWIDTH_MBPS,
+    ADAPTIVE_THROTTLE,
+    THROTTLE_TARGET_LATENCY_MS,
+    THROTTLE_MIN_MBPS,
+    THROTTLE_INTERVAL,
     LOG_DIR,
     LOG_FORMAT,
     LOG_ROTATION,
     RSYNC_OPTIONS,
     VERIFY_CHECKSUM,
-    VERIFY_SAMPLE_SIZE
+    VERIFY_SAMPLE_SIZE,
+    VERIFY_MODE,
+    MANIFEST_DIR_NAME,
+    FILE_INDEX_NAME,
+    RESTORE_VERIFY_MODE,
+    VERIFY_DROP_CACHE,
+    CHECKSUM_ALGORITHM,
+    HASH_WORKERS,
+    HASH_CHUNK_SIZE,
+    HASH_MMAP_THRESHOLD,
+    CHECKSUM_CACHE_FILE,
+    CHECKSUM_CACHE_MAX_ENTRIES
 )
 
 __all__ = [
     'VERSION',
     'SOURCE_DISK_MODEL',
     'RESTORE_PATHS',
+    'RESTORE_SOURCES',
     'SOURCE_PATHS',
     'USB_MOUNT',
     'BACKUP_ROOT',
-    #'BACKUP_PREFIX',
+    'BACKUP_PREFIX',
+    'BACKUP_MODE',
     'MIN_FREE_SPACE_GB',
+    'SPACE_CHECK_MODE',
     'MAX_BACKUPS',
     'MIN_BACKUP_INTERVAL_DAYS',
+    'CATALOG_FILE',
+    'RUN_JOURNAL_FILE',
+    'JOURNAL_CHECKPOINT_SECONDS',
+    'WATCH_JOURNAL_FILE',
+    'WATCH_FLUSH_SECONDS',
+    'WATCH_INCREMENTAL',
+    'PARALLEL_BACKUP',
+    'BACKUP_WORKERS',
+    'MAX_JOBS_PER_DEVICE',
+    'SCAN_WORKERS',
+    'PARALLEL_RESTORE',
+    'RESTORE_WORKERS',
+    'PIPELINE_VERIFY',
+    'JOB_TIMEOUT',
+    'PROCESS_IDLE_TIMEOUT',
+    'PROCESS_KILL_GRACE',
+    'COMMAND_TIMEOUT',
+    'PROGRESS_INTERVAL',
+    'PROGRESS_BARS',
+    'METRICS_DIR',
+    'BACKUP_ENGINES',
+    'RESTORE_ENGINES',
+    'RESTORE_PLAN',
+    'COPY_WORKERS',
+    'COPY_CHUNK_SIZE',
+    'HASH_WHILE_COPY',
+    'CHUNKSTORE_DIR',
+    'RECIPE_DIR_NAME',
+    'CHUNK_MIN_SIZE',
+    'CHUNK_AVG_SIZE',
+    'CHUNK_MAX_SIZE',
+    'CHUNK_SEGMENT_SIZE',
+    'CHUNK_WORKERS',
+    'ARCHIVE_DIR_NAME',
+    'ARCHIVE_FRAME_SIZE',
+    'ARCHIVE_THREADS',
+    'ARCHIVE_LEVEL',
+    'ARCHIVE_MIN_LEVEL',
+    'ARCHIVE_MAX_LEVEL',
+    'ARCHIVE_ADAPTIVE',
+    'PACK_DIR_NAME',
+    'PACK_FILE_SIZE',
+    'PACK_COMPACT_RATIO',
+    'PACK_IO_BUFFER',
+    'SQLITE_CAPTURE_SOURCES',
+    'SQLITE_CAPTURE_METHOD',
+    'SQLITE_STAGING_DIR',
+    'SQLITE_BUSY_TIMEOUT',
+    'IO_PRIORITY_CLASS',
+    'IO_PRIORITY_LEVEL',
+    'CPU_NICE',
+    'PHASE_BANDWIDTH_MBPS',
+    'ADAPTIVE_THROTTLE',
+    'THROTTLE_TARGET_LATENCY_MS',
+    'THROTTLE_MIN_MBPS',
+    'THROTTLE_INTERVAL',
     'LOG_DIR',
     'LOG_FORMAT',
     'LOG_ROTATION',
     'RSYNC_OPTIONS',
     'VERIFY_CHECKSUM',
-    'VERIFY_SAMPLE_SIZE'
+    'VERIFY_SAMPLE_SIZE',
+    'VERIFY_MODE',
+    'MANIFEST_DIR_NAME',
+    'FILE_INDEX_NAME',
+    'RESTORE_VERIFY_MODE',
+    'VERIFY_DROP_CACHE',
+    'CHECKSUM_ALGORITHM',
+    'HASH_WORKERS',
+    'HASH_CHUNK_SIZE',
+    'HASH_MMAP_THRESHOLD',
+    'CHECKSUM_CACHE_FILE',
+    'CHECKSUM_CACHE_MAX_ENTRIES'
 ]
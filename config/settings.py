@@ -23,6 +23,13 @@ RESTORE_PATHS = {
     }
 }
 
+# 恢复目录对应的源目录（SOURCE_PATHS 中的名称），备份中的目录名取自源路径的basename
+RESTORE_SOURCES = {
+    "firefox_dst": "firefox_src",
+    "vbox_restore_dir": "vbox_src",
+    "ubuntu_restore_dir": "ubuntu_src"
+}
+
 # Source paths (A机器)
 SOURCE_PATHS = {
     "firefox_src": "/home/amd369/snap/firefox/common/.mozilla/firefox/9o7ba9cd.default",
@@ -33,12 +40,91 @@ SOURCE_PATHS = {
 # Backup settings
 USB_MOUNT = "/media/amd369/KIOXIA480G"
 BACKUP_ROOT = os.path.join(USB_MOUNT, "backup")
+BACKUP_PREFIX = "backup_"  # 快照目录名前缀，完整名称为 backup_YYYY-MM-DD
 BACKUP_DIR = os.path.join(BACKUP_ROOT, "backup_2025-06-28")  # 指定要使用的备份目录，可以是已存在的目录
+BACKUP_MODE = "fixed"  # 备份模式："fixed" 始终写入BACKUP_DIR，"snapshot" 每天创建硬链接快照并轮换
 MIN_FREE_SPACE_GB = 2  # 最小剩余空间要求（GB）
+SPACE_CHECK_MODE = "delta"  # 空间检查模式："delta" 按实际变化量估算，"full" 按源目录总大小
 
 # Backup retention settings
-MAX_BACKUPS = 5  # 保留的最大备份数量
-MIN_BACKUP_INTERVAL_DAYS = 1  # 最小备份间隔（天）
+MAX_BACKUPS = 5  # 保留的最大备份数量（快照模式）
+MIN_BACKUP_INTERVAL_DAYS = 1  # 最小备份间隔（天，快照模式）
+CATALOG_FILE = "backup_catalog.sqlite"  # 备份记录数据库文件名（与校验和缓存位于同一目录），取代 backup_history.json
+RUN_JOURNAL_FILE = "/var/tmp/backup-system/backup_run.sqlite"  # 运行日志，记录未完成备份的进度供 --resume 继续（位于本地磁盘，U盘断开时仍可写入）
+JOURNAL_CHECKPOINT_SECONDS = 10  # 运行日志写入逐个文件的校验和进度的间隔（秒）
+WATCH_JOURNAL_FILE = "/var/tmp/backup-system/changes.sqlite"  # 变更日志，由监视进程（--watch）记录源目录中变化的路径（位于本地磁盘）
+WATCH_FLUSH_SECONDS = 1  # 监视进程写入变更日志的间隔（秒）
+WATCH_INCREMENTAL = True  # 监视进程持续跟踪时，备份只扫描、传输和验证变化的路径（否则总是完整扫描）
+
+# Concurrency settings
+PARALLEL_BACKUP = True  # 是否并行备份各个源目录
+BACKUP_WORKERS = 3  # 并行备份的最大工作线程数
+MAX_JOBS_PER_DEVICE = 2  # 同一物理设备上同时运行的最大任务数
+SCAN_WORKERS = 8  # 并行扫描目录树的线程数
+PARALLEL_RESTORE = True  # 是否并行恢复各个目录
+RESTORE_WORKERS = 3  # 并行恢复的最大工作线程数
+PIPELINE_VERIFY = True  # 一个目录传输完成后立即开始验证，同时开始下一个目录的传输（传输和验证各自受并行数限制）
+JOB_TIMEOUT = 0  # 单个目录的备份或恢复任务（传输和验证）的最长时间（秒），超时后终止其子进程并记为失败，0表示不限制
+PROCESS_IDLE_TIMEOUT = 600  # rsync连续多长时间（秒）没有进度输出视为挂起并终止（如U盘接触不良），仅在启用进度输出时生效，0表示不限制
+PROCESS_KILL_GRACE = 10  # 终止子进程时先发送SIGTERM，等待该时间（秒）后仍未退出再发送SIGKILL
+COMMAND_TIMEOUT = 30  # 辅助命令（lsblk、ionice）的超时时间（秒）
+PROGRESS_INTERVAL = 5  # 并行任务汇总进度的输出间隔（秒）
+PROGRESS_BARS = True  # 在终端中用tqdm为每个任务显示进度条（未安装tqdm或输出被重定向时改为定期输出汇总行）
+METRICS_DIR = "/var/log/backup-system/metrics"  # 每次备份和恢复的阶段统计（JSON）的保存目录（位于本地磁盘）
+
+# Backup engine settings
+BACKUP_ENGINES = {  # 各源目录使用的备份引擎："rsync" 镜像复制，"native" 内置本地复制，"chunkstore" 内容定义分块去重存储，"archive" zstd压缩归档，"pack" 小文件打包
+    "firefox_src": "rsync",
+    "vbox_src": "rsync",
+    "ubuntu_src": "rsync"
+}
+RESTORE_ENGINES = {  # 各恢复目录使用的复制引擎："rsync" 或 "native"（块存储、归档和打包备份总是按配方或索引恢复）
+    "firefox_dst": "rsync",
+    "vbox_restore_dir": "rsync",
+    "ubuntu_restore_dir": "rsync"
+}
+RESTORE_PLAN = True  # 恢复前先比较目标目录与备份清单，只传输有差异的文件（备份中没有清单时按引擎完整恢复）
+COPY_WORKERS = 4  # 内置复制引擎的并行文件数
+COPY_CHUNK_SIZE = 8 * 1024 * 1024  # 内置复制引擎每次系统调用复制的字节数
+HASH_WHILE_COPY = True  # 内置复制引擎复制时同时计算源文件校验和（存入校验和缓存，生成清单时不再读取源文件；不能使用内核内复制）
+CHUNKSTORE_DIR = os.path.join(BACKUP_ROOT, "chunkstore")  # 块存储目录（所有备份共享）
+RECIPE_DIR_NAME = "recipes"  # 配方目录名（位于备份目录中）
+CHUNK_MIN_SIZE = 256 * 1024  # 最小块大小（字节）
+CHUNK_AVG_SIZE = 1024 * 1024  # 平均块大小（字节）
+CHUNK_MAX_SIZE = 4 * 1024 * 1024  # 最大块大小（字节）
+CHUNK_SEGMENT_SIZE = 64 * 1024 * 1024  # 大文件并行切分的分段大小（字节）
+CHUNK_WORKERS = os.cpu_count() or 2  # 切分进程数
+ARCHIVE_DIR_NAME = "archives"  # 归档目录名（位于备份目录中）
+ARCHIVE_FRAME_SIZE = 4 * 1024 * 1024  # 每个独立zstd帧的原始数据大小（字节）
+ARCHIVE_THREADS = os.cpu_count() or 2  # 并行压缩线程数
+ARCHIVE_LEVEL = 3  # 初始压缩级别
+ARCHIVE_MIN_LEVEL = 1  # 自适应调整的最低压缩级别
+ARCHIVE_MAX_LEVEL = 19  # 自适应调整的最高压缩级别
+ARCHIVE_ADAPTIVE = True  # 是否根据压缩和写入速度自动调整压缩级别
+PACK_DIR_NAME = "packs"  # 包目录名（位于备份目录中）
+PACK_FILE_SIZE = 256 * 1024 * 1024  # 单个包文件的最大大小（字节）
+PACK_COMPACT_RATIO = 0.5  # 包中失效数据超过该比例时重新打包
+PACK_IO_BUFFER = 8 * 1024 * 1024  # 读写包文件的缓冲区大小（字节）
+
+# SQLite capture settings
+SQLITE_CAPTURE_SOURCES = ["firefox_src"]  # 备份前对其中的SQLite数据库做一致性快照的源目录
+SQLITE_CAPTURE_METHOD = "backup"  # 快照方式："backup" 在线备份API，"vacuum" VACUUM INTO（同时去除碎片）
+SQLITE_STAGING_DIR = "/var/tmp/backup-system/sqlite"  # 数据库快照的暂存目录（位于本地磁盘，跨次备份保留）
+SQLITE_BUSY_TIMEOUT = 10  # 数据库被锁定时的等待时间（秒）
+
+# I/O throttling settings
+IO_PRIORITY_CLASS = "best-effort"  # 备份和恢复进程（及rsync等子进程）的I/O调度类："idle" 仅在磁盘空闲时读写，"best-effort" 普通调度的低优先级，"none" 不调整
+IO_PRIORITY_LEVEL = 7  # best-effort 调度类中的优先级（0最高，7最低）
+CPU_NICE = 10  # 备份和恢复进程的nice值（0表示不调整）
+PHASE_BANDWIDTH_MBPS = {  # 各阶段的带宽上限（MB/s，0表示不限制）："transfer" 备份复制，"verify" 备份校验，"restore" 恢复复制和校验
+    "transfer": 0,
+    "verify": 0,
+    "restore": 0
+}
+ADAPTIVE_THROTTLE = True  # 根据生产磁盘（备份时为源目录所在磁盘，恢复时为恢复位置所在磁盘）的I/O延迟自动降速
+THROTTLE_TARGET_LATENCY_MS = 20  # 平均每次I/O耗时超过该值（毫秒）时降速
+THROTTLE_MIN_MBPS = 5  # 自动降速的最低带宽（MB/s）
+THROTTLE_INTERVAL = 1  # 采样磁盘延迟的间隔（秒）
 
 # Logging settings
 LOG_DIR = os.path.join(Path(__file__).parent.parent, "logs")
@@ -50,6 +136,7 @@ RSYNC_OPTIONS = {
     "archive": True,          # -a, 归档模式
     "verbose": True,          # -v, 详细输出
     "compress": True,         # -z, 传输时压缩
+    "sparse": True,           # --sparse, 在目标端保留稀疏文件（虚拟磁盘）的空洞
     "delete": True,          # --delete, 删除目标端不存在的文件
     "progress": True,        # --info=progress2, 显示进度
     "exclude": ["lock"]      # --exclude=lock, 排除文件
@@ -58,3 +145,16 @@ RSYNC_OPTIONS = {
 # Verification settings
 VERIFY_CHECKSUM = True  # 是否验证备份文件校验和
 VERIFY_SAMPLE_SIZE = 10  # 随机验证文件数量（每个目录）
+VERIFY_MODE = "manifest"  # 验证模式："manifest" 按清单验证全部文件，"sample" 随机抽样验证
+MANIFEST_DIR_NAME = "manifests"  # 清单目录名（位于备份目录中）
+FILE_INDEX_NAME = "file_index.sqlite"  # 快照文件索引（位于备份目录中），供按路径查找和选择性恢复
+RESTORE_VERIFY_MODE = "full"  # 恢复后的验证方式："quick" 只比较大小和修改时间，"full" 快速检查通过后再按清单计算校验和
+VERIFY_DROP_CACHE = True  # 验证时先把目标文件写回磁盘并丢弃其页缓存，使校验和读自磁盘而不是刚写入的缓存
+
+# Hash settings
+CHECKSUM_ALGORITHM = "blake2b"  # 校验和算法（hashlib支持的任意算法，如 blake2b、sha256、md5）
+HASH_WORKERS = 4  # 并行计算校验和的线程数
+HASH_CHUNK_SIZE = 1024 * 1024  # 每次读取的块大小（字节）
+HASH_MMAP_THRESHOLD = 64 * 1024 * 1024  # 超过该大小的文件使用mmap读取（字节）
+CHECKSUM_CACHE_FILE = "checksum_cache.json"  # 校验和缓存文件名（位于备份目录中）
+CHECKSUM_CACHE_MAX_ENTRIES = 200000  # 校验和缓存的最大条目数
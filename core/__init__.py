@@ -7,12 +7,25 @@
 
 from .backup import BackupManager
 from .restore import RestoreManager
+from .archive import ArchiveReader
+from .catalog import BackupCatalog
+from .changes import ChangeJournal
+from .checksum_cache import ChecksumCache
+from .file_index import IndexEntry, search_file_index
+from .hasher import hash_file, hash_files
+from .journal import RunJournal
+from .parallel import JobRunner, run_process
+from .scanner import FileIndex, scan_tree
+from .throttle import IOScheduler
+from .watcher import ChangeWatcher
 from .utils import (
     setup_logging,
     is_ubuntu,
     get_disk_model,
+    get_physical_device,
     get_dir_size_gb,
     get_disk_free_gb,
+    is_backup_disk_missing,
     verify_path_exists,
     calculate_checksum,
     format_duration,
@@ -22,11 +35,28 @@ from .utils import (
 __all__ = [
     'BackupManager',
     'RestoreManager',
+    'ArchiveReader',
+    'BackupCatalog',
+    'ChangeJournal',
+    'ChecksumCache',
+    'IndexEntry',
+    'search_file_index',
+    'hash_file',
+    'hash_files',
+    'RunJournal',
+    'JobRunner',
+    'run_process',
+    'FileIndex',
+    'scan_tree',
+    'IOScheduler',
+    'ChangeWatcher',
     'setup_logging',
     'is_ubuntu',
     'get_disk_model',
+    'get_physical_device',
     'get_dir_size_gb',
     'get_disk_free_gb',
+    'is_backup_disk_missing',
     'verify_path_exists',
     'calculate_checksum',
     'format_duration',
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖，只有使用归档引擎时才需要
+    zstandard = None
+
+from config.settings import (
+    ARCHIVE_DIR_NAME,
+    ARCHIVE_FRAME_SIZE,
+    ARCHIVE_THREADS,
+    ARCHIVE_LEVEL,
+    ARCHIVE_MIN_LEVEL,
+    ARCHIVE_MAX_LEVEL,
+    ARCHIVE_ADAPTIVE,
+    CHECKSUM_ALGORITHM
+)
+from .hasher import new_hasher
+from .local_copy import finish_restore
+from .manifest import HASH
+from .scanner import FileIndex
+from .sparse import iter_content
+from .utils import print_error, print_info, print_warning
+
+ARCHIVE_VERSION = 1
+ARCHIVE_SUFFIX = ".zar"
+
+# 文件尾：索引帧偏移、索引帧长度、魔数
+_FOOTER = struct.Struct("<QQ8s")
+_MAGIC = b"BKZARC01"
+
+# 每压缩这么多帧评估一次压缩与写入的耗时，调整压缩级别
+_ADAPT_WINDOW = 16
+
+# 文件中属于同一帧的片段：[帧序号, 帧内偏移, 长度]
+Part = List[int]
+
+_local = threading.local()
+
+def _require_zstd() -> None:
+    """检查 zstandard 是否已安装"""
+    if zstandard is None:
+        raise RuntimeError("归档引擎需要 zstandard 模块，请执行: python3 -m pip install zstandard")
+
+def _compress_frame(data: bytes, level: int) -> bytes:
+    """在工作线程中压缩一个独立帧（压缩器不能跨线程共享，按线程和级别缓存）"""
+    compressors = getattr(_local, "compressors", None)
+    if compressors is None:
+        compressors = _local.compressors = {}
+    compressor = compressors.get(level)
+    if compressor is None:
+        compressor = compressors[level] = zstandard.ZstdCompressor(level=level, write_content_size=True)
+    return compressor.compress(data)
+
+def get_archive_path(backup_dir: Union[str, Path], name: str) -> str:
+    """获取源目录在备份目录中的归档文件路径"""
+    return os.path.join(str(backup_dir), ARCHIVE_DIR_NAME, f"{name}{ARCHIVE_SUFFIX}")
+
+class _LevelController:
+    """
+    根据实测吞吐量调整压缩级别
+
+    写入线程等待压缩结果的时间多于写入时间时说明压缩是瓶颈，降低级别；
+    写入时间更长时说明目标设备是瓶颈（如U盘），提高级别以减少写入的字节数。
+    """
+
+    def __init__(self, level: int, min_level: int, max_level: int, adaptive: bool):
+        self.level = max(min_level, min(max_level, level))
+        self.min_level = min_level
+        self.max_level = max_level
+        self.adaptive = adaptive
+        self.wait_time = 0.0
+        self.write_time = 0.0
+        self.frames = 0
+
+    def record(self, wait_time: float, write_time: float) -> None:
+        """记录一帧的等待和写入耗时，每个评估窗口结束时调整级别"""
+        self.wait_time += wait_time
+        self.write_time += write_time
+        self.frames += 1
+        if not self.adaptive or self.frames < _ADAPT_WINDOW:
+            return
+        if self.wait_time > self.write_time * 1.2:
+            self.level = max(self.min_level, self.level - 1)
+        elif self.write_time > self.wait_time * 1.2:
+            self.level = min(self.max_level, self.level + 1)
+        self.wait_time = self.write_time = 0.0
+        self.frames = 0
+
+def write_archive(
+    index: FileIndex,
+    archive_path: Union[str, Path],
+    level: int = ARCHIVE_LEVEL,
+    threads: int = ARCHIVE_THREADS,
+    frame_size: int = ARCHIVE_FRAME_SIZE
+) -> Optional[Dict]:
+    """
+    把目录树写成由独立zstd帧组成的归档文件
+
+    文件内容按顺序拼接后切成固定大小的帧，小文件共享一帧，大文件跨越多帧。
+    各帧在线程池中并行压缩、按顺序写入；末尾附加压缩的JSON索引和固定长度的文件尾，
+    读取单个文件时只需解压它所在的帧。
+
+    Args:
+        index: 源目录的文件索引
+        archive_path: 归档文件路径
+        level: 初始压缩级别
+        threads: 压缩线程数
+        frame_size: 每帧的原始数据大小
+
+    Returns:
+        Optional[Dict]: 归档索引，失败时返回None
+    """
+    _require_zstd()
+    archive_path = str(archive_path)
+    os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+    tmp_path = archive_path + ".tmp"
+    controller = _LevelController(level, ARCHIVE_MIN_LEVEL, ARCHIVE_MAX_LEVEL, ARCHIVE_ADAPTIVE)
+    threads = max(1, threads)
+    frames: List[List[int]] = []
+    files: Dict[str, Dict] = {}
+    pending: deque = deque()
+    raw_bytes = 0
+    buf = bytearray()
+
+    try:
+        with open(tmp_path, "wb") as out, ThreadPoolExecutor(max_workers=threads) as executor:
+
+            def write_oldest() -> None:
+                future, raw_len = pending.popleft()
+                wait_start = time.monotonic()
+                data = future.result()
+                write_start = time.monotonic()
+                frames.append([out.tell(), len(data), raw_len])
+                out.write(data)
+                controller.record(write_start - wait_start, time.monotonic() - write_start)
+
+            def flush_frame() -> None:
+                pending.append((executor.submit(_compress_frame, bytes(buf), controller.level), len(buf)))
+                buf.clear()
+                # 限制在途帧数，控制内存占用
+                while len(pending) > threads * 2:
+                    write_oldest()
+
+            for rel_path in sorted(index.files):
+                st = index.files[rel_path]
+                parts: List[Part] = []
+                size = 0
+                try:
+                    with open(index.abspath(rel_path), "rb") as f:
+                        for block in iter_content(f.fileno(), st.st_size, frame_size):
+                            view = memoryview(block)
+                            while view:
+                                take = min(len(view), frame_size - len(buf))
+                                frame_no = len(frames) + len(pending)
+                                if parts and parts[-1][0] == frame_no:
+                                    parts[-1][2] += take
+                                else:
+                                    parts.append([frame_no, len(buf), take])
+                                buf += view[:take]
+                                view = view[take:]
+                                size += take
+                                if len(buf) >= frame_size:
+                                    flush_frame()
+                except OSError as e:
+                    print_error(f"读取文件失败 {rel_path}: {e}")
+                    return None
+                raw_bytes += size
+                files[rel_path] = {
+                    "size": size,
+                    "mtime_ns": st.st_mtime_ns,
+                    "mode": st.st_mode & 0o7777,
+                    "parts": parts
+                }
+
+            if buf:
+                flush_frame()
+            while pending:
+                write_oldest()
+
+            archive_index = {
+                "version": ARCHIVE_VERSION,
+                "source": index.root,
+                "created": datetime.now().isoformat(),
+                "frames": frames,
+                "files": files,
+                "dirs": {rel_path: st.st_mode & 0o7777 for rel_path, st in index.dirs.items()},
+                "symlinks": {
+                    rel_path: os.readlink(index.abspath(rel_path)) for rel_path in index.symlinks
+                }
+            }
+            index_data = zstandard.ZstdCompressor(level=ARCHIVE_LEVEL).compress(
+                json.dumps(archive_index, ensure_ascii=False).encode("utf-8")
+            )
+            index_offset = out.tell()
+            out.write(index_data)
+            out.write(_FOOTER.pack(index_offset, len(index_data), _MAGIC))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, archive_path)
+    except OSError as e:
+        print_error(f"写入归档失败 {archive_path}: {e}")
+        return None
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    written = os.path.getsize(archive_path)
+    ratio = written / raw_bytes if raw_bytes else 1.0
+    print_info(
+        f"归档完成 {archive_path}: 原始 {raw_bytes / (1024 ** 2):.1f} MB，"
+        f"压缩后 {written / (1024 ** 2):.1f} MB ({ratio:.0%})，最终压缩级别 {controller.level}"
+    )
+    return archive_index
+
+class ArchiveReader:
+    """
+    按索引随机读取归档中的文件
+
+    只解压目标文件所在的帧；顺序读取时最近解压的帧会被复用。
+    """
+
+    def __init__(self, archive_path: Union[str, Path]):
+        """
+        打开归档并读取尾部索引
+
+        Args:
+            archive_path: 归档文件路径
+
+        Raises:
+            ValueError: 文件不是有效的归档
+        """
+        _require_zstd()
+        self.archive_path = str(archive_path)
+        self._file = open(self.archive_path, "rb")
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._cached_frame = -1
+        self._cached_data = b""
+        try:
+            self._file.seek(-_FOOTER.size, os.SEEK_END)
+            index_offset, index_length, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+            if magic != _MAGIC:
+                raise ValueError(f"不是有效的归档文件: {self.archive_path}")
+            self._file.seek(index_offset)
+            self.index = json.loads(self._decompressor.decompress(self._file.read(index_length)))
+        except (OSError, struct.error, zstandard.ZstdError) as e:
+            self._file.close()
+            raise ValueError(f"读取归档索引失败 {self.archive_path}: {e}")
+        except ValueError:
+            self._file.close()
+            raise
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "ArchiveReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _read_frame(self, frame_no: int) -> bytes:
+        """解压指定的帧"""
+        if frame_no != self._cached_frame:
+            offset, length, raw_len = self.index["frames"][frame_no]
+            self._file.seek(offset)
+            self._cached_data = self._decompressor.decompress(
+                self._file.read(length), max_output_size=raw_len
+            )
+            self._cached_frame = frame_no
+        return self._cached_data
+
+    def iter_file(self, rel_path: str) -> Iterator[bytes]:
+        """
+        按顺序产出归档中某个文件的内容
+
+        Args:
+            rel_path: 文件的相对路径
+
+        Yields:
+            bytes: 文件内容片段
+
+        Raises:
+            KeyError: 归档中没有该文件
+        """
+        for frame_no, offset, length in self.index["files"][rel_path]["parts"]:
+            yield self._read_frame(frame_no)[offset:offset + length]
+
+    def extract_file(self, rel_path: str, dst_file: Union[str, Path]) -> None:
+        """
+        提取单个文件并恢复权限和修改时间
+
+        Args:
+            rel_path: 文件的相对路径
+            dst_file: 目标文件路径
+        """
+        entry = self.index["files"][rel_path]
+        dst_file = str(dst_file)
+        os.makedirs(os.path.dirname(dst_file) or ".", exist_ok=True)
+        tmp_file = dst_file + ".restore.tmp"
+        try:
+            with open(tmp_file, "wb") as f:
+                for data in self.iter_file(rel_path):
+                    if data.count(0) == len(data):
+                        # 全零片段不写入，在目标文件中保留为空洞
+                        f.seek(len(data), os.SEEK_CUR)
+                    else:
+                        f.write(data)
+                f.truncate(entry["size"])
+            os.chmod(tmp_file, entry["mode"])
+            os.utime(tmp_file, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+            os.replace(tmp_file, dst_file)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+def load_archive_index(archive_path: Union[str, Path]) -> Optional[Dict]:
+    """
+    读取归档的索引
+
+    Args:
+        archive_path: 归档文件路径
+
+    Returns:
+        Optional[Dict]: 归档索引，不存在或无效时返回None
+    """
+    if not os.path.exists(archive_path):
+        return None
+    try:
+        with ArchiveReader(archive_path) as reader:
+            return reader.index
+    except ValueError as e:
+        print_warning(str(e))
+        return None
+
+def archive_unchanged(archive_index: Dict, index: FileIndex) -> bool:
+    """判断源目录与归档相比是否完全没有变化（文件、目录、符号链接以及大小和修改时间）"""
+    files = archive_index["files"]
+    if set(files) != set(index.files) or set(archive_index["dirs"]) != set(index.dirs):
+        return False
+    if set(archive_index["symlinks"]) != set(index.symlinks):
+        return False
+    return all(
+        files[rel_path]["size"] == st.st_size and files[rel_path]["mtime_ns"] == st.st_mtime_ns
+        for rel_path, st in index.files.items()
+    )
+
+def verify_archive(archive_path: Union[str, Path], manifest: Dict) -> Dict[str, List[str]]:
+    """
+    按清单验证归档：解压每个文件并与源文件校验和比较
+
+    文件按写入顺序读取，每帧只解压一次。
+
+    Args:
+        archive_path: 归档文件路径
+        manifest: 源目录清单
+
+    Returns:
+        Dict[str, List[str]]: 验证报告，包含 missing、mismatched、hashed
+    """
+    report: Dict[str, List[str]] = {"missing": [], "mismatched": [], "hashed": []}
+    algorithm = manifest.get("algorithm", CHECKSUM_ALGORITHM)
+    try:
+        reader = ArchiveReader(archive_path)
+    except ValueError as e:
+        print_error(str(e))
+        report["missing"] = sorted(manifest["entries"])
+        return report
+
+    with reader:
+        for rel_path in sorted(manifest["entries"]):
+            if rel_path not in reader.index["files"]:
+                report["missing"].append(rel_path)
+                continue
+            hasher = new_hasher(algorithm)
+            try:
+                for data in reader.iter_file(rel_path):
+                    hasher.update(data)
+            except (OSError, zstandard.ZstdError) as e:
+                print_error(f"解压失败 {rel_path}: {e}")
+                report["mismatched"].append(rel_path)
+                continue
+            report["hashed"].append(rel_path)
+            if hasher.hexdigest() != manifest["entries"][rel_path][HASH]:
+                report["mismatched"].append(rel_path)
+    return report
+
+def extract_archive(
+    archive_path: Union[str, Path],
+    dst_root: Union[str, Path],
+    delete: bool = True,
+    progress: Optional[Callable[[int], None]] = None
+) -> bool:
+    """
+    把归档完整解压到目标目录
+
+    Args:
+        archive_path: 归档文件路径
+        dst_root: 恢复目标目录
+        delete: 是否删除目标中归档以外的文件（与rsync --delete一致）
+        progress: 进度回调，参数为新恢复的字节数
+
+    Returns:
+        bool: 是否全部恢复成功
+    """
+    dst_root = str(dst_root)
+    try:
+        reader = ArchiveReader(archive_path)
+    except ValueError as e:
+        print_error(str(e))
+        return False
+
+    ok = True
+    with reader:
+        archive_index = reader.index
+        os.makedirs(dst_root, exist_ok=True)
+        for rel_path in sorted(archive_index["dirs"]):
+            os.makedirs(os.path.join(dst_root, rel_path), exist_ok=True)
+
+        # 按写入顺序解压，相邻的小文件共享已解压的帧
+        for rel_path in sorted(archive_index["files"]):
+            try:
+                reader.extract_file(rel_path, os.path.join(dst_root, rel_path))
+            except (OSError, zstandard.ZstdError) as e:
+                print_error(f"恢复文件失败 {rel_path}: {e}")
+                ok = False
+            if progress:
+                progress(archive_index["files"][rel_path]["size"])
+
+    if not finish_restore(
+            dst_root, archive_index["files"], archive_index["dirs"], archive_index["symlinks"], delete):
+        ok = False
+    return ok
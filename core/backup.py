@@ -1,36 +1,153 @@
 # -*- coding: utf-8 -*-
 
 import os
+import stat
 import time
-import json
 import random
-from datetime import datetime
+import shutil
+import subprocess
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Sequence, Set, Tuple
 
 from config.settings import (
     SOURCE_PATHS,
+    USB_MOUNT,
+    BACKUP_ROOT,
     BACKUP_DIR,
+    BACKUP_MODE,
+    MAX_BACKUPS,
+    MIN_BACKUP_INTERVAL_DAYS,
+    CATALOG_FILE,
+    RUN_JOURNAL_FILE,
+    WATCH_JOURNAL_FILE,
+    WATCH_INCREMENTAL,
+    BACKUP_ENGINES,
+    CHUNKSTORE_DIR,
     MIN_FREE_SPACE_GB,
     RSYNC_OPTIONS,
     VERIFY_CHECKSUM,
-    VERIFY_SAMPLE_SIZE
+    VERIFY_SAMPLE_SIZE,
+    VERIFY_MODE,
+    VERIFY_DROP_CACHE,
+    HASH_WHILE_COPY,
+    SPACE_CHECK_MODE,
+    CHECKSUM_CACHE_FILE,
+    CHECKSUM_ALGORITHM,
+    PARALLEL_BACKUP,
+    BACKUP_WORKERS,
+    MAX_JOBS_PER_DEVICE,
+    PROCESS_IDLE_TIMEOUT,
+    SQLITE_CAPTURE_SOURCES
 )
+from .archive import (
+    archive_unchanged,
+    get_archive_path,
+    load_archive_index,
+    verify_archive,
+    write_archive
+)
+from .catalog import TIME_FORMAT, BackupCatalog
+from .changes import ChangeJournal, apply_changes
+from .checksum_cache import ChecksumCache
+from .chunkstore import (
+    ChunkStore,
+    get_recipe_path,
+    list_recipe_files,
+    load_recipe,
+    save_recipe,
+    store_tree,
+    verify_recipe
+)
+from .diff import estimate_delta, index_signatures, manifest_signatures
+from .file_index import update_file_index, write_file_index
+from .hasher import hash_files
+from .journal import FAILED, SCANNED, STATE_LABELS, TRANSFERRED, VERIFIED, RunJournal
+from .local_copy import sync_tree
+from .metrics import RunMetrics
+from .manifest import (
+    VERIFY_STAMP,
+    get_manifest_path,
+    load_manifest,
+    save_manifest,
+    build_manifest,
+    verify_manifest
+)
+from .pack import (
+    get_pack_dir,
+    link_packs,
+    load_pack_index,
+    needs_compaction,
+    remove_packs,
+    save_pack_index,
+    verify_packs,
+    write_packs
+)
+from .parallel import JobRunner, run_process
+from .progress import ProgressReporter, parse_rsync_progress
+from .scanner import FileIndex, scan_tree, stat_paths
+from .snapshot import (
+    get_snapshot_path,
+    get_previous_snapshot,
+    prune_snapshots,
+    snapshot_date,
+    supports_hardlinks
+)
+from .sqlite_capture import capture_databases, get_staging_dir, rsync_filters
+from .throttle import IOScheduler, apply_priority
 from .utils import (
-    get_dir_size_gb,
+    get_physical_device,
     get_disk_free_gb,
+    is_backup_disk_missing,
     verify_path_exists,
-    calculate_checksum,
     format_duration,
     print_info,
+    print_warning,
     print_error
 )
 
 class BackupManager:
     def __init__(self):
         """初始化备份管理器"""
-        self.backup_dir = BACKUP_DIR
-        self.history_file = os.path.join(self.backup_dir, "backup_history.json")
+        self.previous_snapshot: Optional[str] = None
+        self.link_dest: Optional[str] = None
+        if BACKUP_MODE == "snapshot":
+            # 快照模式：每天一个 backup_YYYY-MM-DD 目录，历史记录和缓存放在备份根目录下共享
+            self.state_dir = BACKUP_ROOT
+            self._use_snapshot(get_snapshot_path(date.today(), BACKUP_ROOT))
+        else:
+            self.state_dir = BACKUP_DIR
+            self.backup_dir = BACKUP_DIR
+        # 备份记录首次打开时导入旧的JSON历史记录
+        self.catalog = BackupCatalog(
+            os.path.join(self.state_dir, CATALOG_FILE),
+            legacy_history=os.path.join(self.state_dir, "backup_history.json")
+        )
+        self.checksum_cache = ChecksumCache(os.path.join(self.state_dir, CHECKSUM_CACHE_FILE))
+        # 未完成备份的进度，供 --resume 继续；继续时为中断前各源目录的状态
+        self.journal = RunJournal(RUN_JOURNAL_FILE)
+        self.resume_states: Dict[str, str] = {}
+        # 监视进程记录的变更日志；增量扫描的源目录只传输和验证变化的路径
+        self.changes = ChangeJournal(WATCH_JOURNAL_FILE)
+        self.change_cursor: Optional[Tuple[int, float]] = None
+        self.changed_paths: Dict[str, Set[str]] = {}
+        self.scanned_sources: Set[str] = set()
+        self.chunk_store: Optional[ChunkStore] = None
+        if "chunkstore" in BACKUP_ENGINES.values():
+            self.chunk_store = ChunkStore(CHUNKSTORE_DIR)
+        # 每次备份对每个源目录只扫描一次，索引供空间检查和验证共用
+        self.indexes: Dict[str, FileIndex] = {}
+        # 各源目录的增量估算，记入备份记录
+        self.deltas: Dict[str, Dict[str, int]] = {}
+        # 本次备份的阶段统计和进度汇总
+        self.metrics = RunMetrics("backup")
+        self.progress: Optional[ProgressReporter] = None
+        # 各源目录的传输和验证作为任务阶段调度，rsync等子进程由其事件循环管理
+        self.runner = JobRunner(BACKUP_WORKERS if PARALLEL_BACKUP else 1, MAX_JOBS_PER_DEVICE)
+        # 各阶段的带宽限制，备份期间按源目录所在磁盘的延迟自适应调整
+        self.io = IOScheduler()
+        # 各源目录中SQLite数据库的快照文件（相对路径 -> 暂存路径）
+        self.sqlite_overrides: Dict[str, Dict[str, str]] = {}
         
         if os.path.exists(self.backup_dir):
             print_info(f"使用现有备份目录: {self.backup_dir}")
@@ -41,53 +158,62 @@ class BackupManager:
         else:
             print_info(f"将创建新的备份目录: {self.backup_dir}")
 
-    def _load_backup_history(self) -> Dict:
-        """加载备份历史记录"""
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            except Exception as e:
-                print_error(f"读取备份历史记录失败: {e}")
-        return {"backups": []}
-
-    def _save_backup_history(self, history: Dict) -> None:
-        """保存备份历史记录"""
-        try:
-            # 确保备份目录存在
-            os.makedirs(self.backup_dir, exist_ok=True)
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            print_error(f"保存备份历史记录失败: {e}")
-
+    def _use_snapshot(self, backup_dir: str) -> None:
+        """
+        使用指定的快照目录，并找出其上一个快照作为硬链接基准
+        
+        Args:
+            backup_dir: 快照目录
+        """
+        self.backup_dir = backup_dir
+        self.link_dest = None
+        day = snapshot_date(backup_dir) or date.today()
+        self.previous_snapshot = get_previous_snapshot(day, BACKUP_ROOT)
+        if self.previous_snapshot:
+            print_info(f"上一个快照: {self.previous_snapshot}")
+            if supports_hardlinks(BACKUP_ROOT):
+                self.link_dest = self.previous_snapshot
+            else:
+                print_warning(f"备份盘不支持硬链接，快照将为完整副本: {BACKUP_ROOT}")
+    
     def _get_last_backup_time(self) -> Optional[str]:
         """获取最后一次备份时间"""
-        history = self._load_backup_history()
-        if history["backups"]:
-            return history["backups"][-1]["backup_time"]
-        return None
+        run = self.catalog.last_run()
+        return run["backup_time"] if run else None
 
-    def _update_backup_history(self, success: bool, total_size: float, duration: str) -> None:
-        """更新备份历史记录"""
-        history = self._load_backup_history()
-        backup_info = {
-            "backup_time": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            "success": success,
-            "total_size_gb": round(total_size, 2),
-            "duration": duration,
-            "source_paths": SOURCE_PATHS
-        }
-        history["backups"].append(backup_info)
-        self._save_backup_history(history)
+    def _get_last_successful_backup(self) -> Optional[datetime]:
+        """获取最后一次成功备份的时间"""
+        run = self.catalog.last_successful_run()
+        return datetime.strptime(run["backup_time"], TIME_FORMAT) if run else None
+
+    def _update_backup_history(self, success: bool, duration: float,
+                               source_results: Dict[str, Dict], phases: Dict[str, float]) -> None:
+        """追加本次备份的记录"""
+        sources = {}
+        for name, result in source_results.items():
+            stats = dict(result)
+            index = self.indexes.get(name)
+            if index is not None:
+                stats["total_bytes"] = index.total_size
+                stats["file_count"] = len(index)
+            delta = self.deltas.get(name)
+            if delta is not None:
+                stats["bytes_transferred"] = delta["add_bytes"] + delta["replace_bytes"]
+                stats["files_transferred"] = delta["add_files"] + delta["replace_files"]
+            sources[name] = stats
+        self.catalog.record_run(datetime.now(), success, self.backup_dir, duration, sources, phases)
         
-    def _build_rsync_command(self, src: str, dst: str) -> List[str]:
+    def _build_rsync_command(self, src: str, dst: str, link_dest: Optional[str] = None,
+                             filters: Sequence[str] = (), delete: bool = True) -> List[str]:
         """
         构建rsync命令
         
         Args:
             src: 源路径
             dst: 目标路径
+            link_dest: 上一个快照中对应的目录，未变化的文件将硬链接到该目录
+            filters: 附加的过滤规则（--filter）
+            delete: 是否按配置删除目标端多余的文件
             
         Returns:
             List[str]: rsync命令及其参数列表
@@ -100,13 +226,21 @@ class BackupManager:
             cmd.append("-v")
         if RSYNC_OPTIONS["compress"]:
             cmd.append("-z")
-        if RSYNC_OPTIONS["delete"]:
+        if RSYNC_OPTIONS.get("sparse"):
+            cmd.append("--sparse")
+        if delete and RSYNC_OPTIONS["delete"]:
             cmd.append("--delete")
         if RSYNC_OPTIONS["progress"]:
             cmd.append("--info=progress2")
+        cmd.extend(self.io.rsync_args("transfer"))
+            
+        if link_dest:
+            cmd.append(f"--link-dest={os.path.abspath(link_dest)}")
             
         for item in RSYNC_OPTIONS.get("exclude", []):
             cmd.extend(["--exclude", item])
+        for rule in filters:
+            cmd.append(f"--filter={rule}")
             
         # 确保源路径以/结尾，这样rsync会复制目录内容而不是目录本身
         src = str(src).rstrip("/") + "/"
@@ -114,12 +248,127 @@ class BackupManager:
         
         return cmd
     
-    def _verify_backup(self, src_path: str, dst_path: str) -> bool:
+    def _run_rsync(self, name: str, cmd: List[str], files_from: Optional[str] = None) -> int:
+        """
+        运行rsync，启用进度输出时把 --info=progress2 的进度交给进度汇总
+        
+        rsync由任务调度的事件循环启动并逐行读取输出；启用进度输出时，连续 PROCESS_IDLE_TIMEOUT 秒
+        没有输出视为挂起并终止。自适应限速降低传输速度时，按进度输出中新传输的字节数暂停rsync；
+        未启用进度输出时只有 --bwlimit 的固定上限。
+        
+        Args:
+            name: 源名称
+            cmd: rsync命令
+            files_from: 通过标准输入传给 --files-from=- 的文件列表
+            
+        Returns:
+            int: rsync报告的传输字节数，未启用进度输出时为0
+            
+        Raises:
+            subprocess.CalledProcessError: rsync返回非零错误码
+            subprocess.TimeoutExpired: rsync长时间没有输出，已被终止
+            JobCancelled: 任务超时或被取消，rsync已被终止
+        """
+        if not RSYNC_OPTIONS["progress"] or self.progress is None:
+            run_process(cmd, input=files_from, on_line=print_info, on_stderr=print_warning)
+            return 0
+        progress = self.progress
+        base = progress.done_bytes(name)
+        transferred = [0]
+        
+        def on_line(line: str) -> Optional[int]:
+            done = parse_rsync_progress(line)
+            if done is None:
+                return None
+            delta = done - transferred[0]
+            transferred[0] = done
+            progress.update(name, base + done)
+            return delta
+        
+        run_process(
+            cmd,
+            input=files_from,
+            on_line=on_line,
+            on_stderr=print_warning,
+            throttle=self.io.throttle("transfer"),
+            idle_timeout=PROCESS_IDLE_TIMEOUT
+        )
+        return transferred[0]
+    
+    def _estimate_transfer(self, name: str) -> Tuple[int, int]:
+        """
+        本次需要写入的字节数和文件数：有增量估算时取新增和替换部分，否则为整个源目录
+        
+        Args:
+            name: 源名称
+            
+        Returns:
+            Tuple[int, int]: (字节数, 文件数)
+        """
+        delta = self.deltas.get(name)
+        if delta is not None:
+            return delta["add_bytes"] + delta["replace_bytes"], delta["add_files"] + delta["replace_files"]
+        index = self.indexes[name]
+        return index.total_size, len(index)
+    
+    def _settle_index(
+        self,
+        src_index: FileIndex,
+        dst_path: str,
+        rel_paths: Optional[Sequence[str]] = None
+    ) -> Tuple[FileIndex, Dict[str, Optional[os.stat_result]]]:
+        """
+        传输后重新检查源文件，找出扫描之后被修改或删除的文件
+        
+        rsync和内置复制引擎在扫描之后才读取源文件，期间被修改的文件无法确定备份的是哪个版本。
+        目标文件的大小和修改时间与源文件当前的一致时（两种引擎都保留修改时间）按当前状态验证，
+        否则说明复制之后源文件又被修改或删除，本次不验证，下次备份时重新传输。
+        
+        Args:
+            src_index: 扫描得到的源目录索引
+            dst_path: 目标路径
+            rel_paths: 需要重新检查的相对路径，None表示全部文件
+            
+        Returns:
+            Tuple[FileIndex, Dict[str, Optional[os.stat_result]]]: (按当前状态更新、
+            不含无法确认的文件的源目录索引, 无法确认的文件在目标中的lstat结果，目标中没有时为None)
+        """
+        if rel_paths is None:
+            rel_paths = list(src_index.files)
+        # 数据库快照在扫描时生成，传输期间不会变化
+        paths = [rel_path for rel_path in rel_paths
+                 if rel_path in src_index.files and rel_path not in src_index.overrides]
+        current = stat_paths(src_index.root, paths)
+        changed = [
+            rel_path for rel_path in paths
+            if rel_path not in current.files
+            or current.files[rel_path].st_size != src_index.files[rel_path].st_size
+            or current.files[rel_path].st_mtime_ns != src_index.files[rel_path].st_mtime_ns
+        ]
+        settled = FileIndex(src_index.root)
+        settled.files = dict(src_index.files)
+        settled.dirs = src_index.dirs
+        settled.symlinks = src_index.symlinks
+        settled.overrides = src_index.overrides
+        unsettled: Dict[str, Optional[os.stat_result]] = {}
+        copies = stat_paths(dst_path, changed)
+        for rel_path in changed:
+            new, copy = current.files.get(rel_path), copies.files.get(rel_path)
+            if new is not None and copy is not None and \
+                    (copy.st_size, copy.st_mtime_ns) == (new.st_size, new.st_mtime_ns):
+                settled.files[rel_path] = new
+            else:
+                del settled.files[rel_path]
+                unsettled[rel_path] = copy
+        return settled, unsettled
+    
+    def _verify_backup(self, name: str, src_index: FileIndex, dst_path: str) -> bool:
         """
         验证备份的完整性
         
         Args:
-            src_path: 源路径
+            name: 源名称
+            src_index: 源目录的文件索引
             dst_path: 目标路径
             
         Returns:
@@ -127,67 +376,706 @@ class BackupManager:
         """
         if not VERIFY_CHECKSUM:
             return True
+        
+        if VERIFY_MODE == "manifest":
+            # 增量扫描时只有变化的路径会重新计算校验和，其余文件沿用上次清单中的条目
+            src_index, unsettled = self._settle_index(src_index, dst_path, self.changed_paths.get(name))
+            if unsettled:
+                print_warning(f"{name}: {len(unsettled)} 个文件在备份期间被修改或删除，本次不验证，下次备份时重新传输")
+            return self._verify_with_manifest(name, src_index, dst_path, unsettled)
             
-        src = Path(src_path)
         dst = Path(dst_path)
         
-        # 获取所有文件列表
-        src_files = [f for f in src.rglob("*") if f.is_file()]
+        # 文件列表直接取自扫描索引
+        rel_paths = list(src_index.files)
         
         # 如果文件太多，随机抽样验证
-        if len(src_files) > VERIFY_SAMPLE_SIZE:
-            src_files = random.sample(src_files, VERIFY_SAMPLE_SIZE)
+        if len(rel_paths) > VERIFY_SAMPLE_SIZE:
+            rel_paths = random.sample(rel_paths, VERIFY_SAMPLE_SIZE)
+        src_index, unsettled = self._settle_index(src_index, dst_path, rel_paths)
         
-        for src_file in src_files:
-            # 计算目标文件的相对路径
-            rel_path = src_file.relative_to(src)
+        pairs = {}
+        for rel_path in rel_paths:
+            if rel_path in unsettled:
+                continue
+            src_file = Path(src_index.abspath(rel_path))
             dst_file = dst / rel_path
             
             if not dst_file.exists():
                 print_error(f"目标文件不存在: {dst_file}")
                 return False
-            
-            src_checksum = calculate_checksum(src_file)
-            dst_checksum = calculate_checksum(dst_file)
-            
-            if src_checksum != dst_checksum:
+            pairs[rel_path] = (src_file, dst_file)
+        
+        # 源文件和目标文件一起交给哈希线程池并行计算
+        # 借助校验和缓存，未变化的文件不再重新读取
+        checksums = dict(hash_files(
+            [path for pair in pairs.values() for path in pair],
+            cache=self.checksum_cache,
+            throttle=self.io.throttle("verify")
+        ))
+        
+        for rel_path, (src_file, dst_file) in pairs.items():
+            src_checksum = checksums.get(src_file)
+            if src_checksum is None or src_checksum != checksums.get(dst_file):
                 print_error(f"文件校验和不匹配: {rel_path}")
                 return False
         
         return True
     
-    def _check_space_requirements(self) -> Tuple[bool, float, float]:
+    def _load_previous_manifest(self, name: str) -> Optional[Dict]:
+        """
+        加载目标目录上一次的清单，当前快照中没有时使用上一个快照的清单
+        
+        Args:
+            name: 备份中的目录名（源路径的basename）
+            
+        Returns:
+            Optional[Dict]: 清单内容
+        """
+        manifest = load_manifest(get_manifest_path(self.backup_dir, name))
+        if manifest is None and self.previous_snapshot:
+            manifest = load_manifest(get_manifest_path(self.previous_snapshot, name))
+        return manifest
+    
+    def _verify_with_manifest(self, name: str, src_index: FileIndex, dst_path: str,
+                              unsettled: Optional[Dict[str, Optional[os.stat_result]]] = None) -> bool:
+        """
+        生成源目录清单并按清单验证整个目标目录
+        
+        运行日志中记录了中断前已算出校验和或已验证通过的文件，这些文件不再重新计算。
+        备份期间被修改的文件按目标中的副本记入清单，不带校验和，也不验证。
+        
+        Args:
+            name: 源名称
+            src_index: 源目录的文件索引（不含 unsettled 中的文件）
+            dst_path: 目标路径
+            unsettled: 无法确认备份版本的文件在目标中的lstat结果，见 _settle_index
+            
+        Returns:
+            bool: 验证是否通过
+        """
+        unsettled = unsettled or {}
+        excludes = RSYNC_OPTIONS.get("exclude", [])
+        manifest_path = get_manifest_path(self.backup_dir, os.path.basename(dst_path))
+        previous = self._load_previous_manifest(os.path.basename(dst_path))
+        checkpoint = self.journal.entries(name)
+        if checkpoint:
+            entries = {}
+            if previous is not None and previous.get("algorithm") == CHECKSUM_ALGORITHM:
+                entries.update(previous["entries"])
+            entries.update(checkpoint)
+            previous = {"algorithm": CHECKSUM_ALGORITHM, "entries": entries}
+        
+        def record(rel_path: str, entry: List) -> None:
+            self.journal.record_entry(name, rel_path, entry)
+        
+        throttle = self.io.throttle("verify")
+        manifest = build_manifest(src_index, previous, self.checksum_cache, checkpoint=record, throttle=throttle)
+        if manifest is None:
+            print_error(f"生成清单失败: {src_index.root}")
+            return False
+        entries = manifest["entries"]
+        
+        changed = self.changed_paths.get(name)
+        if changed is None:
+            dst_index = scan_tree(dst_path, excludes)
+            paths = set(entries)
+        else:
+            # 增量扫描时只检查变化的路径和尚未验证通过的文件，其余文件上次已验证且之后未被改动
+            paths = set(changed) | {rel_path for rel_path, entry in entries.items() if entry[VERIFY_STAMP] is None}
+            dst_index = stat_paths(dst_path, paths)
+        subset = {
+            "algorithm": manifest["algorithm"],
+            "entries": {rel_path: entries[rel_path] for rel_path in paths if rel_path in entries}
+        }
+        report = verify_manifest(
+            subset, dst_index, self.checksum_cache, checkpoint=record,
+            drop_cache=VERIFY_DROP_CACHE, throttle=throttle
+        )
+        # 校验和为空的条目下次生成清单时重新计算
+        for rel_path, copy in unsettled.items():
+            if copy is not None:
+                entries[rel_path] = [copy.st_size, copy.st_mtime_ns, stat.S_IMODE(copy.st_mode), None, None]
+        save_manifest(manifest, manifest_path)
+        
+        print_info(
+            f"清单验证 {dst_path}: 共 {len(entries)} 个文件，"
+            f"重新计算 {len(report['hashed'])} 个，跳过未变化 {len(report['skipped'])} 个"
+        )
+        for rel_path in report["extra"]:
+            if rel_path not in unsettled:
+                print_warning(f"目标中存在清单外的文件: {rel_path}")
+        for rel_path in report["missing"]:
+            print_error(f"目标文件不存在: {rel_path}")
+        for rel_path in report["mismatched"]:
+            print_error(f"文件校验和不匹配: {rel_path}")
+        
+        return not report["missing"] and not report["mismatched"]
+    
+    def _scan_sources(self) -> None:
+        """
+        扫描所有源目录，生成本次备份共用的文件索引，并写入运行日志
+        
+        继续中断的备份时，中断前已完成传输的源目录沿用日志中的索引（验证前重新检查其中的文件，
+        见 _settle_index）；尚未完成传输的源目录重新扫描并从头传输，日志中记录的校验和
+        只在文件的大小和修改时间仍然一致时沿用。
+        """
+        excludes = RSYNC_OPTIONS.get("exclude", [])
+        self.indexes = {}
+        self.changed_paths = {}
+        self.scanned_sources = set()
+        self.change_cursor = self.changes.checkpoint() if WATCH_INCREMENTAL else None
+        for name, src_path in SOURCE_PATHS.items():
+            # 中断后源目录可能已被修改，未完成传输的源目录不沿用可能已过时的扫描结果
+            if self.resume_states.get(name) in (TRANSFERRED, VERIFIED):
+                index = self.journal.load_index(name)
+                # 数据库快照在暂存目录中跨次保留，丢失时重新扫描和快照
+                if index is not None and all(os.path.exists(path) for path in index.overrides.values()):
+                    print_info(f"{name}: 沿用中断前的扫描结果，{len(index)} 个文件")
+                    self.indexes[name] = index
+                    if index.overrides:
+                        self.sqlite_overrides[name] = dict(index.overrides)
+                    continue
+            self.resume_states.pop(name, None)
+            if not os.path.exists(src_path):
+                continue
+            self.scanned_sources.add(name)
+            # 增量扫描的索引由变更日志的基线得到，中断后重新按变更日志扫描，不写入运行日志
+            if name not in SQLITE_CAPTURE_SOURCES and self._scan_changes(name, src_path):
+                self.journal.set_state(name, SCANNED)
+                continue
+            index = self.indexes[name] = scan_tree(src_path, excludes)
+            # 正在使用的数据库改为备份一致性快照
+            if name in SQLITE_CAPTURE_SOURCES:
+                self.sqlite_overrides[name] = capture_databases(os.path.basename(src_path), index)
+            self.journal.save_index(name, index)
+    
+    def _scan_changes(self, name: str, src_path: str) -> bool:
+        """
+        按变更日志增量扫描源目录：在上次备份的基线索引上只重新检查变化的路径
+        
+        需要监视进程从上次基线扫描之前起一直在跟踪，且本次写入与上次相同的备份目录。
+        
+        Args:
+            name: 源名称
+            src_path: 源路径
+            
+        Returns:
+            bool: 是否完成增量扫描（False时需要完整扫描）
+        """
+        if self.change_cursor is None:
+            return False
+        dst_name = os.path.basename(src_path)
+        if VERIFY_CHECKSUM and VERIFY_MODE == "manifest" and \
+                not os.path.exists(get_manifest_path(self.backup_dir, dst_name)):
+            return False
+        loaded = self.changes.load_changes(name, src_path, self.backup_dir)
+        if loaded is None:
+            return False
+        index, dirty = loaded
+        changed = apply_changes(index, dirty, RSYNC_OPTIONS.get("exclude", []))
+        self.indexes[name] = index
+        self.changed_paths[name] = changed
+        print_info(f"{name}: 按变更日志增量扫描，{len(changed)} 个路径有变化，共 {len(index)} 个文件")
+        return True
+    
+    def _estimate_delta(self, name: str) -> Dict[str, int]:
+        """
+        估算单个源目录本次需要写入目标的数据量
+        
+        目标状态优先取自上次备份的清单（无需遍历U盘），没有清单时扫描目标目录。
+        新建快照时，与上一个快照相比变化的文件都会完整写入新快照；
+        备份盘不支持硬链接时新快照是整个目录树的完整副本。
+        
+        Args:
+            name: 源名称
+            
+        Returns:
+            Dict[str, int]: 增量估算结果，见 estimate_delta
+        """
+        dst_path = os.path.join(self.backup_dir, os.path.basename(SOURCE_PATHS[name]))
+        manifest = self._load_previous_manifest(os.path.basename(dst_path))
+        if manifest is not None:
+            target = manifest_signatures(manifest)
+        elif os.path.isdir(dst_path):
+            target = index_signatures(scan_tree(dst_path, RSYNC_OPTIONS.get("exclude", [])))
+        else:
+            target = {}
+        delta = estimate_delta(index_signatures(self.indexes[name]), target)
+        engine = BACKUP_ENGINES.get(name, "rsync")
+        if engine == "archive":
+            # 归档每次整体重写，新归档写完前旧归档仍然保留；按未压缩大小估算上限
+            if delta["add_files"] or delta["replace_files"] or delta["delete_files"]:
+                delta["required_bytes"] = self.indexes[name].total_size
+            else:
+                delta["required_bytes"] = 0
+        elif engine == "pack":
+            # 没有可以沿用的包索引或需要重新打包时所有文件写入新的包（旧包在写完后才删除），
+            # 否则只追加新文件和变化的文件
+            previous = self._load_previous_pack_index(os.path.basename(dst_path))[0]
+            if previous is None or needs_compaction(self.indexes[name], previous):
+                delta["required_bytes"] = self.indexes[name].total_size
+            else:
+                delta["required_bytes"] = delta["add_bytes"] + delta["replace_bytes"]
+        elif self.previous_snapshot and not self.link_dest and not os.path.isdir(dst_path):
+            # 备份盘不支持硬链接，新快照需要完整复制整个目录树
+            delta["required_bytes"] = self.indexes[name].total_size
+        # 块存储和新建的硬链接快照不会原地替换文件，变化的文件需要完整写入
+        elif engine == "chunkstore" or (self.link_dest and not os.path.isdir(dst_path)):
+            delta["required_bytes"] = delta["add_bytes"] + delta["replace_bytes"]
+        return delta
+    
+    def _check_space_requirements(self, names: Sequence[str]) -> Tuple[bool, float, float]:
         """
         检查空间要求
         
+        增量模式下按实际需要写入的数据量判断，完整模式下按源目录总大小判断。
+        
+        Args:
+            names: 本次需要备份的源名称（继续中断的备份时不含已验证的源目录）
+            
         Returns:
             Tuple[bool, float, float]: (是否满足要求, 需要的空间, 可用空间)
         """
-        total_size = sum(get_dir_size_gb(path) for path in SOURCE_PATHS.values())
-        available_space = get_disk_free_gb(self.backup_dir)
-        
+        gb = 1024 ** 3
+        names = [name for name in names if name in self.indexes]
+        total_size = sum(self.indexes[name].total_size for name in names) / gb
+        # 备份目录尚不存在时按上级目录所在磁盘计算，向上查找不超出备份根目录
+        space_root = BACKUP_ROOT if Path(BACKUP_ROOT) in Path(self.backup_dir).parents else os.path.dirname(self.backup_dir)
+        available_space = get_disk_free_gb(self.backup_dir, space_root)
         print_info(f"需要备份的总空间: {total_size:.2f} GB")
+        
+        required_size = total_size
+        if SPACE_CHECK_MODE == "delta":
+            required_size = 0.0
+            for name in names:
+                delta = self.deltas[name] = self._estimate_delta(name)
+                print_info(
+                    f"{name}: 新增 {delta['add_files']} 个文件 {delta['add_bytes'] / gb:.2f} GB, "
+                    f"替换 {delta['replace_files']} 个文件 {delta['replace_bytes'] / gb:.2f} GB, "
+                    f"删除 {delta['delete_files']} 个文件 {delta['delete_bytes'] / gb:.2f} GB"
+                )
+                required_size += delta["required_bytes"] / gb
+            print_info(f"本次预计需要写入: {required_size:.2f} GB")
+        
         print_info(f"可用空间: {available_space:.2f} GB")
         
-        return (available_space >= total_size + MIN_FREE_SPACE_GB,
-                total_size,
+        return (available_space >= required_size + MIN_FREE_SPACE_GB,
+                required_size,
                 available_space)
     
-    def perform_backup(self) -> bool:
+    def _backup_source(self, name: str, src_path: str) -> bool:
+        """
+        备份单个源目录（rsync和内置复制引擎只传输，验证由 _verify_source 完成）
+        
+        Args:
+            name: 源名称
+            src_path: 源路径
+            
+        Returns:
+            bool: 备份是否成功
+        """
+        if not os.path.exists(src_path):
+            print_error(f"源路径不存在: {src_path}")
+            return False
+        
+        engine = BACKUP_ENGINES.get(name, "rsync")
+        if engine == "chunkstore":
+            return self._backup_to_chunkstore(name, src_path)
+        if engine == "archive":
+            return self._backup_to_archive(name, src_path)
+        if engine == "pack":
+            return self._backup_to_pack(name, src_path)
+        if engine not in ("rsync", "native"):
+            print_error(f"未知的备份引擎 {name}: {engine}")
+            return False
+            
+        dst_path = os.path.join(self.backup_dir, os.path.basename(src_path))
+        if self.resume_states.get(name) == TRANSFERRED:
+            print_info(f"{name}: 中断前已完成传输，直接验证 {dst_path}")
+        else:
+            print_info(f"备份 {name}: {src_path} -> {dst_path}")
+            if not self._transfer_source(name, src_path, dst_path, engine):
+                return False
+            self.journal.set_state(name, TRANSFERRED)
+        return True
+    
+    def _verify_source(self, name: str, src_path: str) -> bool:
+        """
+        验证rsync或内置复制引擎的备份（其他引擎在备份时已完成验证）
+        
+        作为任务的第二个阶段执行，可与下一个源目录的传输同时进行。
+        
+        Args:
+            name: 源名称
+            src_path: 源路径
+            
+        Returns:
+            bool: 验证是否通过
+        """
+        if BACKUP_ENGINES.get(name, "rsync") not in ("rsync", "native"):
+            return True
+        dst_path = os.path.join(self.backup_dir, os.path.basename(src_path))
+        with self.metrics.phase("verify", name) as counters:
+            counters["bytes"], counters["files"] = self.indexes[name].total_size, len(self.indexes[name])
+            if not self._verify_backup(name, self.indexes[name], dst_path):
+                print_error(f"备份验证失败: {name}")
+                return False
+        
+        return True
+    
+    def _transfer_source(self, name: str, src_path: str, dst_path: str, engine: str) -> bool:
+        """
+        用rsync或内置复制引擎把源目录同步到备份目录
+        
+        Args:
+            name: 源名称
+            src_path: 源路径
+            dst_path: 备份中的目标目录
+            engine: 复制引擎，"rsync" 或 "native"
+            
+        Returns:
+            bool: 传输是否成功
+        """
+        link_dest = None
+        if self.link_dest:
+            link_dest = os.path.join(self.link_dest, os.path.basename(src_path))
+        
+        with self.metrics.phase("transfer", name) as counters:
+            counters["bytes"], counters["files"] = self._estimate_transfer(name)
+            if engine == "native":
+                # 本地到本地直接在进程内复制，不经过rsync的收发管道
+                stats = sync_tree(
+                    self.indexes[name],
+                    dst_path,
+                    RSYNC_OPTIONS.get("exclude", []),
+                    delete=RSYNC_OPTIONS["delete"],
+                    link_dest=link_dest,
+                    progress=self.progress.callback(name) if self.progress else None,
+                    # 复制时算出的源文件校验和存入缓存，验证时生成清单不再读取源文件
+                    cache=self.checksum_cache if HASH_WHILE_COPY else None,
+                    throttle=self.io.throttle("transfer")
+                )
+                print_info(
+                    f"{name}: 复制 {stats['copied_files']} 个文件 "
+                    f"({stats['copied_bytes'] / (1024 ** 2):.1f} MB)，硬链接 {stats['linked_files']} 个，"
+                    f"未变化 {stats['skipped_files']} 个，删除 {stats['deleted']} 个"
+                )
+                counters["bytes"], counters["files"] = stats["copied_bytes"], stats["copied_files"]
+                if stats["errors"]:
+                    print_error(f"备份失败 {name}: {stats['errors']} 个错误")
+                    return False
+            else:
+                overrides = self.sqlite_overrides.get(name, {})
+                changed = self.changed_paths.get(name)
+                try:
+                    if changed is not None:
+                        # 增量扫描时只传输变化的路径，源端已不存在的路径在目标端删除
+                        transferred = 0
+                        if changed:
+                            cmd = self._build_rsync_command(src_path, dst_path, link_dest, delete=False)
+                            cmd[-2:-2] = ["--from0", "--files-from=-", "--delete-missing-args", "--force"]
+                            transferred = self._run_rsync(name, cmd, "\0".join(sorted(changed)) + "\0")
+                    else:
+                        cmd = self._build_rsync_command(src_path, dst_path, link_dest, rsync_filters(overrides))
+                        transferred = self._run_rsync(name, cmd)
+                    if overrides:
+                        # 第二遍只传输数据库快照，覆盖第一遍中被排除的数据库文件
+                        staging_dir = get_staging_dir(os.path.basename(src_path))
+                        cmd = self._build_rsync_command(staging_dir, dst_path, link_dest, delete=False)
+                        cmd.insert(-2, "--files-from=-")
+                        transferred += self._run_rsync(name, cmd, "\n".join(sorted(overrides)) + "\n")
+                    if transferred:
+                        counters["bytes"] = transferred
+                except (subprocess.SubprocessError, OSError) as e:
+                    print_error(f"备份失败 {name}: {e}")
+                    return False
+        
+        return True
+    
+    def _load_previous_recipe(self, name: str) -> Optional[Dict]:
+        """加载上一次的配方，当前快照中没有时使用上一个快照的配方"""
+        recipe = load_recipe(get_recipe_path(self.backup_dir, name))
+        if recipe is None and self.previous_snapshot:
+            recipe = load_recipe(get_recipe_path(self.previous_snapshot, name))
+        return recipe
+    
+    def _load_previous_pack_index(self, name: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        加载本次打包可以沿用的包索引：当前备份目录中已有的，或可以硬链接的上一个快照中的
+        
+        Args:
+            name: 备份中的目录名
+            
+        Returns:
+            Tuple[Optional[Dict], Optional[str]]: (包索引, 其所在的包目录)，没有时为 (None, None)
+        """
+        pack_dir = get_pack_dir(self.backup_dir, name)
+        previous = load_pack_index(pack_dir)
+        if previous is None and self.link_dest:
+            pack_dir = get_pack_dir(self.link_dest, name)
+            previous = load_pack_index(pack_dir)
+        return (previous, pack_dir) if previous is not None else (None, None)
+    
+    def _backup_to_chunkstore(self, name: str, src_path: str) -> bool:
+        """
+        使用块存储引擎备份单个源目录，只写入新的块
+        
+        Args:
+            name: 源名称
+            src_path: 源路径
+            
+        Returns:
+            bool: 备份是否成功
+        """
+        dst_name = os.path.basename(src_path)
+        print_info(f"备份 {name}: {src_path} -> 块存储 {self.chunk_store.root}")
+        
+        index = self.indexes[name]
+        with self.metrics.phase("transfer", name) as counters:
+            counters["bytes"], counters["files"] = self._estimate_transfer(name)
+            recipe = store_tree(index, self.chunk_store, self._load_previous_recipe(dst_name))
+        if recipe is None:
+            print_error(f"备份失败 {name}")
+            return False
+        
+        success = True
+        if VERIFY_CHECKSUM:
+            with self.metrics.phase("verify", name) as counters:
+                counters["bytes"], counters["files"] = index.total_size, len(index)
+                manifest = build_manifest(
+                    index, self._load_previous_manifest(dst_name), self.checksum_cache,
+                    throttle=self.io.throttle("verify")
+                )
+                if manifest is None:
+                    print_error(f"生成清单失败: {src_path}")
+                    success = False
+                else:
+                    report = verify_recipe(recipe, manifest, self.chunk_store)
+                    save_manifest(manifest, get_manifest_path(self.backup_dir, dst_name))
+                    print_info(
+                        f"块存储验证 {name}: 共 {len(manifest['entries'])} 个文件，"
+                        f"重新计算 {len(report['hashed'])} 个，跳过未变化 {len(report['skipped'])} 个"
+                    )
+                    for rel_path in report["missing"]:
+                        print_error(f"配方中缺少文件: {rel_path}")
+                    for rel_path in report["mismatched"]:
+                        print_error(f"文件校验和不匹配: {rel_path}")
+                    success = not report["missing"] and not report["mismatched"]
+        
+        if not save_recipe(recipe, get_recipe_path(self.backup_dir, dst_name)):
+            return False
+        if not success:
+            print_error(f"备份验证失败: {name}")
+        return success
+    
+    def _backup_to_archive(self, name: str, src_path: str) -> bool:
+        """
+        使用归档引擎备份单个源目录，写入多线程压缩的zstd归档
+        
+        源目录与上一次归档相比没有变化时不重新压缩；快照模式下直接硬链接上一个快照中的归档。
+        
+        Args:
+            name: 源名称
+            src_path: 源路径
+            
+        Returns:
+            bool: 备份是否成功
+        """
+        dst_name = os.path.basename(src_path)
+        archive_path = get_archive_path(self.backup_dir, dst_name)
+        print_info(f"备份 {name}: {src_path} -> {archive_path}")
+        index = self.indexes[name]
+        
+        previous_path = archive_path
+        if not os.path.exists(previous_path) and self.previous_snapshot:
+            previous_path = get_archive_path(self.previous_snapshot, dst_name)
+        previous = load_archive_index(previous_path)
+        reused = previous is not None and archive_unchanged(previous, index)
+        with self.metrics.phase("transfer", name) as counters:
+            if reused:
+                print_info(f"{name}: 源目录未变化，沿用归档 {previous_path}")
+                if previous_path != archive_path:
+                    try:
+                        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+                        if self.link_dest:
+                            os.link(previous_path, archive_path)
+                        else:
+                            shutil.copy2(previous_path, archive_path)
+                    except OSError as e:
+                        print_error(f"复制归档失败 {previous_path}: {e}")
+                        return False
+            else:
+                counters["bytes"], counters["files"] = self._estimate_transfer(name)
+                if write_archive(index, archive_path) is None:
+                    print_error(f"备份失败 {name}")
+                    return False
+        
+        if not VERIFY_CHECKSUM:
+            return True
+        with self.metrics.phase("verify", name) as counters:
+            counters["bytes"], counters["files"] = index.total_size, len(index)
+            manifest = build_manifest(
+                index, self._load_previous_manifest(dst_name), self.checksum_cache,
+                throttle=self.io.throttle("verify")
+            )
+            if manifest is None:
+                print_error(f"生成清单失败: {src_path}")
+                return False
+            save_manifest(manifest, get_manifest_path(self.backup_dir, dst_name))
+            if reused:
+                return True
+            report = verify_archive(archive_path, manifest)
+            print_info(f"归档验证 {name}: 共 {len(manifest['entries'])} 个文件，解压校验 {len(report['hashed'])} 个")
+            for rel_path in report["missing"]:
+                print_error(f"归档中缺少文件: {rel_path}")
+            for rel_path in report["mismatched"]:
+                print_error(f"文件校验和不匹配: {rel_path}")
+            if report["missing"] or report["mismatched"]:
+                print_error(f"备份验证失败: {name}")
+                return False
+            return True
+    
+    def _backup_to_pack(self, name: str, src_path: str) -> bool:
+        """
+        使用打包引擎备份单个源目录，把小文件顺序追加到少量大的包文件中
+        
+        快照模式下先硬链接上一个快照的包文件，只追加新文件和变化的文件。
+        
+        Args:
+            name: 源名称
+            src_path: 源路径
+            
+        Returns:
+            bool: 备份是否成功
+        """
+        dst_name = os.path.basename(src_path)
+        pack_dir = get_pack_dir(self.backup_dir, dst_name)
+        print_info(f"备份 {name}: {src_path} -> {pack_dir}")
+        index = self.indexes[name]
+        
+        previous, previous_dir = self._load_previous_pack_index(dst_name)
+        if previous_dir is not None and previous_dir != pack_dir and not link_packs(previous_dir, pack_dir):
+            previous = None
+        
+        with self.metrics.phase("transfer", name) as counters:
+            counters["bytes"], counters["files"] = self._estimate_transfer(name)
+            pack_index = write_packs(index, pack_dir, previous, self.checksum_cache)
+        if pack_index is None:
+            print_error(f"备份失败 {name}")
+            return False
+        obsolete = pack_index.pop("obsolete")
+        
+        success = True
+        if VERIFY_CHECKSUM:
+            with self.metrics.phase("verify", name) as counters:
+                counters["bytes"], counters["files"] = index.total_size, len(index)
+                manifest = build_manifest(
+                    index, self._load_previous_manifest(dst_name), self.checksum_cache,
+                    throttle=self.io.throttle("verify")
+                )
+                if manifest is None:
+                    print_error(f"生成清单失败: {src_path}")
+                    success = False
+                else:
+                    # 只读回本次追加的文件，沿用的文件上次已经验证过
+                    old_files = previous["files"] if previous and not obsolete else {}
+                    appended = [
+                        rel_path for rel_path, entry in pack_index["files"].items()
+                        if old_files.get(rel_path) != entry
+                    ]
+                    report = verify_packs(pack_index, pack_dir, manifest, appended)
+                    save_manifest(manifest, get_manifest_path(self.backup_dir, dst_name))
+                    print_info(
+                        f"包验证 {name}: 共 {len(manifest['entries'])} 个文件，读回校验 {len(report['hashed'])} 个"
+                    )
+                    for rel_path in report["missing"]:
+                        print_error(f"包中缺少文件: {rel_path}")
+                    for rel_path in report["mismatched"]:
+                        print_error(f"文件校验和不匹配: {rel_path}")
+                    success = not report["missing"] and not report["mismatched"]
+        
+        if not save_pack_index(pack_index, pack_dir):
+            return False
+        remove_packs(pack_dir, obsolete)
+        if not success:
+            print_error(f"备份验证失败: {name}")
+        return success
+    
+    def _within_backup_interval(self) -> bool:
+        """判断距上次成功备份是否还未超过最小备份间隔"""
+        last_backup = self._get_last_successful_backup()
+        if last_backup is None:
+            return False
+        return datetime.now() - last_backup < timedelta(days=MIN_BACKUP_INTERVAL_DAYS)
+    
+    def _resume_run(self) -> bool:
+        """
+        读取运行日志中未完成的备份，准备从中断处继续
+        
+        Returns:
+            bool: 是否有可以继续的备份
+        """
+        run = self.journal.load()
+        if run is None:
+            print_warning("没有未完成的备份，执行完整备份")
+            return False
+        if run["algorithm"] != CHECKSUM_ALGORITHM:
+            print_warning(f"未完成的备份使用不同的校验和算法 {run['algorithm']}，执行完整备份")
+            return False
+        if run["backup_dir"] != self.backup_dir:
+            if BACKUP_MODE != "snapshot" or os.path.dirname(run["backup_dir"]) != BACKUP_ROOT:
+                print_warning(f"未完成的备份位于其他备份目录 {run['backup_dir']}，执行完整备份")
+                return False
+            # 快照模式下跨天继续时仍写入中断前的快照
+            self._use_snapshot(run["backup_dir"])
+        self.resume_states = dict(run["states"])
+        print_info(f"继续 {run['started']} 开始的备份: {self.backup_dir}")
+        for name, state in self.resume_states.items():
+            print_info(f"  {name}: {STATE_LABELS.get(state, state)}")
+        return True
+    
+    def perform_backup(self, force: bool = False, resume: bool = False) -> bool:
         """
         执行备份操作
         
+        Args:
+            force: 是否忽略最小备份间隔
+            resume: 是否从上次中断处继续（跳过已验证的源目录，沿用已保存的扫描结果）
+        
         Returns:
             bool: 备份是否成功
         """
+        # 备份盘未挂载时挂载点下的目录位于系统盘上，不能把备份写到那里
+        if is_backup_disk_missing(self.backup_dir):
+            print_error(f"备份盘未挂载: {USB_MOUNT}")
+            return False
+        resumed = resume and self._resume_run()
+        if not resumed and BACKUP_MODE == "snapshot" and not force and self._within_backup_interval():
+            print_info(f"距上次成功备份不足 {MIN_BACKUP_INTERVAL_DAYS} 天，跳过本次备份")
+            return True
+        
         start_time = time.time()
         print_info(f"开始备份 - {datetime.now()}")
+        # 在创建扫描和复制线程之前降低优先级，线程和rsync子进程都会继承
+        apply_priority()
+        self.metrics = RunMetrics("backup")
+        if not resumed:
+            self.resume_states = {}
+            self.journal.begin(self.backup_dir, list(SOURCE_PATHS))
         
-        # 检查空间要求
-        space_ok, total_size, available_space = self._check_space_requirements()
+        # 扫描源目录并检查空间要求（已验证的源目录不再需要空间）
+        with self.metrics.phase("scan") as counters:
+            self._scan_sources()
+            counters["bytes"] = sum(index.total_size for index in self.indexes.values())
+            counters["files"] = sum(len(index) for index in self.indexes.values())
+        done = [name for name in SOURCE_PATHS if self.resume_states.get(name) == VERIFIED]
+        pending = {name: src_path for name, src_path in SOURCE_PATHS.items() if name not in done}
+        with self.metrics.phase("space_check"):
+            space_ok, required_size, available_space = self._check_space_requirements(list(pending))
         if not space_ok:
             print_error(
-                f"空间不足。需要: {total_size + MIN_FREE_SPACE_GB:.2f} GB, "
+                f"空间不足。需要: {required_size + MIN_FREE_SPACE_GB:.2f} GB, "
                 f"可用: {available_space:.2f} GB"
             )
             return False
@@ -196,38 +1084,101 @@ class BackupManager:
         if not verify_path_exists(self.backup_dir, create=True):
             return False
         
-        # 执行备份
-        success = True
-        for name, src_path in SOURCE_PATHS.items():
-            if not os.path.exists(src_path):
-                print_error(f"源路径不存在: {src_path}")
-                success = False
-                continue
-                
-            dst_path = os.path.join(self.backup_dir, os.path.basename(src_path))
-            print_info(f"备份 {name}: {src_path} -> {dst_path}")
+        # 执行备份（并行模式下不同设备上的源目录同时进行；一个源目录验证时可开始下一个的传输）
+        job_paths = {
+            name: [src_path, self.backup_dir]
+            for name, src_path in pending.items()
+        }
+        # 内置复制引擎对未变化的文件也报告进度，按源目录总大小计；其他引擎按本次需要写入的数据量计
+        totals = {
+            name: (self.indexes[name].total_size if BACKUP_ENGINES.get(name) == "native"
+                   else self._estimate_transfer(name)[0])
+            for name in pending if name in self.indexes
+        }
+        # 监视源目录所在磁盘的I/O延迟，前台负载较重时降低备份速度
+        self.io = IOScheduler({get_physical_device(src_path) for src_path in pending.values()})
+        with self.metrics.phase("backup") as counters, ProgressReporter(totals, "备份进度") as progress, self.io:
+            self.progress = progress
             
-            try:
-                import subprocess
-                cmd = self._build_rsync_command(src_path, dst_path)
-                subprocess.run(cmd, check=True)
-                
-                # 验证备份
-                if not self._verify_backup(src_path, dst_path):
-                    print_error(f"备份验证失败: {name}")
-                    success = False
-                    
-            except subprocess.SubprocessError as e:
-                print_error(f"备份失败 {name}: {e}")
-                success = False
+            def transfer(name: str, src_path: str) -> bool:
+                progress.start(name)
+                try:
+                    ok = self._backup_source(name, src_path)
+                    if not ok:
+                        self.journal.set_state(name, FAILED)
+                    return ok
+                finally:
+                    progress.update(name, max(progress.done_bytes(name), totals.get(name, 0)))
+                    progress.finish(name)
+            
+            def verify(name: str, src_path: str) -> bool:
+                ok = self._verify_source(name, src_path)
+                self.journal.set_state(name, VERIFIED if ok else FAILED)
+                return ok
+            
+            jobs = {
+                name: [
+                    lambda name=name, src_path=src_path: transfer(name, src_path),
+                    lambda name=name, src_path=src_path: verify(name, src_path)
+                ]
+                for name, src_path in pending.items()
+            }
+            source_results = self.runner.run_jobs(jobs, job_paths)
+            for name in done:
+                print_info(f"{name}: 中断前已完成备份和验证，跳过")
+                source_results[name] = {"success": True, "duration": 0.0, "devices": [], "error": None}
+            counters["bytes"] = sum(self._estimate_transfer(name)[0] for name in totals)
+            counters["files"] = sum(self._estimate_transfer(name)[1] for name in totals)
+        self.progress = None
+        
+        with self.metrics.phase("file_index"):
+            for name, result in source_results.items():
+                status = "成功" if result["success"] else "失败"
+                print_info(f"{name}: {status}，耗时 {format_duration(result['duration'])}")
+                # 成功的源目录写入快照文件索引，恢复时按路径查找不必遍历备份盘
+                if not result["success"] or name not in self.indexes:
+                    continue
+                dst_name = os.path.basename(SOURCE_PATHS[name])
+                if name in self.changed_paths:
+                    update_file_index(self.backup_dir, dst_name, self.indexes[name], self.changed_paths[name])
+                else:
+                    write_file_index(self.backup_dir, dst_name, self.indexes[name])
+                # 本次扫描的源目录作为变更日志的新基线，已处理的变化不再保留
+                if self.change_cursor is not None and name in self.scanned_sources:
+                    self.changes.commit(
+                        name, self.backup_dir, self.indexes[name], self.change_cursor, self.changed_paths.get(name)
+                    )
+        success = all(result["success"] for result in source_results.values())
         
         end_time = time.time()
         duration = format_duration(end_time - start_time)
         
         if success:
             print_info(f"备份完成 - 耗时: {duration}")
+            with self.metrics.phase("cleanup"):
+                if BACKUP_MODE == "snapshot":
+                    prune_snapshots(MAX_BACKUPS, BACKUP_ROOT)
+                if self.chunk_store is not None:
+                    # 本次备份的配方必须在列表中，否则说明配方列表不完整，不做删除
+                    required = [
+                        get_recipe_path(self.backup_dir, os.path.basename(SOURCE_PATHS[name]))
+                        for name in source_results if BACKUP_ENGINES.get(name) == "chunkstore"
+                    ]
+                    self.chunk_store.collect_garbage(
+                        list_recipe_files(BACKUP_ROOT, [BACKUP_DIR, self.backup_dir]), required
+                    )
         
-        # 更新备份历史记录
-        self._update_backup_history(success, total_size, duration)
+        # 输出阶段统计，追加备份记录并保存本次运行的统计文件
+        self.metrics.finish(success)
+        self.metrics.report()
+        self.metrics.save()
+        self._update_backup_history(success, self.metrics.duration, source_results, self.metrics.phase_durations())
+        self.checksum_cache.save()
+        # 全部成功后不再需要运行日志；有失败时保留，可用 --resume 只重试未完成的源目录
+        if success:
+            self.journal.remove()
+        else:
+            self.journal.close()
+        self.changes.close()
         
         return success
@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Union
+
+from .utils import print_error, print_info
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    backup_time TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    backup_dir TEXT,
+    duration_seconds REAL,
+    total_bytes INTEGER,
+    file_count INTEGER,
+    bytes_transferred INTEGER,
+    files_transferred INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_success ON runs (success, id);
+CREATE TABLE IF NOT EXISTS source_runs (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    source TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    duration_seconds REAL,
+    total_bytes INTEGER,
+    file_count INTEGER,
+    bytes_transferred INTEGER,
+    files_transferred INTEGER,
+    growth_bytes INTEGER,
+    devices TEXT,
+    error TEXT,
+    PRIMARY KEY (run_id, source)
+);
+CREATE INDEX IF NOT EXISTS source_runs_source ON source_runs (source, run_id);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    phase TEXT NOT NULL,
+    duration_seconds REAL NOT NULL,
+    PRIMARY KEY (run_id, phase)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# 旧历史记录中的耗时格式，见 utils.format_duration
+_DURATION = re.compile(r"(\d+)小时\s*(\d+)分钟\s*([\d.]+)秒")
+
+def _parse_duration(text: Optional[str]) -> Optional[float]:
+    match = _DURATION.match(text or "")
+    if not match:
+        return None
+    return int(match.group(1)) * 3600 + int(match.group(2)) * 60 + float(match.group(3))
+
+class BackupCatalog:
+    """
+    备份记录：以SQLite记录每次备份及各源目录的统计
+
+    每次备份只追加记录；"最近一次成功的备份"和"各源目录的增长"等查询都通过索引直接定位，
+    不随历史记录增多而变慢。首次打开时导入旧的 backup_history.json。
+    """
+
+    def __init__(self, db_path: Union[str, Path], legacy_history: Optional[Union[str, Path]] = None):
+        """
+        初始化备份记录
+
+        Args:
+            db_path: 数据库文件路径
+            legacy_history: 旧的JSON历史记录文件，存在且未导入过时自动导入
+        """
+        self.db_path = str(db_path)
+        self.legacy_history = str(legacy_history) if legacy_history else None
+
+    def _connect(self, create: bool = False) -> Optional[sqlite3.Connection]:
+        """
+        打开数据库，必要时建表并导入旧历史记录
+
+        Args:
+            create: 数据库不存在时是否创建
+
+        Returns:
+            Optional[sqlite3.Connection]: 数据库连接，数据库不存在且无需创建时返回None
+        """
+        has_legacy = bool(self.legacy_history) and os.path.exists(self.legacy_history)
+        if not os.path.exists(self.db_path) and not create and not has_legacy:
+            return None
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.executescript(_SCHEMA)
+        if has_legacy:
+            key = f"imported:{os.path.basename(self.legacy_history)}"
+            if conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone() is None:
+                self._import_history(conn, self.legacy_history, key)
+        return conn
+
+    def _import_history(self, conn: sqlite3.Connection, history_file: str, key: str) -> None:
+        """把旧的JSON历史记录导入数据库（在一个事务中完成，失败时下次重试）"""
+        try:
+            with open(history_file, 'r', encoding='utf-8') as f:
+                backups = json.load(f).get("backups", [])
+        except Exception as e:
+            print_error(f"读取备份历史记录失败: {e}")
+            return
+        with conn:
+            for backup in backups:
+                total_size = backup.get("total_size_gb")
+                sources = {
+                    name: {
+                        "success": result.get("success", False),
+                        "duration": result.get("duration"),
+                        "devices": result.get("devices", []),
+                        "error": result.get("error")
+                    }
+                    for name, result in (backup.get("sources") or {}).items()
+                }
+                self._insert_run(
+                    conn,
+                    backup["backup_time"],
+                    bool(backup.get("success")),
+                    backup.get("backup_dir"),
+                    _parse_duration(backup.get("duration")),
+                    {"total_bytes": int(total_size * 1024 ** 3) if total_size is not None else None},
+                    sources,
+                    {}
+                )
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, datetime.now().strftime(TIME_FORMAT)))
+        print_info(f"已导入旧的备份历史记录: {len(backups)} 条")
+
+    def _insert_run(
+        self,
+        conn: sqlite3.Connection,
+        backup_time: str,
+        success: bool,
+        backup_dir: Optional[str],
+        duration: Optional[float],
+        totals: Dict[str, Optional[int]],
+        sources: Dict[str, Dict],
+        phases: Dict[str, float]
+    ) -> int:
+        cursor = conn.execute(
+            "INSERT INTO runs (backup_time, success, backup_dir, duration_seconds, total_bytes, "
+            "file_count, bytes_transferred, files_transferred) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                backup_time, int(success), backup_dir, duration, totals.get("total_bytes"),
+                totals.get("file_count"), totals.get("bytes_transferred"), totals.get("files_transferred")
+            )
+        )
+        run_id = cursor.lastrowid
+        for name, stats in sources.items():
+            growth = None
+            if stats.get("success") and stats.get("total_bytes") is not None:
+                previous = conn.execute(
+                    "SELECT total_bytes FROM source_runs WHERE source = ? AND success = 1 "
+                    "AND total_bytes IS NOT NULL ORDER BY run_id DESC LIMIT 1",
+                    (name,)
+                ).fetchone()
+                if previous is not None:
+                    growth = stats["total_bytes"] - previous["total_bytes"]
+            conn.execute(
+                "INSERT INTO source_runs (run_id, source, success, duration_seconds, total_bytes, file_count, "
+                "bytes_transferred, files_transferred, growth_bytes, devices, error) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    run_id, name, int(bool(stats.get("success"))), stats.get("duration"),
+                    stats.get("total_bytes"), stats.get("file_count"), stats.get("bytes_transferred"),
+                    stats.get("files_transferred"), growth, ",".join(stats.get("devices") or []),
+                    stats.get("error")
+                )
+            )
+        conn.executemany(
+            "INSERT INTO phases (run_id, phase, duration_seconds) VALUES (?, ?, ?)",
+            [(run_id, phase, seconds) for phase, seconds in phases.items()]
+        )
+        return run_id
+
+    def record_run(
+        self,
+        backup_time: datetime,
+        success: bool,
+        backup_dir: str,
+        duration: float,
+        sources: Dict[str, Dict],
+        phases: Optional[Dict[str, float]] = None
+    ) -> Optional[int]:
+        """
+        追加一次备份的记录
+
+        Args:
+            backup_time: 备份时间
+            success: 是否成功
+            backup_dir: 备份目录
+            duration: 总耗时（秒）
+            sources: 各源目录的统计，包含 success、duration、devices、error、total_bytes、
+                file_count、bytes_transferred、files_transferred（缺少的项记为空）
+            phases: 各阶段耗时（秒）
+
+        Returns:
+            Optional[int]: 记录编号，写入失败时返回None
+        """
+        totals: Dict[str, Optional[int]] = {}
+        for field in ("total_bytes", "file_count", "bytes_transferred", "files_transferred"):
+            values = [stats.get(field) for stats in sources.values()]
+            totals[field] = sum(values) if values and None not in values else None
+        try:
+            with closing(self._connect(create=True)) as conn:
+                with conn:
+                    return self._insert_run(
+                        conn, backup_time.strftime(TIME_FORMAT), success, backup_dir,
+                        duration, totals, sources, phases or {}
+                    )
+        except (sqlite3.Error, OSError) as e:
+            print_error(f"写入备份记录失败 {self.db_path}: {e}")
+            return None
+
+    def _query_one(self, sql: str, params: tuple = ()) -> Optional[Dict]:
+        try:
+            conn = self._connect()
+            if conn is None:
+                return None
+            with closing(conn):
+                row = conn.execute(sql, params).fetchone()
+        except sqlite3.Error as e:
+            print_error(f"读取备份记录失败 {self.db_path}: {e}")
+            return None
+        return dict(row) if row is not None else None
+
+    def last_run(self) -> Optional[Dict]:
+        """最近一次备份的记录"""
+        return self._query_one("SELECT * FROM runs ORDER BY id DESC LIMIT 1")
+
+    def last_successful_run(self) -> Optional[Dict]:
+        """最近一次成功备份的记录"""
+        return self._query_one("SELECT * FROM runs WHERE success = 1 ORDER BY id DESC LIMIT 1")
+
+    def successful_backup_dirs(self) -> Set[str]:
+        """
+        最近一次备份成功的备份目录
+
+        同一目录之后又有失败或中断的备份时，目录内容可能不完整，不包括在内。
+
+        Returns:
+            Set[str]: 备份目录的绝对路径
+        """
+        try:
+            conn = self._connect()
+            if conn is None:
+                return set()
+            with closing(conn):
+                rows = conn.execute(
+                    "SELECT backup_dir, success FROM runs "
+                    "WHERE id IN (SELECT MAX(id) FROM runs GROUP BY backup_dir)"
+                ).fetchall()
+        except sqlite3.Error as e:
+            print_error(f"读取备份记录失败 {self.db_path}: {e}")
+            return set()
+        return {os.path.abspath(row["backup_dir"]) for row in rows if row["success"] and row["backup_dir"]}
+
+    def source_growth(self, source: str, limit: int = 10) -> List[Dict]:
+        """
+        源目录最近几次成功备份的大小及相对上一次的增长
+
+        Args:
+            source: 源名称
+            limit: 返回的记录数
+
+        Returns:
+            List[Dict]: 从新到旧的 backup_time、total_bytes、growth_bytes、bytes_transferred
+        """
+        try:
+            conn = self._connect()
+            if conn is None:
+                return []
+            with closing(conn):
+                rows = conn.execute(
+                    "SELECT runs.backup_time, s.total_bytes, s.growth_bytes, s.bytes_transferred "
+                    "FROM source_runs AS s JOIN runs ON runs.id = s.run_id "
+                    "WHERE s.source = ? AND s.success = 1 ORDER BY s.run_id DESC LIMIT ?",
+                    (source, limit)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print_error(f"读取备份记录失败 {self.db_path}: {e}")
+            return []
+        return [dict(row) for row in rows]
+
+    def phase_durations(self, run_id: int) -> Dict[str, float]:
+        """某次备份各阶段的耗时（秒）"""
+        try:
+            conn = self._connect()
+            if conn is None:
+                return {}
+            with closing(conn):
+                rows = conn.execute(
+                    "SELECT phase, duration_seconds FROM phases WHERE run_id = ?", (run_id,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print_error(f"读取备份记录失败 {self.db_path}: {e}")
+            return {}
+        return {row["phase"]: row["duration_seconds"] for row in rows}
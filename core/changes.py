@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+import time
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Sequence, Set, Tuple, Union
+
+from config.settings import WATCH_FLUSH_SECONDS, WATCH_JOURNAL_FILE
+from .journal import decode_stat, encode_stat
+from .scanner import FileIndex, scan_tree
+from .utils import is_excluded, print_error, print_info
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    pid INTEGER,
+    started TEXT,
+    flush_seq INTEGER NOT NULL DEFAULT 0,
+    flushed_at REAL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    tracking_since REAL,
+    error TEXT,
+    synced_at REAL,
+    backup_dir TEXT
+);
+CREATE TABLE IF NOT EXISTS dirty (
+    source TEXT NOT NULL,
+    rel_path TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (source, rel_path)
+);
+CREATE TABLE IF NOT EXISTS baseline (
+    source TEXT NOT NULL,
+    rel_path TEXT NOT NULL,
+    type TEXT NOT NULL,
+    stat TEXT NOT NULL,
+    PRIMARY KEY (source, rel_path)
+);
+"""
+
+# 变化类型："p" 路径本身变化，"t" 整个子树需要重新扫描（新建、移入或删除的目录）；取较大者合并
+PATH, TREE = "p", "t"
+
+# 基线条目类型
+FILE, DIR, SYMLINK = "f", "d", "l"
+
+def _ancestors(rel_path: str) -> Iterable[str]:
+    """依次返回相对路径的各级上级目录（不含根目录和路径本身）"""
+    index = rel_path.find("/")
+    while index != -1:
+        yield rel_path[:index]
+        index = rel_path.find("/", index + 1)
+
+def apply_changes(index: FileIndex, dirty: Dict[str, str], excludes: Sequence[str] = ()) -> Set[str]:
+    """
+    把变化的路径应用到上次备份时的文件索引上，得到与完整扫描相同的索引
+
+    每个变化的路径重新lstat：不存在或类型改变的路径从索引中删除（目录连同其下的条目），
+    新出现的目录和标记为 TREE 的目录重新扫描整个子树。
+
+    Args:
+        index: 上次备份时的文件索引（原地修改）
+        dirty: 相对路径到变化类型（PATH 或 TREE）的映射
+        excludes: 排除模式（与rsync一致）
+
+    Returns:
+        Set[str]: 需要传输和验证的相对路径，包括已删除的路径和重新扫描得到的全部条目
+    """
+    tables = (index.files, index.dirs, index.symlinks)
+    changed: Set[str] = set()
+    removed: Set[str] = set()
+    rescans: Set[str] = set()
+    updates: Dict[str, os.stat_result] = {}
+    for rel_path in sorted(dirty):
+        if not rel_path or (excludes and is_excluded(rel_path, excludes)):
+            continue
+        if any(parent in rescans for parent in _ancestors(rel_path)):
+            continue
+        try:
+            st = os.lstat(os.path.join(index.root, rel_path))
+        except FileNotFoundError:
+            st = None
+        except OSError as e:
+            index.errors.append(f"{rel_path}: {e}")
+            continue
+        was_dir = rel_path in index.dirs
+        is_dir = st is not None and stat.S_ISDIR(st.st_mode)
+        if was_dir and (not is_dir or dirty[rel_path] == TREE):
+            removed.add(rel_path)
+        for table in tables:
+            table.pop(rel_path, None)
+        changed.add(rel_path)
+        if st is None:
+            continue
+        if is_dir and (dirty[rel_path] == TREE or not was_dir):
+            rescans.add(rel_path)
+        updates[rel_path] = st
+
+    # 删除已不存在或需要重新扫描的目录下原有的条目，这些路径在目标端也要删除
+    if removed:
+        for table in tables:
+            for rel_path in [p for p in table if any(a in removed for a in _ancestors(p))]:
+                del table[rel_path]
+                changed.add(rel_path)
+
+    for rel_path, st in updates.items():
+        if stat.S_ISREG(st.st_mode):
+            index.files[rel_path] = st
+        elif stat.S_ISDIR(st.st_mode):
+            index.dirs[rel_path] = st
+        elif stat.S_ISLNK(st.st_mode):
+            index.symlinks[rel_path] = st
+
+    for rel_dir in sorted(rescans):
+        # 排除规则按相对于源目录的完整路径判断，子树扫描时不传入
+        sub = scan_tree(os.path.join(index.root, rel_dir))
+        for table, sub_table in zip(tables, (sub.files, sub.dirs, sub.symlinks)):
+            for sub_path, st in sub_table.items():
+                rel_path = f"{rel_dir}/{sub_path}"
+                if excludes and is_excluded(rel_path, excludes):
+                    continue
+                table[rel_path] = st
+                changed.add(rel_path)
+        index.errors.extend(f"{rel_dir}/{error}" for error in sub.errors)
+    return changed
+
+class ChangeJournal:
+    """
+    变更日志：监视进程（--watch）记录源目录中变化的路径，供下一次备份只处理这些路径
+
+    监视进程每隔 WATCH_FLUSH_SECONDS 秒把收集到的变化路径批量写入，每批带递增的序号。
+    备份开始时取一个检查点（最近一批的序号），源目录备份成功后只删除序号不超过检查点的变化，
+    并把备份时的索引保存为基线；备份过程中发生的变化留到下一次备份。
+    只有监视进程在上次基线扫描之前就开始持续跟踪（期间没有事件丢失）时才能增量备份，
+    否则执行完整扫描。日志位于本地磁盘。
+    """
+
+    def __init__(self, journal_path: Union[str, Path] = WATCH_JOURNAL_FILE):
+        """
+        初始化变更日志
+
+        Args:
+            journal_path: 日志文件路径
+        """
+        self.journal_path = str(journal_path)
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开日志数据库（监视进程和备份进程同时访问，使用WAL模式）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.journal_path, timeout=30)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute("INSERT OR IGNORE INTO meta (id, flush_seq) VALUES (1, 0)")
+            self._conn.commit()
+        return self._conn
+
+    def close(self) -> None:
+        """关闭数据库"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # 监视进程使用
+
+    def start_watcher(self, sources: Dict[str, str]) -> None:
+        """
+        登记监视进程和要跟踪的源目录；在全部监视添加完成前各源目录处于未跟踪状态
+
+        Args:
+            sources: 源名称到源路径的映射
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE meta SET pid = ?, started = ? WHERE id = 1",
+                (os.getpid(), datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            )
+            for name, root in sources.items():
+                conn.execute(
+                    "INSERT INTO sources (name, root) VALUES (?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET root = excluded.root, tracking_since = NULL, error = NULL",
+                    (name, root)
+                )
+
+    def set_tracking(self, name: str, since: Optional[float], error: Optional[str] = None) -> None:
+        """
+        更新源目录的跟踪状态
+
+        Args:
+            name: 源名称
+            since: 开始持续跟踪的时间（time.time()），None表示未跟踪（事件可能丢失）
+            error: 无法跟踪的原因
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE sources SET tracking_since = ?, error = ? WHERE name = ?", (since, error, name))
+
+    def flush(self, dirty: Dict[Tuple[str, str], str], drained_at: float) -> None:
+        """
+        写入一批变化的路径
+
+        Args:
+            dirty: (源名称, 相对路径) 到变化类型的映射，可以为空
+            drained_at: 读取这批事件之前的时间，此前发生的事件都已包含在内
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE meta SET flush_seq = flush_seq + 1, flushed_at = ? WHERE id = 1", (drained_at,))
+            seq = conn.execute("SELECT flush_seq FROM meta WHERE id = 1").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO dirty (source, rel_path, kind, seq) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(source, rel_path) DO UPDATE SET kind = MAX(kind, excluded.kind), seq = excluded.seq",
+                [(name, rel_path, kind, seq) for (name, rel_path), kind in dirty.items()]
+            )
+
+    def stop_watcher(self) -> None:
+        """监视进程退出：此后的变化不再记录，各源目录需要重新完整扫描"""
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE meta SET pid = NULL WHERE id = 1")
+            conn.execute("UPDATE sources SET tracking_since = NULL")
+
+    # 备份进程使用
+
+    def checkpoint(self, timeout: float = WATCH_FLUSH_SECONDS * 3 + 2) -> Optional[Tuple[int, float]]:
+        """
+        等待监视进程写入当前时间之前的全部事件，返回检查点
+
+        Args:
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            Optional[Tuple[int, float]]: (批次序号, 检查点时间)，监视进程未运行时返回None
+        """
+        if not os.path.exists(self.journal_path):
+            return None
+        now = time.time()
+        deadline = now + timeout
+        try:
+            conn = self._connect()
+            while True:
+                pid, seq, flushed_at = conn.execute(
+                    "SELECT pid, flush_seq, flushed_at FROM meta WHERE id = 1"
+                ).fetchone()
+                if pid is None or not _process_alive(pid):
+                    return None
+                if flushed_at is not None and flushed_at >= now:
+                    return seq, now
+                if time.time() >= deadline:
+                    print_info("监视进程未及时写入变更日志，执行完整扫描")
+                    return None
+                time.sleep(0.1)
+        except sqlite3.Error as e:
+            print_error(f"读取变更日志失败 {self.journal_path}: {e}")
+            return None
+
+    def load_changes(
+        self,
+        name: str,
+        root: str,
+        backup_dir: str
+    ) -> Optional[Tuple[FileIndex, Dict[str, str]]]:
+        """
+        读取上次备份的基线索引和此后变化的路径
+
+        检查点之后才写入的变化也一并返回：重新lstat得到的总是当前状态，多应用一次没有影响。
+
+        Args:
+            name: 源名称
+            root: 源路径
+            backup_dir: 本次备份的目录，必须与基线所属的备份目录相同
+
+        Returns:
+            Optional[Tuple[FileIndex, Dict[str, str]]]: (基线索引, 相对路径到变化类型的映射)，
+            不能增量备份时返回None
+        """
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT root, tracking_since, error, synced_at, backup_dir FROM sources WHERE name = ?", (name,)
+            ).fetchone()
+            if row is None or row[0] != root:
+                return None
+            tracking_since, error, synced_at, synced_dir = row[1:]
+            if tracking_since is None:
+                print_info(f"{name}: 监视进程未在跟踪{f'（{error}）' if error else ''}，执行完整扫描")
+                return None
+            if synced_at is None or tracking_since > synced_at:
+                print_info(f"{name}: 上次备份后监视进程曾中断或事件溢出，执行完整扫描")
+                return None
+            if synced_dir != backup_dir:
+                return None
+            rows = conn.execute("SELECT rel_path, type, stat FROM baseline WHERE source = ?", (name,)).fetchall()
+            dirty = dict(conn.execute("SELECT rel_path, kind FROM dirty WHERE source = ?", (name,)).fetchall())
+        except sqlite3.Error as e:
+            print_error(f"读取变更日志失败 {self.journal_path}: {e}")
+            return None
+        if not rows:
+            return None
+        index = FileIndex(root)
+        tables = {FILE: index.files, DIR: index.dirs, SYMLINK: index.symlinks}
+        for rel_path, kind, text in rows:
+            tables[kind][rel_path] = decode_stat(text)
+        return index, dirty
+
+    def commit(
+        self,
+        name: str,
+        backup_dir: str,
+        index: FileIndex,
+        cursor: Tuple[int, float],
+        changed: Optional[Set[str]] = None
+    ) -> None:
+        """
+        源目录备份成功后删除已处理的变化，并更新基线
+
+        Args:
+            name: 源名称
+            backup_dir: 本次备份的目录
+            index: 本次备份使用的文件索引
+            cursor: 备份开始时的检查点 (批次序号, 检查点时间)
+            changed: 增量备份时变化的路径，只更新这些路径的基线；None表示完整扫描，重写整个基线
+        """
+        seq, synced_at = cursor
+        rows = []
+        for kind, entries in ((FILE, index.files), (DIR, index.dirs), (SYMLINK, index.symlinks)):
+            for rel_path, st in entries.items():
+                if changed is None or rel_path in changed:
+                    rows.append((name, rel_path, kind, encode_stat(st)))
+        try:
+            conn = self._connect()
+            with conn:
+                if conn.execute("SELECT 1 FROM sources WHERE name = ?", (name,)).fetchone() is None:
+                    return
+                conn.execute("DELETE FROM dirty WHERE source = ? AND seq <= ?", (name, seq))
+                if changed is None:
+                    conn.execute("DELETE FROM baseline WHERE source = ?", (name,))
+                else:
+                    # 已不存在的路径连同其下的条目一起删除，仍存在的路径直接替换
+                    removed = [
+                        rel_path for rel_path in changed
+                        if rel_path not in index.files and rel_path not in index.dirs
+                        and rel_path not in index.symlinks
+                    ]
+                    for rel_path in removed:
+                        conn.execute(
+                            "DELETE FROM baseline WHERE source = ? AND "
+                            "(rel_path = ? OR substr(rel_path, 1, ?) = ?)",
+                            (name, rel_path, len(rel_path) + 1, rel_path + "/")
+                        )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO baseline (source, rel_path, type, stat) VALUES (?, ?, ?, ?)", rows
+                )
+                conn.execute(
+                    "UPDATE sources SET synced_at = ?, backup_dir = ? WHERE name = ?",
+                    (synced_at, backup_dir, name)
+                )
+        except sqlite3.Error as e:
+            print_error(f"写入变更日志失败 {self.journal_path}: {e}")
+
+def _process_alive(pid: int) -> bool:
+    """判断进程是否仍在运行"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
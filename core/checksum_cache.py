@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+from config.settings import CHECKSUM_ALGORITHM, CHECKSUM_CACHE_MAX_ENTRIES
+from .utils import print_error, print_info
+
+class ChecksumCache:
+    """
+    持久化的校验和缓存
+
+    以 (设备号, inode) 定位条目，条目中记录文件大小和纳秒级修改时间，
+    只有 (设备号, inode, 大小, mtime_ns) 全部一致时才视为命中；
+    文件发生变化时旧条目被直接替换。条目数超过上限时按最近使用时间淘汰。
+    """
+
+    VERSION = 1
+
+    def __init__(self, cache_file: Union[str, Path], max_entries: int = CHECKSUM_CACHE_MAX_ENTRIES):
+        """
+        初始化校验和缓存
+
+        Args:
+            cache_file: 缓存文件路径
+            max_entries: 最大缓存条目数
+        """
+        self.cache_file = str(cache_file)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # key -> [size, mtime_ns, algorithm, digest, last_used]
+        self._entries: Dict[str, List] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    @staticmethod
+    def _key(st: os.stat_result) -> str:
+        return f"{st.st_dev}:{st.st_ino}"
+
+    def load(self) -> None:
+        """从磁盘加载缓存，文件损坏时从空缓存开始"""
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self._entries = data.get("entries", {})
+        except Exception as e:
+            print_error(f"读取校验和缓存失败: {e}")
+            self._entries = {}
+
+    def save(self) -> None:
+        """将缓存写回磁盘（先写临时文件再替换，避免中断时损坏）"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._evict()
+            data = {"version": self.VERSION, "entries": self._entries}
+            self._dirty = False
+        tmp_file = self.cache_file + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_file, self.cache_file)
+        except Exception as e:
+            print_error(f"保存校验和缓存失败: {e}")
+
+    def _evict(self) -> None:
+        """超过容量时淘汰最久未使用的条目（调用方需持有锁）"""
+        overflow = len(self._entries) - self.max_entries
+        if overflow <= 0:
+            return
+        oldest = sorted(self._entries, key=lambda k: self._entries[k][4])[:overflow]
+        for key in oldest:
+            del self._entries[key]
+        print_info(f"校验和缓存已淘汰 {len(oldest)} 个条目")
+
+    def get(self, st: os.stat_result, algorithm: str = CHECKSUM_ALGORITHM) -> Optional[str]:
+        """
+        查询缓存的校验和
+
+        Args:
+            st: 文件的stat结果
+            algorithm: 哈希算法名称
+
+        Returns:
+            Optional[str]: 命中时返回校验和，否则返回None
+        """
+        key = self._key(st)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            size, mtime_ns, algo, digest, _ = entry
+            if size != st.st_size or mtime_ns != st.st_mtime_ns or algo != algorithm:
+                # 文件已变化（或算法不同），使旧条目失效
+                del self._entries[key]
+                self._dirty = True
+                self.misses += 1
+                return None
+            entry[4] = int(time.time())
+            self._dirty = True
+            self.hits += 1
+            return digest
+
+    def put(self, st: os.stat_result, digest: str, algorithm: str = CHECKSUM_ALGORITHM) -> None:
+        """
+        写入校验和
+
+        Args:
+            st: 计算校验和之前获取的stat结果
+            digest: 校验和
+            algorithm: 哈希算法名称
+        """
+        with self._lock:
+            self._entries[self._key(st)] = [
+                st.st_size, st.st_mtime_ns, algorithm, digest, int(time.time())
+            ]
+            self._dirty = True
+
+    def invalidate(self, st: os.stat_result) -> None:
+        """删除指定文件的缓存条目"""
+        with self._lock:
+            if self._entries.pop(self._key(st), None) is not None:
+                self._dirty = True
+
+    def __len__(self) -> int:
+        return len(self._entries)
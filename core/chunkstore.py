@@ -0,0 +1,722 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import multiprocessing
+import glob
+import stat
+import random
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+try:
+    import numpy
+except ImportError:  # 可选依赖，没有时逐字节计算gear哈希（慢一个数量级以上）
+    numpy = None
+
+from config.settings import (
+    BACKUP_ROOT,
+    CHUNKSTORE_DIR,
+    CHUNK_MIN_SIZE,
+    CHUNK_AVG_SIZE,
+    CHUNK_MAX_SIZE,
+    CHUNK_SEGMENT_SIZE,
+    CHUNK_WORKERS,
+    CHECKSUM_ALGORITHM,
+    HASH_WORKERS,
+    RECIPE_DIR_NAME
+)
+from .hasher import new_hasher
+from .local_copy import finish_restore
+from .manifest import HASH
+from .scanner import FileIndex, scan_tree
+from .sparse import read_range
+from .utils import print_error, print_info, print_warning
+
+RECIPE_VERSION = 1
+
+_MASK64 = (1 << 64) - 1
+
+# Gear哈希表：固定种子生成，保证每次运行的切分点完全一致
+_rng = random.Random(0x46415354434443)
+_GEAR = [_rng.getrandbits(64) for _ in range(256)]
+del _rng
+_GEAR_ARRAY = numpy.array(_GEAR, dtype=numpy.uint64) if numpy is not None else None
+
+# 批量计算gear哈希时每次处理的字节数（使临时数组留在CPU缓存中）
+_HASH_BLOCK = 64 * 1024
+
+def _make_masks(avg_size: int) -> Tuple[int, int]:
+    """
+    生成FastCDC归一化切分使用的两个掩码
+
+    未达到平均块大小前使用更难命中的掩码（多2位），之后使用更易命中的掩码（少2位），
+    使块大小集中在平均值附近。掩码取高位，高位受更长的字节窗口影响。
+    """
+    bits = max(1, avg_size.bit_length() - 1)
+    mask_small = ((1 << (bits + 2)) - 1) << (64 - bits - 2)
+    mask_large = ((1 << max(1, bits - 2)) - 1) << (64 - max(1, bits - 2))
+    return mask_small, mask_large
+
+def find_cut_point(
+    data: Union[bytes, memoryview],
+    start: int,
+    end: int,
+    min_size: int = CHUNK_MIN_SIZE,
+    avg_size: int = CHUNK_AVG_SIZE,
+    max_size: int = CHUNK_MAX_SIZE
+) -> int:
+    """
+    使用FastCDC算法在 data[start:end] 中寻找下一个块边界
+
+    Args:
+        data: 数据缓冲区
+        start: 本块起始位置
+        end: 可用数据的结束位置
+        min_size: 最小块大小（这部分直接跳过，不计算哈希）
+        avg_size: 期望的平均块大小
+        max_size: 最大块大小
+
+    Returns:
+        int: 本块长度
+    """
+    remaining = end - start
+    if remaining <= min_size:
+        return remaining
+    if remaining > max_size:
+        remaining = max_size
+    normal = min(avg_size, remaining)
+    mask_small, mask_large = _make_masks(avg_size)
+
+    gear = _GEAR
+    h = 0
+    i = start + min_size
+    stop = start + normal
+    while i < stop:
+        h = ((h << 1) + gear[data[i]]) & _MASK64
+        if not h & mask_small:
+            return i - start + 1
+        i += 1
+    stop = start + remaining
+    while i < stop:
+        h = ((h << 1) + gear[data[i]]) & _MASK64
+        if not h & mask_large:
+            return i - start + 1
+        i += 1
+    return remaining
+
+def _gear_candidates(data: Union[bytes, memoryview], mask_small: int, mask_large: int) -> Tuple:
+    """
+    用numpy批量计算缓冲区每个位置的gear哈希，找出可能的块边界
+
+    gear哈希每步左移一位，64步后更早的字节全部移出，因此距本块哈希起点63字节以后的位置，
+    哈希值只取决于最近64个字节，与块从哪里开始无关，可以对整个缓冲区一次算出。
+    窗口哈希按倍增计算：H_2w[i] = H_w[i] + (H_w[i-w] << w)。
+
+    Returns:
+        Tuple: (满足 mask_small 的位置, 满足 mask_large 的位置)，均为升序的numpy数组
+    """
+    arr = numpy.frombuffer(data, dtype=numpy.uint8)
+    small_parts = []
+    large_parts = []
+    for begin in range(0, len(arr), _HASH_BLOCK):
+        lead = min(begin, 63)
+        h = _GEAR_ARRAY[arr[begin - lead:begin + _HASH_BLOCK]]
+        width = 1
+        while width < 64:
+            h[width:] += h[:-width] << numpy.uint64(width)
+            width *= 2
+        h = h[lead:]
+        # mask_small 的位包含 mask_large 的位，满足前者的位置是后者的子集
+        large = numpy.flatnonzero((h & numpy.uint64(mask_large)) == 0)
+        small = large[(h[large] & numpy.uint64(mask_small)) == 0]
+        large_parts.append(large + begin)
+        small_parts.append(small + begin)
+    if not large_parts:
+        return numpy.empty(0, dtype=numpy.intp), numpy.empty(0, dtype=numpy.intp)
+    return numpy.concatenate(small_parts), numpy.concatenate(large_parts)
+
+def _find_indexed_cut_point(
+    data: Union[bytes, memoryview],
+    start: int,
+    end: int,
+    candidates: Tuple,
+    min_size: int,
+    avg_size: int,
+    max_size: int
+) -> int:
+    """
+    与 find_cut_point 结果相同，但在预先算出的候选边界中查找（见 _gear_candidates）
+
+    哈希起点之后的前63个字节的哈希还不是完整窗口，仍逐字节计算。
+    """
+    remaining = end - start
+    if remaining <= min_size:
+        return remaining
+    if remaining > max_size:
+        remaining = max_size
+    normal = min(avg_size, remaining)
+    mask_small, mask_large = _make_masks(avg_size)
+
+    gear = _GEAR
+    h = 0
+    i = start + min_size
+    normal_stop = start + normal
+    stop = start + remaining
+    exact_stop = min(i + 63, stop)
+    while i < exact_stop:
+        h = ((h << 1) + gear[data[i]]) & _MASK64
+        if not h & (mask_small if i < normal_stop else mask_large):
+            return i - start + 1
+        i += 1
+    small, large = candidates
+    if i < normal_stop:
+        k = int(numpy.searchsorted(small, i))
+        if k < len(small) and small[k] < normal_stop:
+            return int(small[k]) - start + 1
+        i = normal_stop
+    k = int(numpy.searchsorted(large, i))
+    if k < len(large) and large[k] < stop:
+        return int(large[k]) - start + 1
+    return remaining
+
+_ZERO_BLOCK = bytes(CHUNK_MAX_SIZE)
+_zero_cut: Dict[Tuple[int, int, int, int], int] = {}
+
+def chunk_buffer(
+    data: bytes,
+    min_size: int = CHUNK_MIN_SIZE,
+    avg_size: int = CHUNK_AVG_SIZE,
+    max_size: int = CHUNK_MAX_SIZE
+) -> List[int]:
+    """
+    把缓冲区切分为内容定义的块
+
+    全零区域（虚拟磁盘中常见）的切分结果只取决于长度，
+    因此直接复用缓存的切分点，不逐字节计算哈希。
+    安装了numpy时先批量算出整个缓冲区的候选边界，结果与逐字节计算相同。
+
+    Args:
+        data: 数据缓冲区
+        min_size: 最小块大小
+        avg_size: 平均块大小
+        max_size: 最大块大小
+
+    Returns:
+        List[int]: 各块长度
+    """
+    view = memoryview(data)
+    candidates = None
+    if numpy is not None:
+        candidates = _gear_candidates(data, *_make_masks(avg_size))
+    lengths = []
+    pos = 0
+    end = len(data)
+    while pos < end:
+        window = min(max_size, end - pos)
+        if max_size <= len(_ZERO_BLOCK) and view[pos:pos + window] == _ZERO_BLOCK[:window]:
+            key = (window, min_size, avg_size, max_size)
+            if key not in _zero_cut:
+                _zero_cut[key] = find_cut_point(_ZERO_BLOCK, 0, window, min_size, avg_size, max_size)
+            length = _zero_cut[key]
+        elif candidates is not None:
+            length = _find_indexed_cut_point(data, pos, end, candidates, min_size, avg_size, max_size)
+        else:
+            length = find_cut_point(data, pos, end, min_size, avg_size, max_size)
+        lengths.append(length)
+        pos += length
+    return lengths
+
+def chunk_digest(data: Union[bytes, memoryview]) -> str:
+    """计算块的内容地址"""
+    return hashlib.blake2b(data, digest_size=32).hexdigest()
+
+class ChunkStore:
+    """
+    内容寻址的块存储
+
+    每个块以其BLAKE2b摘要命名，保存在 chunks/<前两位>/<摘要> 中；
+    index.json 记录已有块及其大小，用于统计和快速判断。
+    并行备份的多个源目录共用同一个实例，修改和保存索引时持有 lock。
+    """
+
+    def __init__(self, root: Union[str, Path] = CHUNKSTORE_DIR):
+        self.root = str(root)
+        self.chunks_dir = os.path.join(self.root, "chunks")
+        self.index_file = os.path.join(self.root, "index.json")
+        self.index: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self) -> None:
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        except Exception as e:
+            print_error(f"读取块索引失败，将在垃圾回收时重建: {e}")
+            self.index = {}
+
+    def save_index(self) -> None:
+        """保存块索引（每个进程使用自己的临时文件）"""
+        tmp_file = f"{self.index_file}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with self.lock:
+                with open(tmp_file, 'w', encoding='utf-8') as f:
+                    json.dump(self.index, f, separators=(",", ":"))
+                os.replace(tmp_file, self.index_file)
+        except Exception as e:
+            print_error(f"保存块索引失败: {e}")
+
+    def chunk_path(self, digest: str) -> str:
+        """获取块文件路径"""
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def has(self, digest: str) -> bool:
+        """判断块是否已存在"""
+        return digest in self.index or os.path.exists(self.chunk_path(digest))
+
+    def put(self, digest: str, data: Union[bytes, memoryview]) -> bool:
+        """
+        写入块（已存在时跳过）
+
+        Returns:
+            bool: 是否实际写入了新块
+        """
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return True
+
+    def read(self, digest: str) -> bytes:
+        """读取块内容"""
+        with open(self.chunk_path(digest), "rb") as f:
+            return f.read()
+
+    def collect_garbage(self, recipe_files: List[str], required: Iterable[str] = ()) -> Tuple[int, int]:
+        """
+        删除所有配方都不再引用的块，并根据磁盘上的实际块重建索引
+
+        Args:
+            recipe_files: 所有仍需保留的配方文件
+            required: 必须包含在 recipe_files 中的配方（如本次备份刚写入的配方），
+                缺少任何一个时说明配方列表不完整，不做删除
+
+        Returns:
+            Tuple[int, int]: (删除的块数, 释放的字节数)
+        """
+        listed = {os.path.abspath(recipe_file) for recipe_file in recipe_files}
+        for recipe_file in required:
+            if os.path.abspath(recipe_file) not in listed:
+                print_error(f"配方列表中缺少本次备份的配方，跳过垃圾回收: {recipe_file}")
+                return 0, 0
+        referenced = set()
+        for recipe_file in recipe_files:
+            recipe = load_recipe(recipe_file)
+            if recipe is None:
+                # 无法确认引用关系时不做删除，避免误删
+                print_error(f"配方无法读取，跳过垃圾回收: {recipe_file}")
+                return 0, 0
+            for entry in recipe["files"].values():
+                referenced.update(digest for digest, _ in entry["chunks"])
+
+        removed = 0
+        freed = 0
+        index: Dict[str, int] = {}
+        for rel_path, st in scan_tree(self.chunks_dir).files.items():
+            digest = os.path.basename(rel_path)
+            if digest.endswith(".tmp") or digest not in referenced:
+                try:
+                    os.remove(os.path.join(self.chunks_dir, rel_path))
+                    removed += 1
+                    freed += st.st_size
+                except OSError as e:
+                    print_warning(f"删除块失败 {rel_path}: {e}")
+                continue
+            index[digest] = st.st_size
+        with self.lock:
+            self.index = index
+        self.save_index()
+        print_info(f"块存储垃圾回收: 删除 {removed} 个块，释放 {freed / (1024 ** 2):.1f} MB")
+        return removed, freed
+
+def get_recipe_path(backup_dir: Union[str, Path], name: str) -> str:
+    """获取某个源目录在备份目录中的配方文件路径"""
+    return os.path.join(str(backup_dir), RECIPE_DIR_NAME, f"{name}.json")
+
+def list_recipe_files(
+    root: Union[str, Path] = BACKUP_ROOT,
+    backup_dirs: Iterable[Union[str, Path]] = ()
+) -> List[str]:
+    """
+    列出所有引用块存储的配方文件
+
+    Args:
+        root: 备份根目录，其下所有备份目录（包括各快照）中的配方都会列出
+        backup_dirs: 其他备份目录（如不在备份根目录下的 BACKUP_DIR）
+
+    Returns:
+        List[str]: 配方文件路径列表（已去重）
+    """
+    patterns = [os.path.join(glob.escape(str(root)), "*", RECIPE_DIR_NAME, "*.json")]
+    patterns += [os.path.join(glob.escape(str(backup_dir)), RECIPE_DIR_NAME, "*.json") for backup_dir in backup_dirs]
+    recipe_files = {os.path.abspath(path) for pattern in patterns for path in glob.glob(pattern)}
+    return sorted(recipe_files)
+
+def load_recipe(recipe_path: Union[str, Path]) -> Optional[Dict]:
+    """加载配方，不存在或损坏时返回None"""
+    if not os.path.exists(recipe_path):
+        return None
+    try:
+        with open(recipe_path, 'r', encoding='utf-8') as f:
+            recipe = json.load(f)
+        return recipe if recipe.get("version") == RECIPE_VERSION else None
+    except Exception as e:
+        print_error(f"读取配方失败 {recipe_path}: {e}")
+        return None
+
+def save_recipe(recipe: Dict, recipe_path: Union[str, Path]) -> bool:
+    """保存配方（先写临时文件再替换）"""
+    recipe_path = str(recipe_path)
+    tmp_path = recipe_path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(recipe_path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(recipe, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, recipe_path)
+        return True
+    except Exception as e:
+        print_error(f"保存配方失败 {recipe_path}: {e}")
+        return False
+
+def segment_digest(data: Union[bytes, memoryview]) -> str:
+    """计算分段内容的摘要，用于判断分段是否与上次相同"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _split_segments(entry: Dict, segment_size: int) -> Optional[List[List[List]]]:
+    """
+    把配方条目的块列表按分段拆开
+
+    Returns:
+        Optional[List[List[List]]]: 各分段的块列表；有块跨越分段边界时返回None
+    """
+    parts: List[List[List]] = []
+    offset = 0
+    for digest, size in entry["chunks"]:
+        i = offset // segment_size
+        if (offset + size - 1) // segment_size != i:
+            return None
+        while len(parts) <= i:
+            parts.append([])
+        parts[i].append([digest, size])
+        offset += size
+    return parts
+
+def _store_segment(
+    path: str,
+    offset: int,
+    length: int,
+    store_root: str,
+    previous: Optional[Tuple[str, List[List]]] = None
+) -> Tuple[List[List], int, str]:
+    """
+    切分并存储文件的一个分段（在子进程中执行）
+
+    大文件按固定偏移划分为分段并行处理，分段边界同时也是块边界；
+    虚拟磁盘镜像的内容不会整体平移，固定分段不会影响去重效果。
+    分段摘要与上次相同且原来的块都还在时直接沿用上次的块列表，不再切分。
+
+    Args:
+        path: 文件路径
+        offset: 分段起始位置
+        length: 分段长度
+        store_root: 块存储目录
+        previous: 上次该分段的 (分段摘要, 块列表)（可选）
+
+    Returns:
+        Tuple[List[List], int, str]: ([[块摘要, 块大小], ...], 新写入的字节数, 分段摘要)
+    """
+    store = ChunkStore.__new__(ChunkStore)
+    store.root = store_root
+    store.chunks_dir = os.path.join(store_root, "chunks")
+    store.index = {}
+    store.lock = threading.Lock()
+
+    # 空洞部分直接以零填充，不读取磁盘
+    with open(path, "rb") as f:
+        data = read_range(f.fileno(), offset, length)
+    digest = segment_digest(data)
+    if previous is not None and previous[0] == digest and all(
+            os.path.exists(store.chunk_path(chunk)) for chunk, _ in previous[1]):
+        return previous[1], 0, digest
+    view = memoryview(data)
+    chunks = []
+    written = 0
+    pos = 0
+    for chunk_len in chunk_buffer(data):
+        piece = view[pos:pos + chunk_len]
+        chunk = chunk_digest(piece)
+        if store.put(chunk, piece):
+            written += chunk_len
+        chunks.append([chunk, chunk_len])
+        pos += chunk_len
+    return chunks, written, digest
+
+def store_tree(
+    index: FileIndex,
+    store: ChunkStore,
+    previous: Optional[Dict] = None,
+    workers: int = CHUNK_WORKERS
+) -> Optional[Dict]:
+    """
+    把目录树写入块存储并生成配方
+
+    大小和修改时间与上一份配方一致的文件直接沿用原来的块列表，
+    其余文件按分段交给进程池：内容未变化的分段（按配方中记录的分段摘要判断）沿用原来的块列表，
+    只有变化的分段重新切分，只有新块会被写入。
+
+    Args:
+        index: 源目录的文件索引
+        store: 块存储
+        previous: 上一份配方（可选）
+        workers: 切分进程数
+
+    Returns:
+        Optional[Dict]: 配方，出错时返回None
+    """
+    old_files = previous.get("files", {}) if previous else {}
+    # 分段大小改变后原来的分段摘要不再适用
+    same_segments = bool(previous) and previous.get("segment_size") == CHUNK_SEGMENT_SIZE
+    files: Dict[str, Dict] = {}
+    segments: Dict[str, List] = {}
+    digests: Dict[str, List] = {}
+    tasks = []
+    for rel_path, st in index.files.items():
+        entry = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "mode": stat.S_IMODE(st.st_mode),
+            "chunks": [],
+            "verified": None
+        }
+        old = old_files.get(rel_path)
+        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            entry["chunks"] = old["chunks"]
+            entry["verified"] = old.get("verified")
+            if same_segments and "segments" in old:
+                entry["segments"] = old["segments"]
+        elif st.st_size > 0:
+            count = (st.st_size + CHUNK_SEGMENT_SIZE - 1) // CHUNK_SEGMENT_SIZE
+            segments[rel_path] = [None] * count
+            digests[rel_path] = [None] * count
+            old_parts = None
+            if old and same_segments and "segments" in old:
+                old_parts = _split_segments(old, CHUNK_SEGMENT_SIZE)
+            for i in range(count):
+                reuse = None
+                if old_parts is not None and i < len(old["segments"]) and i < len(old_parts):
+                    reuse = (old["segments"][i], old_parts[i])
+                tasks.append((rel_path, i, reuse))
+        else:
+            entry["segments"] = []
+        files[rel_path] = entry
+
+    print_info(f"块存储 {index.root}: {len(files)} 个文件，需切分 {len(segments)} 个")
+    written = 0
+    reused = 0
+    ok = True
+    # 备份任务本身运行在线程池中，使用spawn启动子进程以避免fork时继承其他线程持有的锁
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max(1, workers), mp_context=context) as executor:
+        futures = {
+            executor.submit(
+                _store_segment,
+                index.abspath(rel_path),
+                i * CHUNK_SEGMENT_SIZE,
+                CHUNK_SEGMENT_SIZE,
+                store.root,
+                reuse
+            ): (rel_path, i, reuse)
+            for rel_path, i, reuse in tasks
+        }
+        for future in as_completed(futures):
+            rel_path, i, reuse = futures[future]
+            try:
+                chunks, new_bytes, digest = future.result()
+            except Exception as e:
+                print_error(f"写入块存储失败 {rel_path}: {e}")
+                ok = False
+                continue
+            segments[rel_path][i] = chunks
+            digests[rel_path][i] = digest
+            written += new_bytes
+            if reuse is not None and digest == reuse[0] and not new_bytes:
+                reused += 1
+    if not ok:
+        return None
+
+    for rel_path, parts in segments.items():
+        files[rel_path]["chunks"] = [chunk for part in parts for chunk in part]
+        files[rel_path]["segments"] = digests[rel_path]
+        if sum(size for _, size in files[rel_path]["chunks"]) != files[rel_path]["size"]:
+            print_warning(f"文件在备份过程中大小发生变化: {rel_path}")
+    with store.lock:
+        for rel_path in segments:
+            store.index.update(files[rel_path]["chunks"])
+    store.save_index()
+    print_info(f"块存储新写入 {written / (1024 ** 2):.1f} MB，沿用未变化的分段 {reused} 个")
+
+    return {
+        "version": RECIPE_VERSION,
+        "source": index.root,
+        "created": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "segment_size": CHUNK_SEGMENT_SIZE,
+        "files": files,
+        "dirs": {rel_path: stat.S_IMODE(st.st_mode) for rel_path, st in index.dirs.items()},
+        "symlinks": {
+            rel_path: os.readlink(index.abspath(rel_path)) for rel_path in index.symlinks
+        }
+    }
+
+def _hash_recipe_file(store: ChunkStore, entry: Dict, algorithm: str) -> Optional[str]:
+    """按配方从块存储读回文件内容并计算校验和"""
+    hasher = new_hasher(algorithm)
+    try:
+        for digest, _ in entry["chunks"]:
+            hasher.update(store.read(digest))
+        return hasher.hexdigest()
+    except OSError as e:
+        print_error(f"读取块失败: {e}")
+        return None
+
+def verify_recipe(
+    recipe: Dict,
+    manifest: Dict,
+    store: ChunkStore,
+    workers: int = HASH_WORKERS
+) -> Dict[str, List[str]]:
+    """
+    按清单验证配方：从块存储读回文件内容，与源文件校验和比较
+
+    上次验证通过且块列表未变化的文件直接跳过。
+
+    Args:
+        recipe: 配方
+        manifest: 源目录清单
+        store: 块存储
+        workers: 并行验证线程数
+
+    Returns:
+        Dict[str, List[str]]: 验证报告，包含 missing、mismatched、skipped、hashed
+    """
+    report: Dict[str, List[str]] = {"missing": [], "mismatched": [], "skipped": [], "hashed": []}
+    algorithm = manifest.get("algorithm", CHECKSUM_ALGORITHM)
+    todo = []
+    for rel_path, m_entry in manifest["entries"].items():
+        entry = recipe["files"].get(rel_path)
+        if entry is None:
+            report["missing"].append(rel_path)
+        elif entry.get("verified") == m_entry[HASH]:
+            report["skipped"].append(rel_path)
+        else:
+            todo.append(rel_path)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {
+            executor.submit(_hash_recipe_file, store, recipe["files"][rel_path], algorithm): rel_path
+            for rel_path in todo
+        }
+        for future in as_completed(futures):
+            rel_path = futures[future]
+            report["hashed"].append(rel_path)
+            digest = future.result()
+            if digest is not None and digest == manifest["entries"][rel_path][HASH]:
+                recipe["files"][rel_path]["verified"] = digest
+            else:
+                recipe["files"][rel_path]["verified"] = None
+                report["mismatched"].append(rel_path)
+    return report
+
+def restore_file(entry: Dict, store: ChunkStore, dst_file: Union[str, Path]) -> None:
+    """
+    按配方条目从块存储重建单个文件，全零块恢复为空洞
+
+    Args:
+        entry: 配方中的文件条目
+        store: 块存储
+        dst_file: 目标文件路径
+
+    Raises:
+        OSError: 读取块或写入目标文件失败
+    """
+    dst_file = str(dst_file)
+    os.makedirs(os.path.dirname(dst_file) or ".", exist_ok=True)
+    tmp_file = dst_file + ".restore.tmp"
+    try:
+        with open(tmp_file, "wb") as f:
+            for digest, size in entry["chunks"]:
+                data = store.read(digest)
+                if data == _ZERO_BLOCK[:size]:
+                    # 全零块不写入，在目标文件中保留为空洞
+                    f.seek(size, os.SEEK_CUR)
+                else:
+                    f.write(data)
+            f.truncate(entry["size"])
+        os.chmod(tmp_file, entry["mode"])
+        os.utime(tmp_file, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        os.replace(tmp_file, dst_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+def restore_tree(
+    recipe: Dict,
+    store: ChunkStore,
+    dst_root: Union[str, Path],
+    delete: bool = True,
+    progress: Optional[Callable[[int], None]] = None
+) -> bool:
+    """
+    按配方从块存储重建目录树，全零块恢复为空洞
+
+    Args:
+        recipe: 配方
+        store: 块存储
+        dst_root: 恢复目标目录
+        delete: 是否删除目标中配方以外的文件（与rsync --delete一致）
+        progress: 进度回调，参数为新恢复的字节数
+
+    Returns:
+        bool: 是否全部恢复成功
+    """
+    dst_root = str(dst_root)
+    os.makedirs(dst_root, exist_ok=True)
+    ok = True
+    for rel_path in sorted(recipe["dirs"]):
+        os.makedirs(os.path.join(dst_root, rel_path), exist_ok=True)
+
+    for rel_path, entry in recipe["files"].items():
+        dst_file = os.path.join(dst_root, rel_path)
+        try:
+            restore_file(entry, store, dst_file)
+        except OSError as e:
+            print_error(f"恢复文件失败 {dst_file}: {e}")
+            ok = False
+        if progress:
+            progress(entry["size"])
+
+    if not finish_restore(dst_root, recipe["files"], recipe["dirs"], recipe["symlinks"], delete):
+        ok = False
+    return ok
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .manifest import SIZE, MTIME_NS
+from .scanner import FileIndex
+
+# 文件签名：(大小, 纳秒级修改时间)，与rsync默认的快速检查一致
+Signature = Tuple[int, int]
+
+def index_signatures(index: FileIndex) -> Dict[str, Signature]:
+    """从文件索引提取每个文件的签名"""
+    return {rel_path: (st.st_size, st.st_mtime_ns) for rel_path, st in index.files.items()}
+
+def manifest_signatures(manifest: Dict) -> Dict[str, Signature]:
+    """从清单提取每个文件的签名"""
+    return {
+        rel_path: (entry[SIZE], entry[MTIME_NS])
+        for rel_path, entry in manifest.get("entries", {}).items()
+    }
+
+def diff_trees(
+    source: Dict[str, Signature],
+    target: Dict[str, Signature]
+) -> Dict[str, List[str]]:
+    """
+    比较源和目标两棵目录树
+
+    Args:
+        source: 源文件签名
+        target: 目标文件签名
+
+    Returns:
+        Dict[str, List[str]]: 相对路径分类，包含 create（目标缺少）、update（签名不同）、
+        delete（源中不存在）和 unchanged
+    """
+    result: Dict[str, List[str]] = {"create": [], "update": [], "delete": [], "unchanged": []}
+    for rel_path, signature in source.items():
+        old = target.get(rel_path)
+        if old is None:
+            result["create"].append(rel_path)
+        elif old != signature:
+            result["update"].append(rel_path)
+        else:
+            result["unchanged"].append(rel_path)
+    result["delete"] = [rel_path for rel_path in target if rel_path not in source]
+    return result
+
+def estimate_delta(
+    source: Dict[str, Signature],
+    target: Dict[str, Signature]
+) -> Dict[str, int]:
+    """
+    估算将目标同步为源所需写入的数据量
+
+    rsync替换文件时先写临时文件再改名，而删除与传输交替进行，
+    因此所需空间按 新增字节 + 替换文件的净增长 + 最大的单个替换文件 估算，
+    不把删除释放的空间计入。
+
+    Args:
+        source: 源文件签名
+        target: 目标文件签名
+
+    Returns:
+        Dict[str, int]: add_bytes、replace_bytes、delete_bytes、required_bytes
+        以及对应的文件数 add_files、replace_files、delete_files
+    """
+    diff = diff_trees(source, target)
+    add_bytes = sum(source[p][0] for p in diff["create"])
+    replace_bytes = sum(source[p][0] for p in diff["update"])
+    delete_bytes = sum(target[p][0] for p in diff["delete"])
+    growth = sum(max(0, source[p][0] - target[p][0]) for p in diff["update"])
+    largest_replace = max((source[p][0] for p in diff["update"]), default=0)
+    return {
+        "add_bytes": add_bytes,
+        "replace_bytes": replace_bytes,
+        "delete_bytes": delete_bytes,
+        "required_bytes": add_bytes + growth + largest_replace,
+        "add_files": len(diff["create"]),
+        "replace_files": len(diff["update"]),
+        "delete_files": len(diff["delete"])
+    }
+
+def plan_restore(
+    files: Dict[str, Signature],
+    dst_index: FileIndex,
+    dirs: Optional[Dict[str, int]] = None,
+    symlinks: Optional[Dict[str, str]] = None
+) -> Dict:
+    """
+    比较恢复目标的文件索引与备份内容，生成只包含差异的恢复计划
+
+    不知道备份中的目录和符号链接时（只有清单），不删除目标中的目录和符号链接。
+
+    Args:
+        files: 备份中文件的签名
+        dst_index: 恢复目标的文件索引
+        dirs: 备份中的目录及其权限，None表示未知
+        symlinks: 备份中的符号链接及其目标，None表示未知
+
+    Returns:
+        Dict: create、update、delete（多余的文件和符号链接）、unchanged、
+        links（需要创建或修改的符号链接）、delete_dirs（多余的目录），
+        以及需要传输的字节数 bytes 和所需空间 required_bytes
+    """
+    target = index_signatures(dst_index)
+    plan: Dict = diff_trees(files, target)
+    plan["links"] = []
+    if symlinks is not None:
+        plan["delete"].extend(
+            rel_path for rel_path in dst_index.symlinks
+            if rel_path not in symlinks and rel_path not in files
+        )
+        for rel_path, link_target in symlinks.items():
+            try:
+                if rel_path in dst_index.symlinks and os.readlink(dst_index.abspath(rel_path)) == link_target:
+                    continue
+            except OSError:
+                pass
+            plan["links"].append(rel_path)
+    # 目标中的目录在备份里已不是目录时也要删除，否则无法写入同名文件
+    plan["delete_dirs"] = [
+        rel_path for rel_path in dst_index.dirs
+        if (dirs is not None and rel_path not in dirs) or rel_path in files
+        or (symlinks is not None and rel_path in symlinks)
+    ]
+    delta = estimate_delta(files, target)
+    plan["bytes"] = delta["add_bytes"] + delta["replace_bytes"]
+    plan["required_bytes"] = delta["required_bytes"]
+    return plan
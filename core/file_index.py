@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+from pathlib import Path
+from typing import Container, Iterable, List, NamedTuple, Optional, Tuple, Union
+from urllib.parse import quote
+
+from config.settings import FILE_INDEX_NAME
+from .scanner import FileIndex
+from .utils import print_error
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    rel_path TEXT NOT NULL,
+    type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    mode INTEGER NOT NULL,
+    target TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_source ON entries (source);
+"""
+
+# 条目类型
+FILE, DIR, SYMLINK = "f", "d", "l"
+
+class IndexEntry(NamedTuple):
+    """快照文件索引中的一个条目"""
+    path: str
+    source: str
+    rel_path: str
+    type: str
+    size: int
+    mtime_ns: int
+    mode: int
+    target: Optional[str]
+
+def get_file_index_path(backup_dir: Union[str, Path]) -> str:
+    """获取快照文件索引的路径"""
+    return os.path.join(str(backup_dir), FILE_INDEX_NAME)
+
+def _connect(index_path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(index_path, timeout=30)
+    conn.executescript(_SCHEMA)
+    return conn
+
+def write_file_index(backup_dir: Union[str, Path], name: str, index: FileIndex) -> bool:
+    """
+    把一个源目录的文件索引写入快照文件索引，替换该源目录原有的条目
+
+    Args:
+        backup_dir: 备份目录
+        name: 备份中的目录名（源路径的basename）
+        index: 源目录的文件索引
+
+    Returns:
+        bool: 是否写入成功
+    """
+    index_path = get_file_index_path(backup_dir)
+    rows = _index_rows(name, index)
+    try:
+        conn = _connect(index_path)
+        try:
+            with conn:
+                conn.execute("DELETE FROM entries WHERE source = ?", (name,))
+                conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        finally:
+            conn.close()
+        return True
+    except sqlite3.Error as e:
+        print_error(f"写入文件索引失败 {index_path}: {e}")
+        return False
+
+def update_file_index(backup_dir: Union[str, Path], name: str, index: FileIndex, rel_paths: Iterable[str]) -> bool:
+    """
+    只更新快照文件索引中变化的路径（增量备份时使用，不重写未变化的条目）
+
+    Args:
+        backup_dir: 备份目录
+        name: 备份中的目录名（源路径的basename）
+        index: 源目录的文件索引
+        rel_paths: 变化的相对路径，索引中已不存在的路径及其下的条目被删除（索引文件不存在时写入完整索引）
+
+    Returns:
+        bool: 是否写入成功
+    """
+    index_path = get_file_index_path(backup_dir)
+    if not os.path.exists(index_path):
+        return write_file_index(backup_dir, name, index)
+    rel_paths = set(rel_paths)
+    rows = _index_rows(name, index, rel_paths)
+    try:
+        conn = _connect(index_path)
+        try:
+            with conn:
+                for rel_path in rel_paths:
+                    if rel_path not in index.files and rel_path not in index.dirs and rel_path not in index.symlinks:
+                        path = f"{name}/{rel_path}"
+                        conn.execute(
+                            "DELETE FROM entries WHERE path = ? OR substr(path, 1, ?) = ?",
+                            (path, len(path) + 1, path + "/")
+                        )
+                conn.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        finally:
+            conn.close()
+        return True
+    except sqlite3.Error as e:
+        print_error(f"写入文件索引失败 {index_path}: {e}")
+        return False
+
+def _index_rows(name: str, index: FileIndex, rel_paths: Optional[Container[str]] = None) -> List[Tuple]:
+    """生成文件索引的行，指定 rel_paths 时只包含其中的路径"""
+    rows = []
+    for kind, entries in ((FILE, index.files), (DIR, index.dirs), (SYMLINK, index.symlinks)):
+        for rel_path, st in entries.items():
+            if rel_paths is not None and rel_path not in rel_paths:
+                continue
+            target = None
+            if kind == SYMLINK:
+                try:
+                    target = os.readlink(index.abspath(rel_path))
+                except OSError:
+                    continue
+            rows.append((
+                f"{name}/{rel_path}", name, rel_path, kind,
+                st.st_size if kind == FILE else 0, st.st_mtime_ns, st.st_mode & 0o7777, target
+            ))
+    return rows
+
+def search_file_index(backup_dir: Union[str, Path], pattern: str) -> Optional[List[IndexEntry]]:
+    """
+    在快照文件索引中查找路径
+
+    路径形如 "<备份目录名>/<相对路径>"。模式与完整路径匹配（支持 * ? [] 通配符），
+    匹配到目录时同时返回其下的全部条目。
+
+    Args:
+        backup_dir: 备份目录
+        pattern: 路径或通配符模式
+
+    Returns:
+        Optional[List[IndexEntry]]: 按路径排序的条目，索引不存在时返回None
+    """
+    index_path = get_file_index_path(backup_dir)
+    if not os.path.exists(index_path):
+        return None
+    pattern = pattern.strip("/")
+    try:
+        conn = sqlite3.connect(f"file:{quote(index_path)}?mode=ro", uri=True)
+        try:
+            rows = conn.execute(
+                "SELECT * FROM entries WHERE path GLOB ?1 OR path GLOB ?1 || '/*' ORDER BY path",
+                (pattern,)
+            ).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print_error(f"读取文件索引失败 {index_path}: {e}")
+        return None
+    return [IndexEntry(*row) for row in rows]
+
+def load_file_index(backup_dir: Union[str, Path], name: str) -> Optional[List[IndexEntry]]:
+    """
+    读取快照文件索引中一个源目录的全部条目
+
+    Args:
+        backup_dir: 备份目录
+        name: 备份中的目录名
+
+    Returns:
+        Optional[List[IndexEntry]]: 条目列表，索引不存在或没有该目录时返回None
+    """
+    index_path = get_file_index_path(backup_dir)
+    if not os.path.exists(index_path):
+        return None
+    try:
+        conn = sqlite3.connect(f"file:{quote(index_path)}?mode=ro", uri=True)
+        try:
+            rows = conn.execute("SELECT * FROM entries WHERE source = ?", (name,)).fetchall()
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        print_error(f"读取文件索引失败 {index_path}: {e}")
+        return None
+    return [IndexEntry(*row) for row in rows] or None
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import os
+import mmap
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+from config.settings import (
+    CHECKSUM_ALGORITHM,
+    HASH_WORKERS,
+    HASH_CHUNK_SIZE,
+    HASH_MMAP_THRESHOLD
+)
+from .checksum_cache import ChecksumCache
+from .sparse import is_sparse, iter_content
+from .throttle import Throttle
+from .utils import print_error
+
+def new_hasher(algorithm: str = CHECKSUM_ALGORITHM):
+    """
+    创建哈希对象
+
+    Args:
+        algorithm: 哈希算法名称（如 blake2b、blake2s、sha256、md5）
+
+    Returns:
+        hashlib哈希对象
+
+    Raises:
+        ValueError: 不支持的哈希算法
+    """
+    try:
+        return hashlib.new(algorithm)
+    except (ValueError, TypeError):
+        raise ValueError(f"不支持的哈希算法: {algorithm}")
+
+def _hash_with_mmap(fd: int, size: int, hasher) -> None:
+    """通过mmap把整个文件映射到内存后分段送入哈希对象"""
+    with mmap.mmap(fd, size, access=mmap.ACCESS_READ) as mm:
+        if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+        view = memoryview(mm)
+        try:
+            # 分段更新，hashlib在处理大块数据时会释放GIL
+            for offset in range(0, size, HASH_CHUNK_SIZE):
+                hasher.update(view[offset:offset + HASH_CHUNK_SIZE])
+        finally:
+            view.release()
+
+def _hash_with_read(f, hasher) -> None:
+    """使用可复用的大缓冲区顺序读取文件"""
+    buf = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buf)
+    while True:
+        n = f.readinto(buf)
+        if not n:
+            break
+        hasher.update(view[:n])
+
+class _ThrottledHasher:
+    """把送入哈希对象的数据量计入限速器，读取速度随之受限"""
+
+    def __init__(self, hasher, throttle: Throttle):
+        self.hasher = hasher
+        self.throttle = throttle
+
+    def update(self, data) -> None:
+        self.throttle.consume(len(data))
+        self.hasher.update(data)
+
+def _drop_cache(fd: int) -> None:
+    """
+    先把文件的脏页写回磁盘，再丢弃其页缓存（POSIX_FADV_DONTNEED不会丢弃脏页）
+
+    文件系统不支持时忽略。
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.fdatasync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+
+def _compute_digest(
+    file_path: Union[str, Path],
+    algorithm: str,
+    drop_cache: bool = False,
+    throttle: Optional[Throttle] = None
+) -> str:
+    """
+    读取文件内容并计算校验和
+
+    稀疏文件只读取数据区，空洞以零缓冲区送入哈希对象（结果与完整读取一致）；
+    其余大文件使用mmap。drop_cache 为真时读取前后丢弃文件的页缓存，
+    确保内容读自磁盘，且读取过的数据不占用缓存。提供限速器时按其速度读取。
+    """
+    digest = new_hasher(algorithm)
+    hasher = digest if throttle is None else _ThrottledHasher(digest, throttle)
+    with open(file_path, "rb") as f:
+        if drop_cache:
+            _drop_cache(f.fileno())
+        st = os.fstat(f.fileno())
+        size = st.st_size
+        if is_sparse(st):
+            for block in iter_content(f.fileno(), size):
+                hasher.update(block)
+        elif size >= HASH_MMAP_THRESHOLD:
+            _hash_with_mmap(f.fileno(), size, hasher)
+        else:
+            _hash_with_read(f, hasher)
+        if drop_cache:
+            _drop_cache(f.fileno())
+    return digest.hexdigest()
+
+def hash_file(
+    file_path: Union[str, Path],
+    algorithm: str = CHECKSUM_ALGORITHM,
+    cache: Optional[ChecksumCache] = None,
+    drop_cache: bool = False,
+    throttle: Optional[Throttle] = None
+) -> Optional[str]:
+    """
+    在进程内计算文件的校验和
+
+    大文件使用mmap，其余文件使用大块缓冲区读取。提供缓存时，
+    文件未变化则直接返回缓存结果，不再读取文件内容。
+
+    Args:
+        file_path: 文件路径
+        algorithm: 哈希算法名称
+        cache: 校验和缓存（可选）
+        drop_cache: 是否绕过页缓存从磁盘读取（验证刚写入的文件时使用）
+        throttle: 读取限速器（可选）
+
+    Returns:
+        Optional[str]: 十六进制校验和，失败返回None
+    """
+    try:
+        st = os.stat(file_path)
+        if cache is not None:
+            cached = cache.get(st, algorithm)
+            if cached is not None:
+                return cached
+        
+        digest = _compute_digest(file_path, algorithm, drop_cache, throttle)
+        
+        if cache is not None:
+            # 计算期间文件被修改时不写入缓存
+            after = os.stat(file_path)
+            if (after.st_size, after.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+                cache.put(st, digest, algorithm)
+        return digest
+    except (OSError, ValueError) as e:
+        print_error(f"计算文件校验和失败 {file_path}: {e}")
+        return None
+
+def hash_files(
+    paths: Iterable[Union[str, Path]],
+    algorithm: str = CHECKSUM_ALGORITHM,
+    workers: int = HASH_WORKERS,
+    cache: Optional[ChecksumCache] = None,
+    drop_cache: bool = False,
+    throttle: Optional[Throttle] = None
+) -> Iterator[Tuple[Union[str, Path], Optional[str]]]:
+    """
+    使用线程池批量计算文件校验和，按完成顺序返回结果
+
+    Args:
+        paths: 文件路径列表
+        algorithm: 哈希算法名称
+        workers: 并行哈希的线程数
+        cache: 校验和缓存（可选）
+        drop_cache: 是否绕过页缓存从磁盘读取
+        throttle: 读取限速器（可选，各线程共用）
+
+    Yields:
+        Tuple[Union[str, Path], Optional[str]]: (文件路径, 校验和)，失败时校验和为None
+    """
+    # 提前校验算法，避免在每个线程中重复报错
+    new_hasher(algorithm)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(hash_file, path, algorithm, cache, drop_cache, throttle): path for path in paths}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from config.settings import CHECKSUM_ALGORITHM, JOURNAL_CHECKPOINT_SECONDS
+from .scanner import FileIndex
+from .utils import print_error
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS run (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    backup_dir TEXT NOT NULL,
+    started TEXT NOT NULL,
+    algorithm TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS scans (
+    source TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    overrides TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scan_entries (
+    source TEXT NOT NULL,
+    rel_path TEXT NOT NULL,
+    type TEXT NOT NULL,
+    stat TEXT NOT NULL,
+    PRIMARY KEY (source, rel_path)
+);
+CREATE TABLE IF NOT EXISTS entries (
+    source TEXT NOT NULL,
+    rel_path TEXT NOT NULL,
+    entry TEXT NOT NULL,
+    PRIMARY KEY (source, rel_path)
+);
+"""
+
+# 源目录状态
+PENDING, SCANNED, TRANSFERRED, VERIFIED, FAILED = "pending", "scanned", "transferred", "verified", "failed"
+STATE_LABELS = {PENDING: "未开始", SCANNED: "已扫描", TRANSFERRED: "已传输", VERIFIED: "已验证", FAILED: "失败"}
+
+# 扫描条目类型
+FILE, DIR, SYMLINK = "f", "d", "l"
+
+def encode_stat(st: os.stat_result) -> str:
+    """把lstat结果编码为紧凑的JSON文本（运行日志和变更日志共用）"""
+    # 只保存备份用到的字段：元组部分之外还需要纳秒时间和块数（判断稀疏文件）
+    return json.dumps([
+        st.st_mode, st.st_ino, st.st_dev, st.st_nlink, st.st_uid, st.st_gid, st.st_size,
+        st.st_atime_ns, st.st_mtime_ns, st.st_ctime_ns, st.st_blocks
+    ], separators=(",", ":"))
+
+def decode_stat(text: str) -> os.stat_result:
+    """还原 encode_stat 编码的lstat结果"""
+    mode, ino, dev, nlink, uid, gid, size, atime_ns, mtime_ns, ctime_ns, blocks = json.loads(text)
+    times = (atime_ns, mtime_ns, ctime_ns)
+    return os.stat_result(
+        (mode, ino, dev, nlink, uid, gid, size) + tuple(ns // 10 ** 9 for ns in times),
+        {
+            "st_atime": atime_ns / 1e9, "st_mtime": mtime_ns / 1e9, "st_ctime": ctime_ns / 1e9,
+            "st_atime_ns": atime_ns, "st_mtime_ns": mtime_ns, "st_ctime_ns": ctime_ns,
+            "st_blocks": blocks
+        }
+    )
+
+class RunJournal:
+    """
+    备份运行日志：记录一次尚未完成的备份的进度，供中断后继续
+
+    记录各源目录的状态（已扫描、已传输、已验证、失败）、扫描得到的文件索引，
+    以及验证过程中逐个文件得到的清单条目（校验和与验证戳）。清单条目先缓存在内存中，
+    每隔 JOURNAL_CHECKPOINT_SECONDS 秒写入一次；状态变化立即写入。
+    备份全部成功后删除日志文件。
+    """
+
+    def __init__(self, journal_path: Union[str, Path], checkpoint_seconds: float = JOURNAL_CHECKPOINT_SECONDS):
+        """
+        初始化运行日志
+
+        Args:
+            journal_path: 日志文件路径
+            checkpoint_seconds: 清单条目的写入间隔（秒）
+        """
+        self.journal_path = str(journal_path)
+        self.checkpoint_seconds = checkpoint_seconds
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], List] = {}
+        self._last_flush = time.time()
+
+    def _connect(self) -> sqlite3.Connection:
+        """打开日志数据库（各备份线程共用一个连接，由锁保护）"""
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.journal_path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.journal_path, timeout=30, check_same_thread=False)
+            self._conn.executescript(_SCHEMA)
+        return self._conn
+
+    def load(self) -> Optional[Dict]:
+        """
+        读取未完成的备份
+
+        Returns:
+            Optional[Dict]: 包含 backup_dir、started、algorithm 和各源目录状态 states，
+            没有未完成的备份时返回None
+        """
+        if not os.path.exists(self.journal_path):
+            return None
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute("SELECT backup_dir, started, algorithm FROM run").fetchone()
+                if row is None:
+                    return None
+                states = dict(conn.execute("SELECT name, state FROM sources").fetchall())
+        except sqlite3.Error as e:
+            print_error(f"读取运行日志失败 {self.journal_path}: {e}")
+            return None
+        return {"backup_dir": row[0], "started": row[1], "algorithm": row[2], "states": states}
+
+    def begin(self, backup_dir: str, sources: Sequence[str]) -> bool:
+        """
+        开始一次新的备份，清除日志中原有的内容
+
+        Args:
+            backup_dir: 备份目录
+            sources: 源名称列表
+
+        Returns:
+            bool: 是否写入成功
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            with self._lock:
+                self._pending.clear()
+                conn = self._connect()
+                with conn:
+                    for table in ("run", "sources", "scans", "scan_entries", "entries"):
+                        conn.execute(f"DELETE FROM {table}")
+                    conn.execute(
+                        "INSERT INTO run (id, backup_dir, started, algorithm) VALUES (1, ?, ?, ?)",
+                        (backup_dir, now, CHECKSUM_ALGORITHM)
+                    )
+                    conn.executemany(
+                        "INSERT INTO sources (name, state, updated) VALUES (?, ?, ?)",
+                        [(name, PENDING, now) for name in sources]
+                    )
+            return True
+        except sqlite3.Error as e:
+            print_error(f"写入运行日志失败 {self.journal_path}: {e}")
+            return False
+
+    def set_state(self, name: str, state: str, error: Optional[str] = None) -> None:
+        """
+        更新源目录的状态，同时写入已缓存的清单条目
+
+        Args:
+            name: 源名称
+            state: 新状态
+            error: 失败原因
+        """
+        now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    self._flush_locked(conn)
+                    conn.execute(
+                        "INSERT OR REPLACE INTO sources (name, state, updated, error) VALUES (?, ?, ?, ?)",
+                        (name, state, now, error)
+                    )
+        except sqlite3.Error as e:
+            print_error(f"写入运行日志失败 {self.journal_path}: {e}")
+
+    def save_index(self, name: str, index: FileIndex) -> None:
+        """
+        保存源目录的扫描结果（包括数据库快照的替换路径），并把状态设为已扫描
+
+        Args:
+            name: 源名称
+            index: 源目录的文件索引
+        """
+        rows = [(name, rel_path, FILE, encode_stat(st)) for rel_path, st in index.files.items()]
+        rows += [(name, rel_path, DIR, encode_stat(st)) for rel_path, st in index.dirs.items()]
+        rows += [(name, rel_path, SYMLINK, encode_stat(st)) for rel_path, st in index.symlinks.items()]
+        try:
+            with self._lock:
+                conn = self._connect()
+                with conn:
+                    conn.execute("DELETE FROM scan_entries WHERE source = ?", (name,))
+                    conn.execute(
+                        "INSERT OR REPLACE INTO scans (source, root, overrides) VALUES (?, ?, ?)",
+                        (name, index.root, json.dumps(index.overrides, ensure_ascii=False))
+                    )
+                    conn.executemany(
+                        "INSERT INTO scan_entries (source, rel_path, type, stat) VALUES (?, ?, ?, ?)", rows
+                    )
+        except sqlite3.Error as e:
+            print_error(f"写入运行日志失败 {self.journal_path}: {e}")
+            return
+        self.set_state(name, SCANNED)
+
+    def load_index(self, name: str) -> Optional[FileIndex]:
+        """
+        读取保存的扫描结果
+
+        Args:
+            name: 源名称
+
+        Returns:
+            Optional[FileIndex]: 文件索引，没有保存时返回None
+        """
+        try:
+            with self._lock:
+                conn = self._connect()
+                scan = conn.execute("SELECT root, overrides FROM scans WHERE source = ?", (name,)).fetchone()
+                if scan is None:
+                    return None
+                rows = conn.execute(
+                    "SELECT rel_path, type, stat FROM scan_entries WHERE source = ?", (name,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print_error(f"读取运行日志失败 {self.journal_path}: {e}")
+            return None
+        index = FileIndex(scan[0])
+        index.overrides = json.loads(scan[1])
+        tables = {FILE: index.files, DIR: index.dirs, SYMLINK: index.symlinks}
+        for rel_path, kind, text in rows:
+            tables[kind][rel_path] = decode_stat(text)
+        return index
+
+    def record_entry(self, name: str, rel_path: str, entry: List) -> None:
+        """
+        记录一个已计算校验和或已验证的清单条目，按检查点间隔批量写入
+
+        Args:
+            name: 源名称
+            rel_path: 相对路径
+            entry: 清单条目 [size, mtime_ns, mode, hash, verify_stamp]
+        """
+        with self._lock:
+            self._pending[(name, rel_path)] = list(entry)
+            if time.time() - self._last_flush < self.checkpoint_seconds:
+                return
+            try:
+                conn = self._connect()
+                with conn:
+                    self._flush_locked(conn)
+            except sqlite3.Error as e:
+                print_error(f"写入运行日志失败 {self.journal_path}: {e}")
+
+    def _flush_locked(self, conn: sqlite3.Connection) -> None:
+        """写入缓存的清单条目（调用方需持有锁并处于事务中）"""
+        if self._pending:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries (source, rel_path, entry) VALUES (?, ?, ?)",
+                [(name, rel_path, json.dumps(entry)) for (name, rel_path), entry in self._pending.items()]
+            )
+            self._pending.clear()
+        self._last_flush = time.time()
+
+    def entries(self, name: str) -> Dict[str, List]:
+        """
+        读取源目录已记录的清单条目
+
+        Args:
+            name: 源名称
+
+        Returns:
+            Dict[str, List]: 相对路径到清单条目的映射
+        """
+        try:
+            with self._lock:
+                rows = self._connect().execute(
+                    "SELECT rel_path, entry FROM entries WHERE source = ?", (name,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print_error(f"读取运行日志失败 {self.journal_path}: {e}")
+            return {}
+        return {rel_path: json.loads(entry) for rel_path, entry in rows}
+
+    def close(self) -> None:
+        """写入缓存的清单条目并关闭数据库"""
+        with self._lock:
+            if self._conn is None:
+                return
+            try:
+                with self._conn:
+                    self._flush_locked(self._conn)
+            except sqlite3.Error as e:
+                print_error(f"写入运行日志失败 {self.journal_path}: {e}")
+            self._conn.close()
+            self._conn = None
+
+    def remove(self) -> None:
+        """备份完成后删除日志文件"""
+        self.close()
+        for path in (self.journal_path, self.journal_path + "-journal"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print_error(f"删除运行日志失败 {path}: {e}")
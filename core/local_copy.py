@@ -0,0 +1,373 @@
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+import stat
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Container, Dict, Optional, Sequence, Union
+
+from config.settings import CHECKSUM_ALGORITHM, COPY_WORKERS, COPY_CHUNK_SIZE
+from .checksum_cache import ChecksumCache
+from .hasher import new_hasher
+from .scanner import FileIndex, scan_tree
+from .sparse import copy_sparse, is_sparse
+from .throttle import Throttle
+from .utils import print_error, print_warning
+
+def _copy_data(src_fd: int, dst_fd: int, size: int, throttle: Optional[Throttle] = None) -> None:
+    """
+    在内核中复制文件内容
+
+    依次尝试 copy_file_range（同一文件系统上可能直接共享数据块）、sendfile，
+    都不可用时退回到大缓冲区读写。提供限速器时每复制一块后按限速等待。
+    """
+    offset = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < size:
+                n = os.copy_file_range(src_fd, dst_fd, min(COPY_CHUNK_SIZE, size - offset))
+                if n == 0:
+                    break
+                offset += n
+                if throttle is not None:
+                    throttle.consume(n)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    if hasattr(os, "sendfile"):
+        try:
+            while offset < size:
+                n = os.sendfile(dst_fd, src_fd, offset, min(COPY_CHUNK_SIZE, size - offset))
+                if n == 0:
+                    break
+                offset += n
+                if throttle is not None:
+                    throttle.consume(n)
+            return
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL):
+                raise
+    os.lseek(src_fd, offset, os.SEEK_SET)
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    while True:
+        data = os.read(src_fd, COPY_CHUNK_SIZE)
+        if not data:
+            break
+        if throttle is not None:
+            throttle.consume(len(data))
+        os.write(dst_fd, data)
+
+def _copy_and_hash(src_fd: int, dst_fd: int, hasher, throttle: Optional[Throttle] = None) -> None:
+    """
+    在用户态复制文件内容，同时把读到的每一块送入哈希对象
+
+    源文件只读取一次；代价是不能使用 copy_file_range/sendfile 的内核内复制。
+    """
+    buf = bytearray(COPY_CHUNK_SIZE)
+    view = memoryview(buf)
+    while True:
+        n = os.readv(src_fd, [buf])
+        if not n:
+            break
+        if throttle is not None:
+            throttle.consume(n)
+        hasher.update(view[:n])
+        offset = 0
+        while offset < n:
+            offset += os.write(dst_fd, view[offset:n])
+
+def _apply_metadata(path: str, st: os.stat_result, follow_symlinks: bool = True) -> bool:
+    """
+    设置属主、权限和修改时间（与 rsync -a 一致）
+
+    目标文件系统不支持时（如exFAT）忽略错误。
+
+    Returns:
+        bool: 是否全部设置成功
+    """
+    ok = True
+    if os.geteuid() == 0:
+        try:
+            os.chown(path, st.st_uid, st.st_gid, follow_symlinks=follow_symlinks)
+        except OSError:
+            ok = False
+    if follow_symlinks:
+        try:
+            os.chmod(path, st.st_mode & 0o7777)
+        except OSError:
+            ok = False
+    try:
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=follow_symlinks)
+    except (OSError, NotImplementedError):
+        ok = False
+    return ok
+
+def copy_file(
+    src: str,
+    dst: str,
+    st: os.stat_result,
+    hasher=None,
+    throttle: Optional[Throttle] = None
+) -> int:
+    """
+    复制单个文件并保留元数据
+
+    先写入同目录下的临时文件再改名，中断时不会留下不完整的目标文件。
+
+    Args:
+        src: 源文件
+        dst: 目标文件
+        st: 源文件的lstat结果
+        hasher: 哈希对象（可选），复制的同时计算源文件的校验和
+        throttle: 读写限速器（可选）
+
+    Returns:
+        int: 写入的字节数
+    """
+    tmp = os.path.join(os.path.dirname(dst), f".{os.path.basename(dst)}.{threading.get_ident()}.tmp")
+    try:
+        if is_sparse(st):
+            written = copy_sparse(src, tmp, hasher, throttle)
+        else:
+            with open(src, "rb") as fsrc, open(tmp, "wb") as fdst:
+                if hasher is not None:
+                    _copy_and_hash(fsrc.fileno(), fdst.fileno(), hasher, throttle)
+                else:
+                    _copy_data(fsrc.fileno(), fdst.fileno(), st.st_size, throttle)
+            written = st.st_size
+        _apply_metadata(tmp, st)
+        if os.path.isdir(dst) and not os.path.islink(dst):
+            shutil.rmtree(dst)
+        os.replace(tmp, dst)
+        return written
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def _copy_with_hash(
+    src: str,
+    dst: str,
+    st: os.stat_result,
+    cache: ChecksumCache,
+    algorithm: str,
+    throttle: Optional[Throttle] = None
+) -> int:
+    """
+    复制文件并把复制时算出的源文件校验和存入缓存，生成清单时不必再次读取源文件
+
+    复制期间源文件被修改时不写入缓存。
+    """
+    hasher = new_hasher(algorithm)
+    written = copy_file(src, dst, st, hasher, throttle)
+    after = os.stat(src)
+    if (after.st_size, after.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+        cache.put(after, hasher.hexdigest(), algorithm)
+    return written
+
+def sync_tree(
+    src_index: FileIndex,
+    dst_root: Union[str, Path],
+    excludes: Sequence[str] = (),
+    delete: bool = True,
+    link_dest: Optional[Union[str, Path]] = None,
+    workers: int = COPY_WORKERS,
+    progress: Optional[Callable[[int], None]] = None,
+    cache: Optional[ChecksumCache] = None,
+    algorithm: str = CHECKSUM_ALGORITHM,
+    throttle: Optional[Throttle] = None
+) -> Dict[str, int]:
+    """
+    把源目录树同步到本地目标目录（rsync -a 的本地实现）
+
+    大小和修改时间都相同的文件视为未变化；指定 link_dest 时，
+    与其中文件相同的文件直接建立硬链接。变化的文件由线程池并行复制。
+    被排除的文件既不复制也不会在目标端被删除。
+
+    Args:
+        src_index: 源目录的文件索引（扫描时已应用排除规则）
+        dst_root: 目标目录
+        excludes: 排除模式，用于扫描目标目录
+        delete: 是否删除目标端多余的文件（--delete）
+        link_dest: 硬链接基准目录（--link-dest）
+        workers: 并行复制的线程数
+        progress: 进度回调，参数为新完成（复制、链接或跳过）的字节数
+        cache: 校验和缓存（可选），提供时复制的同时计算源文件校验和并存入缓存
+        algorithm: 哈希算法名称
+        throttle: 复制限速器（可选，各线程共用）
+
+    Returns:
+        Dict[str, int]: 统计信息，包含 copied_files、copied_bytes、linked_files、
+        skipped_files、deleted、vanished（扫描后被删除的源文件）、errors
+    """
+    dst_root = str(dst_root)
+    os.makedirs(dst_root, exist_ok=True)
+    dst_index = scan_tree(dst_root, excludes)
+    link_index = scan_tree(link_dest, excludes) if link_dest and os.path.isdir(link_dest) else None
+    stats = {
+        "copied_files": 0, "copied_bytes": 0, "linked_files": 0,
+        "skipped_files": 0, "deleted": 0, "vanished": 0, "errors": 0
+    }
+
+    # 删除目标端多余的条目，以及类型与源端不一致的条目
+    if delete:
+        for rel_path in list(dst_index.files) + list(dst_index.symlinks):
+            if rel_path not in src_index.files and rel_path not in src_index.symlinks:
+                try:
+                    os.remove(dst_index.abspath(rel_path))
+                    stats["deleted"] += 1
+                except OSError as e:
+                    print_warning(f"删除多余文件失败 {rel_path}: {e}")
+        for rel_path in sorted(dst_index.dirs, reverse=True):
+            if rel_path not in src_index.dirs:
+                shutil.rmtree(dst_index.abspath(rel_path), ignore_errors=True)
+                stats["deleted"] += 1
+
+    for rel_path in sorted(src_index.dirs):
+        path = os.path.join(dst_root, rel_path)
+        if os.path.lexists(path) and not os.path.isdir(path):
+            os.remove(path)
+        os.makedirs(path, exist_ok=True)
+
+    to_copy = []
+    for rel_path, st in src_index.files.items():
+        dst_path = os.path.join(dst_root, rel_path)
+        old = dst_index.files.get(rel_path)
+        if old is not None and old.st_size == st.st_size and old.st_mtime_ns == st.st_mtime_ns:
+            if (old.st_mode & 0o7777) != (st.st_mode & 0o7777):
+                _apply_metadata(dst_path, st)
+            stats["skipped_files"] += 1
+            if progress:
+                progress(st.st_size)
+            continue
+        base = link_index.files.get(rel_path) if link_index else None
+        if base is not None and base.st_size == st.st_size and base.st_mtime_ns == st.st_mtime_ns:
+            try:
+                if os.path.lexists(dst_path):
+                    os.remove(dst_path)
+                os.link(link_index.abspath(rel_path), dst_path)
+                stats["linked_files"] += 1
+                if progress:
+                    progress(st.st_size)
+                continue
+            except OSError:
+                pass
+        to_copy.append(rel_path)
+
+    def copy_one(rel_path: str) -> Optional[int]:
+        src, dst, st = src_index.abspath(rel_path), os.path.join(dst_root, rel_path), src_index.files[rel_path]
+        if rel_path not in src_index.overrides:
+            # 扫描之后源文件可能已被修改或删除：与rsync一致，按复制时的状态写入元数据，已删除的文件跳过
+            try:
+                st = os.lstat(src)
+            except FileNotFoundError:
+                return None
+            if not stat.S_ISREG(st.st_mode):
+                return None
+        if cache is None:
+            return copy_file(src, dst, st, throttle=throttle)
+        return _copy_with_hash(src, dst, st, cache, algorithm, throttle)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(copy_one, rel_path): rel_path for rel_path in to_copy}
+        for future in as_completed(futures):
+            rel_path = futures[future]
+            try:
+                written = future.result()
+                if written is None:
+                    print_warning(f"源文件已不存在，跳过 {rel_path}")
+                    stats["vanished"] += 1
+                    continue
+                stats["copied_bytes"] += written
+                stats["copied_files"] += 1
+                if progress:
+                    progress(src_index.files[rel_path].st_size)
+            except OSError as e:
+                print_error(f"复制文件失败 {rel_path}: {e}")
+                stats["errors"] += 1
+
+    for rel_path, st in src_index.symlinks.items():
+        dst_path = os.path.join(dst_root, rel_path)
+        try:
+            target = os.readlink(src_index.abspath(rel_path))
+            if os.path.islink(dst_path) and os.readlink(dst_path) == target:
+                continue
+            if os.path.isdir(dst_path) and not os.path.islink(dst_path):
+                shutil.rmtree(dst_path)
+            elif os.path.lexists(dst_path):
+                os.remove(dst_path)
+            os.symlink(target, dst_path)
+            _apply_metadata(dst_path, st, follow_symlinks=False)
+        except OSError as e:
+            print_error(f"复制符号链接失败 {rel_path}: {e}")
+            stats["errors"] += 1
+
+    # 目录的权限和时间最后设置，写入文件会改变目录的修改时间
+    for rel_path in sorted(src_index.dirs, reverse=True):
+        _apply_metadata(os.path.join(dst_root, rel_path), src_index.dirs[rel_path])
+    try:
+        _apply_metadata(dst_root, os.stat(src_index.root))
+    except OSError:
+        pass
+
+    return stats
+
+def finish_restore(
+    dst_root: Union[str, Path],
+    files: Container[str],
+    dirs: Dict[str, int],
+    symlinks: Dict[str, str],
+    delete: bool = True
+) -> bool:
+    """
+    恢复文件内容之后的收尾工作：创建符号链接、删除多余条目、设置目录权限
+
+    供按配方、归档或包索引重建目录树的恢复方式共用。
+
+    Args:
+        dst_root: 恢复目标目录
+        files: 应保留的文件相对路径
+        dirs: 目录相对路径到权限的映射
+        symlinks: 符号链接相对路径到链接目标的映射
+        delete: 是否删除目标中多余的文件（与rsync --delete一致）
+
+    Returns:
+        bool: 符号链接是否全部恢复成功
+    """
+    dst_root = str(dst_root)
+    ok = True
+    for rel_path, target in symlinks.items():
+        link_path = os.path.join(dst_root, rel_path)
+        try:
+            if os.path.lexists(link_path):
+                os.remove(link_path)
+            os.symlink(target, link_path)
+        except OSError as e:
+            print_error(f"恢复符号链接失败 {link_path}: {e}")
+            ok = False
+
+    if delete:
+        current = scan_tree(dst_root)
+        for rel_path in list(current.files) + list(current.symlinks):
+            if rel_path not in files and rel_path not in symlinks:
+                try:
+                    os.remove(current.abspath(rel_path))
+                except OSError as e:
+                    print_warning(f"删除多余文件失败 {rel_path}: {e}")
+        for rel_path in sorted(current.dirs, reverse=True):
+            if rel_path not in dirs:
+                shutil.rmtree(current.abspath(rel_path), ignore_errors=True)
+
+    # 目录权限最后设置，避免只读目录导致其中的文件无法写入
+    for rel_path, mode in dirs.items():
+        try:
+            os.chmod(os.path.join(dst_root, rel_path), mode)
+        except OSError:
+            pass
+    return ok
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import stat
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from config.settings import CHECKSUM_ALGORITHM, MANIFEST_DIR_NAME
+from .checksum_cache import ChecksumCache
+from .hasher import hash_files
+from .scanner import FileIndex
+from .throttle import Throttle
+from .utils import print_error, print_info
+
+# 清单条目字段下标：[size, mtime_ns, mode, hash, verify_stamp]
+SIZE, MTIME_NS, MODE, HASH, VERIFY_STAMP = range(5)
+
+MANIFEST_VERSION = 1
+
+def get_manifest_path(backup_dir: Union[str, Path], name: str) -> str:
+    """
+    获取某个源目录在备份目录中的清单文件路径
+
+    Args:
+        backup_dir: 备份目录
+        name: 备份中的目录名（源路径的basename）
+
+    Returns:
+        str: 清单文件路径
+    """
+    return os.path.join(str(backup_dir), MANIFEST_DIR_NAME, f"{name}.json")
+
+def load_manifest(manifest_path: Union[str, Path]) -> Optional[Dict]:
+    """
+    加载清单文件
+
+    Args:
+        manifest_path: 清单文件路径
+
+    Returns:
+        Optional[Dict]: 清单内容，不存在或损坏时返回None
+    """
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION:
+            return None
+        return manifest
+    except Exception as e:
+        print_error(f"读取清单失败 {manifest_path}: {e}")
+        return None
+
+def save_manifest(manifest: Dict, manifest_path: Union[str, Path]) -> bool:
+    """
+    保存清单文件（先写临时文件再替换）
+
+    Args:
+        manifest: 清单内容
+        manifest_path: 清单文件路径
+
+    Returns:
+        bool: 是否保存成功
+    """
+    manifest_path = str(manifest_path)
+    tmp_path = manifest_path + ".tmp"
+    try:
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, manifest_path)
+        return True
+    except Exception as e:
+        print_error(f"保存清单失败 {manifest_path}: {e}")
+        return False
+
+def build_manifest(
+    index: FileIndex,
+    previous: Optional[Dict] = None,
+    cache: Optional[ChecksumCache] = None,
+    algorithm: str = CHECKSUM_ALGORITHM,
+    checkpoint: Optional[Callable[[str, List], None]] = None,
+    throttle: Optional[Throttle] = None
+) -> Optional[Dict]:
+    """
+    为源目录生成清单（路径、大小、修改时间、权限、校验和）
+
+    大小和修改时间与上一份清单一致的文件直接沿用旧校验和，
+    其余文件（以及上一份清单中没有校验和的文件）通过哈希线程池并行计算。
+
+    Args:
+        index: 源目录的文件索引
+        previous: 上一份清单（可选）
+        cache: 校验和缓存（可选）
+        algorithm: 哈希算法名称
+        checkpoint: 每算出一个校验和后调用，参数为相对路径和清单条目（可选）
+        throttle: 读取源文件的限速器（可选）
+
+    Returns:
+        Optional[Dict]: 清单内容，存在无法计算校验和的文件时返回None
+    """
+    old_entries = {}
+    if previous and previous.get("algorithm") == algorithm:
+        old_entries = previous.get("entries", {})
+
+    entries: Dict[str, List] = {}
+    to_hash: Dict[str, str] = {}
+    for rel_path, st in index.files.items():
+        entry = [st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode), None, None]
+        old = old_entries.get(rel_path)
+        if old and old[HASH] is not None and old[SIZE] == st.st_size and old[MTIME_NS] == st.st_mtime_ns:
+            entry[HASH] = old[HASH]
+            entry[VERIFY_STAMP] = old[VERIFY_STAMP]
+        else:
+            to_hash[index.abspath(rel_path)] = rel_path
+        entries[rel_path] = entry
+
+    print_info(f"生成清单 {index.root}: {len(entries)} 个文件，需计算校验和 {len(to_hash)} 个")
+    ok = True
+    for path, digest in hash_files(list(to_hash), algorithm, cache=cache, throttle=throttle):
+        if digest is None:
+            ok = False
+            continue
+        entries[to_hash[path]][HASH] = digest
+        if checkpoint:
+            checkpoint(to_hash[path], entries[to_hash[path]])
+    if not ok:
+        return None
+
+    return {
+        "version": MANIFEST_VERSION,
+        "source": index.root,
+        "algorithm": algorithm,
+        "created": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "entries": entries
+    }
+
+def _verify_stamp(st: os.stat_result) -> str:
+    """
+    目标文件的验证戳
+
+    rsync替换文件时总是写入新inode，因此inode和mtime不变即说明文件未被重写。
+    不使用ctime：快照间建立硬链接会改变ctime，但文件内容并未变化。
+    """
+    return f"{st.st_ino}:{st.st_mtime_ns}"
+
+def verify_manifest(
+    manifest: Dict,
+    dst_index: FileIndex,
+    cache: Optional[ChecksumCache] = None,
+    incremental: bool = True,
+    checkpoint: Optional[Callable[[str, List], None]] = None,
+    drop_cache: bool = False,
+    throttle: Optional[Throttle] = None
+) -> Dict[str, List[str]]:
+    """
+    按清单验证整个目标目录
+
+    增量模式下，上次验证通过后未被改动过的文件（校验和与验证戳均未变化）
+    直接跳过；其余文件并行计算校验和。验证通过的条目会更新验证戳，
+    调用方应在验证后重新保存清单。
+
+    Args:
+        manifest: 清单内容
+        dst_index: 目标目录的文件索引
+        cache: 校验和缓存（可选）
+        incremental: 是否启用增量验证
+        checkpoint: 每验证通过一个文件后调用，参数为相对路径和更新了验证戳的清单条目（可选）
+        drop_cache: 是否绕过页缓存读取目标文件（刚写入的数据仍在缓存中，不丢弃时读到的是内存而不是磁盘）
+        throttle: 读取目标文件的限速器（可选）
+
+    Returns:
+        Dict[str, List[str]]: 验证报告，包含 missing、mismatched、extra、skipped、hashed
+    """
+    entries = manifest["entries"]
+    report: Dict[str, List[str]] = {
+        "missing": [], "mismatched": [], "extra": [], "skipped": [], "hashed": []
+    }
+
+    to_hash: Dict[str, Tuple[str, str]] = {}
+    for rel_path, entry in entries.items():
+        st = dst_index.files.get(rel_path)
+        if st is None:
+            report["missing"].append(rel_path)
+            continue
+        if st.st_size != entry[SIZE]:
+            report["mismatched"].append(rel_path)
+            continue
+        stamp = _verify_stamp(st)
+        if incremental and entry[VERIFY_STAMP] == stamp:
+            report["skipped"].append(rel_path)
+            continue
+        to_hash[dst_index.abspath(rel_path)] = (rel_path, stamp)
+
+    for path, digest in hash_files(
+        list(to_hash), manifest["algorithm"], cache=cache, drop_cache=drop_cache, throttle=throttle
+    ):
+        rel_path, stamp = to_hash[path]
+        report["hashed"].append(rel_path)
+        if digest is None or digest != entries[rel_path][HASH]:
+            entries[rel_path][VERIFY_STAMP] = None
+            report["mismatched"].append(rel_path)
+        else:
+            entries[rel_path][VERIFY_STAMP] = stamp
+            if checkpoint:
+                checkpoint(rel_path, entries[rel_path])
+
+    report["extra"] = [rel_path for rel_path in dst_index.files if rel_path not in entries]
+
+    return report
+
+def verify_tree(
+    manifest: Dict,
+    dst_index: FileIndex,
+    full: bool = True,
+    drop_cache: bool = False,
+    throttle: Optional[Throttle] = None
+) -> Dict[str, List[str]]:
+    """
+    按清单验证恢复后的目录树，不读取备份端的数据
+
+    先比较大小和修改时间（恢复会保留修改时间）；快速检查全部通过且 full 为真时，
+    再并行计算目标文件的校验和与清单中记录的校验和比较。清单中没有校验和的条目只做快速检查。
+
+    Args:
+        manifest: 备份中的清单
+        dst_index: 恢复目录的文件索引
+        full: 快速检查通过后是否计算校验和
+        drop_cache: 是否绕过页缓存读取恢复后的文件
+        throttle: 读取恢复后文件的限速器（可选）
+
+    Returns:
+        Dict[str, List[str]]: 验证报告，包含 missing、mismatched、extra、hashed
+    """
+    entries = manifest["entries"]
+    report: Dict[str, List[str]] = {"missing": [], "mismatched": [], "extra": [], "hashed": []}
+    to_hash: Dict[str, str] = {}
+    for rel_path, entry in entries.items():
+        st = dst_index.files.get(rel_path)
+        if st is None:
+            report["missing"].append(rel_path)
+        elif st.st_size != entry[SIZE] or st.st_mtime_ns != entry[MTIME_NS]:
+            report["mismatched"].append(rel_path)
+        elif entry[HASH] is not None:
+            to_hash[dst_index.abspath(rel_path)] = rel_path
+    report["extra"] = [rel_path for rel_path in dst_index.files if rel_path not in entries]
+
+    if not full or report["missing"] or report["mismatched"]:
+        return report
+    for path, digest in hash_files(
+        list(to_hash), manifest.get("algorithm", CHECKSUM_ALGORITHM), drop_cache=drop_cache, throttle=throttle
+    ):
+        rel_path = to_hash[path]
+        report["hashed"].append(rel_path)
+        if digest is None or digest != entries[rel_path][HASH]:
+            report["mismatched"].append(rel_path)
+    return report
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Union
+
+from config.settings import METRICS_DIR
+from .utils import format_duration, print_error, print_info
+
+class RunMetrics:
+    """
+    记录一次备份或恢复中各阶段的耗时、数据量、文件数和吞吐量
+
+    不指定源目录的阶段属于整次运行（如扫描、空间检查），指定源目录的阶段
+    （如传输、验证）按源目录分别记录；各源目录可能并行，记录是线程安全的。
+    """
+
+    def __init__(self, operation: str):
+        """
+        初始化运行记录
+
+        Args:
+            operation: 操作名称，"backup" 或 "restore"
+        """
+        self.operation = operation
+        self.started = datetime.now()
+        self._start_time = time.time()
+        self.duration: Optional[float] = None
+        self.success: Optional[bool] = None
+        self.phases: Dict[str, Dict] = {}
+        self.sources: Dict[str, Dict[str, Dict]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float, nbytes: int = 0, files: int = 0,
+            source: Optional[str] = None) -> None:
+        """
+        累加一个阶段的统计，同一阶段多次记录时耗时、数据量和文件数相加
+
+        Args:
+            phase: 阶段名称
+            seconds: 耗时（秒）
+            nbytes: 处理的字节数
+            files: 处理的文件数
+            source: 源目录名称，None表示整次运行的阶段
+        """
+        with self._lock:
+            phases = self.phases if source is None else self.sources.setdefault(source, {})
+            record = phases.setdefault(phase, {"seconds": 0.0, "bytes": 0, "files": 0})
+            record["seconds"] += seconds
+            record["bytes"] += nbytes
+            record["files"] += files
+
+    @contextmanager
+    def phase(self, phase: str, source: Optional[str] = None) -> Iterator[Dict[str, int]]:
+        """
+        计时一个阶段
+
+        产出的字典中可填写 bytes 和 files，阶段结束（包括异常退出）时一并记录。
+
+        Args:
+            phase: 阶段名称
+            source: 源目录名称，None表示整次运行的阶段
+        """
+        counters = {"bytes": 0, "files": 0}
+        start = time.time()
+        try:
+            yield counters
+        finally:
+            self.add(phase, time.time() - start, counters["bytes"], counters["files"], source)
+
+    def finish(self, success: bool) -> None:
+        """标记运行结束"""
+        self.success = success
+        self.duration = time.time() - self._start_time
+
+    def phase_durations(self) -> Dict[str, float]:
+        """整次运行各阶段的耗时（秒）"""
+        with self._lock:
+            return {phase: record["seconds"] for phase, record in self.phases.items()}
+
+    @staticmethod
+    def _with_throughput(records: Dict[str, Dict]) -> Dict[str, Dict]:
+        result = {}
+        for phase, record in records.items():
+            seconds = max(record["seconds"], 1e-6)
+            result[phase] = dict(
+                record,
+                bytes_per_second=record["bytes"] / seconds,
+                files_per_second=record["files"] / seconds
+            )
+        return result
+
+    def to_dict(self) -> Dict:
+        """生成可写入JSON的记录"""
+        with self._lock:
+            return {
+                "operation": self.operation,
+                "started": self.started.isoformat(timespec="seconds"),
+                "duration": self.duration,
+                "success": self.success,
+                "phases": self._with_throughput(self.phases),
+                "sources": {
+                    source: self._with_throughput(phases)
+                    for source, phases in self.sources.items()
+                }
+            }
+
+    def report(self) -> None:
+        """输出各阶段的耗时和吞吐量"""
+        data = self.to_dict()
+        rows = [(phase, record) for phase, record in data["phases"].items()]
+        for source, phases in data["sources"].items():
+            rows.extend((f"{source}/{phase}", record) for phase, record in phases.items())
+        print_info("阶段统计:")
+        for label, record in rows:
+            line = f"  {label}: {format_duration(record['seconds'])}"
+            if record["bytes"]:
+                line += f"，{record['bytes'] / (1024 ** 2):.1f} MB，{record['bytes_per_second'] / (1024 ** 2):.1f} MB/s"
+            if record["files"]:
+                line += f"，{record['files']} 个文件，{record['files_per_second']:.0f} 个/秒"
+            print_info(line)
+
+    def save(self, directory: Union[str, Path] = METRICS_DIR) -> Optional[str]:
+        """
+        把本次运行的记录写入JSON文件，每次运行一个文件
+
+        Args:
+            directory: 记录目录
+
+        Returns:
+            Optional[str]: 记录文件路径，写入失败时返回None
+        """
+        path = os.path.join(
+            str(directory), f"{self.operation}-{self.started.strftime('%Y%m%d-%H%M%S')}.json"
+        )
+        try:
+            os.makedirs(str(directory), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            return path
+        except OSError as e:
+            print_error(f"保存运行记录失败 {path}: {e}")
+            return None
@@ -0,0 +1,476 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+from config.settings import (
+    PACK_DIR_NAME,
+    PACK_FILE_SIZE,
+    PACK_COMPACT_RATIO,
+    PACK_IO_BUFFER,
+    CHECKSUM_ALGORITHM,
+    HASH_CHUNK_SIZE
+)
+from .checksum_cache import ChecksumCache
+from .hasher import new_hasher
+from .local_copy import finish_restore
+from .manifest import HASH
+from .scanner import FileIndex
+from .utils import print_error, print_info, print_warning
+
+PACK_VERSION = 1
+PACK_INDEX_FILE = "index.json"
+
+# 索引中每个文件条目的字段位置：[包序号, 包内偏移, 大小, 权限, 纳秒级修改时间, 校验和]
+PACK_NO, OFFSET, SIZE, MODE, MTIME_NS, DIGEST = range(6)
+
+def get_pack_dir(backup_dir: Union[str, Path], name: str) -> str:
+    """获取源目录在备份目录中的包目录路径"""
+    return os.path.join(str(backup_dir), PACK_DIR_NAME, name)
+
+def get_pack_file(pack_dir: Union[str, Path], pack_no: int) -> str:
+    """获取包文件路径"""
+    return os.path.join(str(pack_dir), f"pack-{pack_no:05d}.dat")
+
+def load_pack_index(pack_dir: Union[str, Path]) -> Optional[Dict]:
+    """
+    加载包索引
+
+    Args:
+        pack_dir: 包目录
+
+    Returns:
+        Optional[Dict]: 包索引，不存在或无效时返回None
+    """
+    index_path = os.path.join(str(pack_dir), PACK_INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None
+    try:
+        with open(index_path, "r", encoding="utf-8") as f:
+            pack_index = json.load(f)
+        if pack_index.get("version") != PACK_VERSION:
+            print_warning(f"包索引版本不兼容，将重新打包: {index_path}")
+            return None
+        return pack_index
+    except (OSError, json.JSONDecodeError) as e:
+        print_warning(f"加载包索引失败 {index_path}: {e}")
+        return None
+
+def save_pack_index(pack_index: Dict, pack_dir: Union[str, Path]) -> bool:
+    """
+    原子地保存包索引，写入完成前旧索引保持有效
+
+    Args:
+        pack_index: 包索引
+        pack_dir: 包目录
+
+    Returns:
+        bool: 是否保存成功
+    """
+    index_path = os.path.join(str(pack_dir), PACK_INDEX_FILE)
+    tmp_path = index_path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(pack_index, f, ensure_ascii=False, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, index_path)
+        return True
+    except OSError as e:
+        print_error(f"保存包索引失败 {index_path}: {e}")
+        return False
+
+def link_packs(src_dir: Union[str, Path], dst_dir: Union[str, Path]) -> bool:
+    """
+    把上一个快照的包文件硬链接到新快照中
+
+    包文件只追加不修改，旧快照的索引只引用追加前的数据，因此新旧快照可以共享同一个包文件。
+
+    Args:
+        src_dir: 上一个快照的包目录
+        dst_dir: 新快照的包目录
+
+    Returns:
+        bool: 是否全部链接成功
+    """
+    os.makedirs(str(dst_dir), exist_ok=True)
+    for entry in os.scandir(str(src_dir)):
+        if not entry.name.endswith(".dat"):
+            continue
+        dst_file = os.path.join(str(dst_dir), entry.name)
+        try:
+            if not os.path.exists(dst_file):
+                os.link(entry.path, dst_file)
+        except OSError as e:
+            print_warning(f"硬链接包文件失败 {entry.path}: {e}")
+            return False
+    return True
+
+def _pack_dead_ratio(pack_index: Dict, live: Dict[str, List]) -> float:
+    """计算包文件中不再被引用的数据比例"""
+    total = sum(pack_index["packs"].values())
+    if total == 0:
+        return 0.0
+    return 1.0 - sum(entry[SIZE] for entry in live.values()) / total
+
+def _reused_entries(index: FileIndex, previous: Optional[Dict], algorithm: str) -> Dict[str, List]:
+    """上一次包索引中大小和修改时间未变化、可以沿用的文件条目"""
+    old_files = previous["files"] if previous and previous.get("algorithm") == algorithm else {}
+    files: Dict[str, List] = {}
+    for rel_path in sorted(index.files):
+        st = index.files[rel_path]
+        old = old_files.get(rel_path)
+        if old is not None and old[SIZE] == st.st_size and old[MTIME_NS] == st.st_mtime_ns:
+            files[rel_path] = list(old)
+            files[rel_path][MODE] = st.st_mode & 0o7777
+    return files
+
+def needs_compaction(index: FileIndex, previous: Optional[Dict], algorithm: str = CHECKSUM_ALGORITHM) -> bool:
+    """
+    判断本次写入是否会整体重新打包（失效数据超过 PACK_COMPACT_RATIO）
+
+    Args:
+        index: 源目录的文件索引
+        previous: 上一次的包索引
+        algorithm: 校验和算法
+
+    Returns:
+        bool: 是否重新打包；重新打包时整个目录树写入新的包，之后才删除旧包
+    """
+    if not previous:
+        return False
+    return _pack_dead_ratio(previous, _reused_entries(index, previous, algorithm)) > PACK_COMPACT_RATIO
+
+def write_packs(
+    index: FileIndex,
+    pack_dir: Union[str, Path],
+    previous: Optional[Dict] = None,
+    cache: Optional[ChecksumCache] = None,
+    algorithm: str = CHECKSUM_ALGORITHM
+) -> Optional[Dict]:
+    """
+    把目录树追加写入包文件
+
+    大小和修改时间未变化的文件沿用上次的位置，新文件和变化的文件按顺序追加到最后一个包，
+    包达到 PACK_FILE_SIZE 后开始新包；目标设备上只有少量大文件的顺序写入。
+    失效数据超过 PACK_COMPACT_RATIO 时整体重写到新的包中，再删除旧包。
+    写入的同时计算校验和，源文件在读取期间未变化时写入校验和缓存，生成清单时不必再次读取。
+
+    Args:
+        index: 源目录的文件索引
+        pack_dir: 包目录
+        previous: 上一次的包索引（其引用的包文件必须已在 pack_dir 中）
+        cache: 校验和缓存
+        algorithm: 校验和算法
+
+    Returns:
+        Optional[Dict]: 新的包索引，失败时返回None。调用方取出其中的 obsolete
+        （重新打包后不再使用的包序号），保存索引后再删除这些包文件
+    """
+    pack_dir = str(pack_dir)
+    os.makedirs(pack_dir, exist_ok=True)
+    packs: Dict[str, int] = dict(previous["packs"]) if previous else {}
+    files = _reused_entries(index, previous, algorithm)
+    todo = [rel_path for rel_path in sorted(index.files) if rel_path not in files]
+
+    obsolete: List[str] = []
+    if previous and _pack_dead_ratio(previous, files) > PACK_COMPACT_RATIO:
+        print_info(f"包中失效数据超过 {PACK_COMPACT_RATIO:.0%}，重新打包: {pack_dir}")
+        obsolete = list(packs)
+        packs = {}
+        todo = sorted(index.files)
+        files = {}
+
+    pack_no = max((int(no) for no in packs), default=-1)
+    if obsolete:
+        pack_no = max(int(no) for no in obsolete)
+    if pack_no < 0 or packs.get(str(pack_no), PACK_FILE_SIZE) >= PACK_FILE_SIZE:
+        pack_no += 1
+    written = 0
+    out = None
+    buf = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buf)
+    try:
+        for rel_path in todo:
+            if out is None or out.tell() >= PACK_FILE_SIZE:
+                if out is not None:
+                    out.flush()
+                    os.fsync(out.fileno())
+                    packs[str(pack_no)] = out.tell()
+                    out.close()
+                    pack_no += 1
+                out = open(get_pack_file(pack_dir, pack_no), "ab", buffering=PACK_IO_BUFFER)
+                # 上次中断可能留下未被索引引用的尾部数据，从实际文件末尾继续追加
+                out.seek(0, os.SEEK_END)
+            st = index.files[rel_path]
+            offset = out.tell()
+            hasher = new_hasher(algorithm)
+            size = 0
+            try:
+                with open(index.abspath(rel_path), "rb", buffering=0) as f:
+                    while True:
+                        n = f.readinto(buf)
+                        if not n:
+                            break
+                        hasher.update(view[:n])
+                        out.write(view[:n])
+                        size += n
+                after = os.stat(index.abspath(rel_path), follow_symlinks=False)
+            except OSError as e:
+                print_error(f"读取文件失败 {rel_path}: {e}")
+                return None
+            digest = hasher.hexdigest()
+            if size != st.st_size:
+                print_warning(f"文件在备份过程中大小发生变化: {rel_path}")
+            elif cache is not None and (after.st_size, after.st_mtime_ns) == (st.st_size, st.st_mtime_ns):
+                cache.put(st, digest, algorithm)
+            files[rel_path] = [pack_no, offset, size, st.st_mode & 0o7777, st.st_mtime_ns, digest]
+            written += size
+        if out is not None:
+            out.flush()
+            os.fsync(out.fileno())
+            packs[str(pack_no)] = out.tell()
+    except OSError as e:
+        print_error(f"写入包文件失败 {pack_dir}: {e}")
+        return None
+    finally:
+        if out is not None:
+            out.close()
+
+    print_info(
+        f"打包完成 {pack_dir}: 追加 {len(todo)} 个文件 ({written / (1024 ** 2):.1f} MB)，"
+        f"沿用 {len(files) - len(todo)} 个"
+    )
+    return {
+        "version": PACK_VERSION,
+        "source": index.root,
+        "created": datetime.now().isoformat(),
+        "algorithm": algorithm,
+        "packs": packs,
+        "obsolete": obsolete,
+        "files": files,
+        "dirs": {rel_path: st.st_mode & 0o7777 for rel_path, st in index.dirs.items()},
+        "symlinks": {rel_path: os.readlink(index.abspath(rel_path)) for rel_path in index.symlinks}
+    }
+
+def remove_packs(pack_dir: Union[str, Path], pack_nos: List[str]) -> None:
+    """删除重新打包前的旧包文件（必须在新索引保存之后调用）"""
+    for pack_no in pack_nos:
+        try:
+            os.remove(get_pack_file(pack_dir, int(pack_no)))
+        except OSError as e:
+            print_warning(f"删除旧包文件失败 {pack_no}: {e}")
+
+def _iter_packed(pack_dir: str, pack_index: Dict, rel_paths: List[str]) -> Iterator[tuple]:
+    """
+    按包内顺序流式读取多个文件，每个包只顺序读取一遍
+
+    Yields:
+        tuple: (相对路径, 内容片段迭代器)
+    """
+    by_pack: Dict[int, List[str]] = defaultdict(list)
+    for rel_path in rel_paths:
+        by_pack[pack_index["files"][rel_path][PACK_NO]].append(rel_path)
+    for pack_no in sorted(by_pack):
+        members = sorted(by_pack[pack_no], key=lambda p: pack_index["files"][p][OFFSET])
+        with open(get_pack_file(pack_dir, pack_no), "rb", buffering=PACK_IO_BUFFER) as f:
+            for rel_path in members:
+                entry = pack_index["files"][rel_path]
+                if f.tell() != entry[OFFSET]:
+                    f.seek(entry[OFFSET])
+                yield rel_path, _read_span(f, entry[SIZE])
+
+def _read_span(f, size: int) -> Iterator[bytes]:
+    """从包文件当前位置读取指定长度的数据"""
+    remaining = size
+    while remaining > 0:
+        data = f.read(min(HASH_CHUNK_SIZE, remaining))
+        if not data:
+            raise OSError(f"包文件被截断: {f.name}")
+        remaining -= len(data)
+        yield data
+
+def _write_member(rel_path: str, entry: List, chunks: Iterator[bytes], dst_file: str) -> None:
+    """把包中的一个文件写到目标位置并恢复权限和修改时间"""
+    os.makedirs(os.path.dirname(dst_file) or ".", exist_ok=True)
+    tmp_file = dst_file + ".restore.tmp"
+    try:
+        with open(tmp_file, "wb") as out:
+            for data in chunks:
+                out.write(data)
+        os.chmod(tmp_file, entry[MODE])
+        os.utime(tmp_file, ns=(entry[MTIME_NS], entry[MTIME_NS]))
+        os.replace(tmp_file, dst_file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+def extract_packed_file(pack_dir: Union[str, Path], rel_path: str, dst_file: Union[str, Path]) -> bool:
+    """
+    通过包索引提取单个文件
+
+    Args:
+        pack_dir: 包目录
+        rel_path: 文件的相对路径
+        dst_file: 目标文件路径
+
+    Returns:
+        bool: 是否提取成功
+    """
+    pack_index = load_pack_index(pack_dir)
+    if pack_index is None or rel_path not in pack_index["files"]:
+        print_error(f"包中不存在文件: {rel_path}")
+        return False
+    try:
+        for member, chunks in _iter_packed(str(pack_dir), pack_index, [rel_path]):
+            _write_member(member, pack_index["files"][member], chunks, str(dst_file))
+        return True
+    except OSError as e:
+        print_error(f"提取文件失败 {rel_path}: {e}")
+        return False
+
+def extract_packed_files(
+    pack_dir: Union[str, Path],
+    targets: Dict[str, str],
+    progress: Optional[Callable[[int], None]] = None
+) -> bool:
+    """
+    通过包索引提取多个文件，每个包只顺序读取一遍
+
+    Args:
+        pack_dir: 包目录
+        targets: 相对路径到目标文件路径的映射
+        progress: 进度回调，参数为新提取的字节数
+
+    Returns:
+        bool: 是否全部提取成功
+    """
+    pack_index = load_pack_index(pack_dir)
+    if pack_index is None:
+        print_error(f"包索引不存在: {pack_dir}")
+        return False
+    ok = True
+    rel_paths = []
+    for rel_path in targets:
+        if rel_path in pack_index["files"]:
+            rel_paths.append(rel_path)
+        else:
+            print_error(f"包中不存在文件: {rel_path}")
+            ok = False
+    try:
+        for rel_path, chunks in _iter_packed(str(pack_dir), pack_index, rel_paths):
+            _write_member(rel_path, pack_index["files"][rel_path], chunks, targets[rel_path])
+            if progress:
+                progress(pack_index["files"][rel_path][SIZE])
+    except OSError as e:
+        print_error(f"提取文件失败 {pack_dir}: {e}")
+        ok = False
+    return ok
+
+def verify_packs(
+    pack_index: Dict,
+    pack_dir: Union[str, Path],
+    manifest: Dict,
+    rel_paths: Optional[List[str]] = None
+) -> Dict[str, List[str]]:
+    """
+    按清单验证包：索引中的校验和必须与清单一致，并读回指定文件的内容重新计算
+
+    读回前丢弃这些包文件的页缓存，确保校验的是设备上的数据。
+
+    Args:
+        pack_index: 包索引
+        pack_dir: 包目录
+        manifest: 源目录清单
+        rel_paths: 需要读回校验的文件，默认全部
+
+    Returns:
+        Dict[str, List[str]]: 验证报告，包含 missing、mismatched、hashed
+    """
+    pack_dir = str(pack_dir)
+    report: Dict[str, List[str]] = {"missing": [], "mismatched": [], "hashed": []}
+    algorithm = pack_index.get("algorithm", CHECKSUM_ALGORITHM)
+    for rel_path, m_entry in manifest["entries"].items():
+        entry = pack_index["files"].get(rel_path)
+        if entry is None:
+            report["missing"].append(rel_path)
+        elif entry[DIGEST] != m_entry[HASH]:
+            report["mismatched"].append(rel_path)
+
+    if rel_paths is None:
+        rel_paths = list(pack_index["files"])
+    rel_paths = [p for p in rel_paths if p in pack_index["files"] and p in manifest["entries"]]
+    if hasattr(os, "posix_fadvise"):
+        for pack_no in {pack_index["files"][p][PACK_NO] for p in rel_paths}:
+            try:
+                fd = os.open(get_pack_file(pack_dir, pack_no), os.O_RDONLY)
+                try:
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass
+    try:
+        for rel_path, chunks in _iter_packed(pack_dir, pack_index, rel_paths):
+            hasher = new_hasher(algorithm)
+            for data in chunks:
+                hasher.update(data)
+            report["hashed"].append(rel_path)
+            digest = hasher.hexdigest()
+            if digest != manifest["entries"][rel_path][HASH] and rel_path not in report["mismatched"]:
+                report["mismatched"].append(rel_path)
+    except OSError as e:
+        print_error(f"读取包文件失败 {pack_dir}: {e}")
+        report["mismatched"].extend(p for p in rel_paths if p not in report["hashed"])
+    return report
+
+def unpack_tree(
+    pack_dir: Union[str, Path],
+    dst_root: Union[str, Path],
+    delete: bool = True,
+    progress: Optional[Callable[[int], None]] = None
+) -> bool:
+    """
+    一次顺序读取所有包文件，把目录树解包到目标目录
+
+    Args:
+        pack_dir: 包目录
+        dst_root: 恢复目标目录
+        delete: 是否删除目标中包以外的文件（与rsync --delete一致）
+        progress: 进度回调，参数为新恢复的字节数
+
+    Returns:
+        bool: 是否全部恢复成功
+    """
+    pack_dir = str(pack_dir)
+    dst_root = str(dst_root)
+    pack_index = load_pack_index(pack_dir)
+    if pack_index is None:
+        print_error(f"包索引不存在: {pack_dir}")
+        return False
+
+    ok = True
+    os.makedirs(dst_root, exist_ok=True)
+    for rel_path in sorted(pack_index["dirs"]):
+        os.makedirs(os.path.join(dst_root, rel_path), exist_ok=True)
+    try:
+        for rel_path, chunks in _iter_packed(pack_dir, pack_index, list(pack_index["files"])):
+            try:
+                _write_member(rel_path, pack_index["files"][rel_path], chunks, os.path.join(dst_root, rel_path))
+            except OSError as e:
+                print_error(f"恢复文件失败 {rel_path}: {e}")
+                ok = False
+            if progress:
+                progress(pack_index["files"][rel_path][SIZE])
+    except OSError as e:
+        print_error(f"读取包文件失败 {pack_dir}: {e}")
+        return False
+
+    if not finish_restore(dst_root, pack_index["files"], pack_index["dirs"], pack_index["symlinks"], delete):
+        ok = False
+    return ok
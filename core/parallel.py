@@ -0,0 +1,404 @@
+# -*- coding: utf-8 -*-
+
+import re
+import time
+import signal
+import asyncio
+import contextvars
+import subprocess
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence, Set, Union
+
+from config.settings import JOB_TIMEOUT, PIPELINE_VERIFY, PROCESS_KILL_GRACE
+from .throttle import Throttle
+from .utils import get_physical_device, print_error, print_warning
+
+_READ_SIZE = 64 * 1024
+
+class JobCancelled(subprocess.SubprocessError):
+    """任务超时或被取消，其子进程已被终止"""
+
+class _Job:
+    """运行中的任务：记录其子进程协程，取消任务时一并终止"""
+
+    def __init__(self, name: str, loop: asyncio.AbstractEventLoop):
+        self.name = name
+        self.loop = loop
+        self.tasks: Set[asyncio.Future] = set()
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str) -> None:
+        """取消任务（在事件循环中调用）"""
+        if self.reason is None:
+            self.reason = reason
+        for task in list(self.tasks):
+            task.cancel()
+
+    async def track(self, coro) -> subprocess.CompletedProcess:
+        """在事件循环中运行子进程协程，任务取消时随之取消"""
+        if self.reason is not None:
+            coro.close()
+            raise asyncio.CancelledError()
+        task = asyncio.ensure_future(coro)
+        self.tasks.add(task)
+        try:
+            return await task
+        finally:
+            self.tasks.discard(task)
+
+# 当前线程正在执行的任务，由 JobRunner 在执行阶段函数时设置
+_current_job: contextvars.ContextVar = contextvars.ContextVar("current_job", default=None)
+
+async def _terminate(process: asyncio.subprocess.Process, grace: float = PROCESS_KILL_GRACE) -> None:
+    """先发送SIGTERM，超过等待时间后发送SIGKILL"""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        # 被限速暂停的进程需要继续运行才能处理SIGTERM
+        process.send_signal(signal.SIGCONT)
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(process.wait(), grace)
+        return
+    except asyncio.TimeoutError:
+        pass
+    try:
+        process.kill()
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(process.wait(), grace)
+    except asyncio.TimeoutError:
+        # 阻塞在设备I/O中（D状态）的进程要等I/O返回后才会退出
+        print_warning(f"子进程 {process.pid} 无法终止，可能阻塞在设备I/O中")
+
+async def _exec(
+    cmd: Sequence[str],
+    input_data: Optional[bytes],
+    on_line: Optional[Callable[[str], Optional[int]]],
+    on_stderr: Optional[Callable[[str], None]],
+    throttle: Optional[Throttle],
+    timeout: Optional[float],
+    idle_timeout: Optional[float]
+) -> subprocess.CompletedProcess:
+    """在事件循环中运行子进程，同时写入标准输入、读取标准输出和标准错误"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    stdout: List[bytes] = []
+    stderr: List[str] = []
+
+    async def feed() -> None:
+        if input_data is None:
+            return
+        try:
+            process.stdin.write(input_data)
+            await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            process.stdin.close()
+
+    async def read_stdout() -> None:
+        buf = b""
+        while True:
+            try:
+                data = await asyncio.wait_for(process.stdout.read(_READ_SIZE), idle_timeout or None)
+            except asyncio.TimeoutError:
+                raise subprocess.TimeoutExpired(list(cmd), idle_timeout)
+            if not data:
+                break
+            if on_line is None:
+                stdout.append(data)
+                continue
+            # rsync用回车符刷新进度行，按回车和换行拆分
+            *lines, buf = re.split(rb"[\r\n]", buf + data)
+            for line in lines:
+                if not line:
+                    continue
+                nbytes = on_line(line.decode("utf-8", errors="replace"))
+                if throttle is not None and nbytes:
+                    await throttle.pace_process(process, nbytes)
+        if buf and on_line is not None:
+            on_line(buf.decode("utf-8", errors="replace"))
+
+    async def read_stderr() -> None:
+        while True:
+            line = await process.stderr.readline()
+            if not line:
+                break
+            text = line.decode("utf-8", errors="replace").rstrip("\r\n")
+            stderr.append(text)
+            if on_stderr is not None:
+                on_stderr(text)
+
+    try:
+        await asyncio.wait_for(asyncio.gather(feed(), read_stdout(), read_stderr()), timeout or None)
+        returncode = await process.wait()
+    except asyncio.TimeoutError:
+        await _terminate(process)
+        raise subprocess.TimeoutExpired(list(cmd), timeout)
+    except BaseException:
+        await _terminate(process)
+        raise
+    return subprocess.CompletedProcess(
+        list(cmd), returncode, b"".join(stdout).decode("utf-8", errors="replace"), "\n".join(stderr)
+    )
+
+def run_process(
+    cmd: Sequence[str],
+    input: Optional[str] = None,
+    on_line: Optional[Callable[[str], Optional[int]]] = None,
+    on_stderr: Optional[Callable[[str], None]] = None,
+    throttle: Optional[Throttle] = None,
+    timeout: Optional[float] = None,
+    idle_timeout: Optional[float] = None,
+    check: bool = True
+) -> subprocess.CompletedProcess:
+    """
+    在asyncio事件循环中运行子进程并等待其结束
+
+    在 JobRunner 的任务中调用时，子进程由任务调度的事件循环启动和读取，任务超时或取消时被终止；
+    其他情况下在临时事件循环中运行。
+
+    Args:
+        cmd: 命令及其参数
+        input: 写入标准输入的文本（可选）
+        on_line: 逐行处理标准输出的回调，返回该行报告的新传输字节数（用于限速）或None；
+            不提供时收集全部输出，存入返回结果的 stdout
+        on_stderr: 逐行处理标准错误的回调（可选）
+        throttle: 限速器（可选），按 on_line 返回的字节数暂停子进程
+        timeout: 最长运行时间（秒），None或0表示不限制
+        idle_timeout: 标准输出连续无数据的最长时间（秒），None或0表示不限制
+        check: 返回码非零时是否抛出异常
+
+    Returns:
+        subprocess.CompletedProcess: 返回码、收集的标准输出和标准错误
+
+    Raises:
+        subprocess.CalledProcessError: check 为真且返回码非零
+        subprocess.TimeoutExpired: 超过 timeout 或 idle_timeout，子进程已被终止
+        JobCancelled: 所属任务超时或被取消，子进程已被终止
+        OSError: 无法启动子进程
+    """
+    coro = _exec(
+        cmd, input.encode("utf-8") if input is not None else None,
+        on_line, on_stderr, throttle, timeout, idle_timeout
+    )
+    job: Optional[_Job] = _current_job.get()
+    if job is None:
+        result = asyncio.run(coro)
+    else:
+        future = asyncio.run_coroutine_threadsafe(job.track(coro), job.loop)
+        try:
+            result = future.result()
+        except (concurrent.futures.CancelledError, asyncio.CancelledError):
+            raise JobCancelled(job.reason or "已取消")
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, result.args, result.stdout, result.stderr)
+    return result
+
+class DeviceLimiter:
+    """按物理设备限制并发任务数"""
+
+    def __init__(self, max_per_device: int):
+        """
+        初始化设备并发限制器（在事件循环中创建）
+
+        Args:
+            max_per_device: 同一物理设备上同时运行的最大任务数
+        """
+        self.max_per_device = max(1, max_per_device)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def acquire(self, devices: Sequence[str]) -> AsyncIterator[None]:
+        """
+        占用任务涉及的全部物理设备
+
+        设备按名称排序后依次获取，避免多个任务交叉等待造成死锁。
+
+        Args:
+            devices: 已排序的设备名称列表
+        """
+        acquired = []
+        try:
+            for device in devices:
+                semaphore = self._semaphores.setdefault(device, asyncio.Semaphore(self.max_per_device))
+                await semaphore.acquire()
+                acquired.append(device)
+            yield
+        finally:
+            for device in reversed(acquired):
+                self._semaphores[device].release()
+
+class JobRunner:
+    """
+    基于asyncio的任务调度
+
+    每个任务由若干阶段组成（如传输、验证），阶段函数在线程池中执行，其中启动的子进程
+    （run_process）由事件循环统一读取输出、计时和终止。各阶段分别受 max_workers 限制，
+    一个任务传输完成进入验证时，下一个任务的传输即可开始；同一物理设备上的并发阶段数
+    受 max_per_device 限制。任务超时或收到SIGINT/SIGTERM时终止其子进程，且不再开始后续阶段。
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        max_per_device: int,
+        timeout: float = JOB_TIMEOUT,
+        pipeline: bool = PIPELINE_VERIFY
+    ):
+        """
+        初始化任务调度
+
+        Args:
+            max_workers: 每个阶段同时运行的最大任务数
+            max_per_device: 同一物理设备上同时运行的最大阶段数
+            timeout: 单个任务的最长运行时间（秒），0表示不限制
+            pipeline: 是否让验证与下一个任务的传输重叠；否则各任务的阶段连续执行
+        """
+        self.max_workers = max(1, max_workers)
+        self.max_per_device = max_per_device
+        self.timeout = timeout
+        self.pipeline = pipeline
+        self._jobs: Dict[str, _Job] = {}
+        self._cancelled: Optional[str] = None
+
+    def cancel(self, reason: str = "已取消") -> None:
+        """取消全部任务（在事件循环中调用）"""
+        if self._cancelled is None:
+            print_warning(f"正在终止全部任务: {reason}")
+            self._cancelled = reason
+        for job in self._jobs.values():
+            job.cancel(reason)
+
+    def run_jobs(
+        self,
+        jobs: Dict[str, Sequence[Callable[[], bool]]],
+        job_paths: Dict[str, List[Union[str, Path]]]
+    ) -> Dict[str, Dict]:
+        """
+        执行全部任务并等待结束
+
+        Args:
+            jobs: 任务名称到阶段函数列表的映射，阶段函数返回是否成功，失败时不再执行后续阶段
+            job_paths: 任务名称到其涉及路径的映射，用于确定占用的设备
+
+        Returns:
+            Dict[str, Dict]: 每个任务的结果（success、duration、devices、error），按提交顺序排列
+        """
+        self._jobs = {}
+        self._cancelled = None
+        return asyncio.run(self._run_all(jobs, job_paths))
+
+    async def _run_all(
+        self,
+        jobs: Dict[str, Sequence[Callable[[], bool]]],
+        job_paths: Dict[str, List[Union[str, Path]]]
+    ) -> Dict[str, Dict]:
+        loop = asyncio.get_running_loop()
+        if not self.pipeline:
+            jobs = {name: [lambda stages=stages: all(stage() for stage in stages)] for name, stages in jobs.items()}
+        depth = max((len(stages) for stages in jobs.values()), default=1)
+        slots = [asyncio.Semaphore(self.max_workers) for _ in range(depth)]
+        limiter = DeviceLimiter(self.max_per_device)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers * depth)
+        # 阶段函数无法从外部中断，任务超时后仍需等待其返回
+        running: List[asyncio.Future] = []
+        handled = []
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.cancel, "收到终止信号")
+                handled.append(sig)
+            except (RuntimeError, ValueError):
+                # 不在主线程中时无法设置信号处理
+                pass
+        try:
+            results = await asyncio.gather(*(
+                self._run_job(name, stages, job_paths.get(name, []), slots, limiter, executor, running)
+                for name, stages in jobs.items()
+            ))
+            await asyncio.gather(*running, return_exceptions=True)
+        finally:
+            for sig in handled:
+                loop.remove_signal_handler(sig)
+            executor.shutdown(wait=False)
+        return dict(zip(jobs, results))
+
+    async def _run_job(
+        self,
+        name: str,
+        stages: Sequence[Callable[[], bool]],
+        paths: List[Union[str, Path]],
+        slots: List[asyncio.Semaphore],
+        limiter: DeviceLimiter,
+        executor: ThreadPoolExecutor,
+        running: List[asyncio.Future]
+    ) -> Dict:
+        loop = asyncio.get_running_loop()
+        job = self._jobs[name] = _Job(name, loop)
+        devices = sorted({get_physical_device(p) for p in paths})
+        start = None
+        timer: Optional[asyncio.TimerHandle] = None
+        expired = []
+
+        def expire() -> None:
+            expired.append(True)
+            job.cancel(f"任务超过 {self.timeout} 秒未完成")
+            task.cancel()
+
+        async def run_stages() -> bool:
+            nonlocal start, timer
+            for slot, stage in zip(slots, stages):
+                async with slot, limiter.acquire(devices):
+                    if self._cancelled is not None:
+                        job.cancel(self._cancelled)
+                    if job.reason is not None:
+                        return False
+                    if start is None:
+                        # 超时从任务开始运行时计算，不包括排队等待的时间
+                        start = time.time()
+                        if self.timeout:
+                            timer = loop.call_later(self.timeout, expire)
+                    context = contextvars.copy_context()
+                    context.run(_current_job.set, job)
+                    future = loop.run_in_executor(executor, context.run, stage)
+                    running.append(future)
+                    if not await asyncio.shield(future):
+                        return False
+            return True
+
+        error = None
+        task = asyncio.ensure_future(run_stages())
+        try:
+            success = await task
+        except asyncio.CancelledError:
+            if not expired:
+                raise
+            success = False
+            error = job.reason
+            print_error(f"{name}: {error}，已终止")
+        except Exception as e:
+            success = False
+            error = job.reason if isinstance(e, JobCancelled) and job.reason else str(e)
+            print_error(f"任务执行异常 {name}: {error}")
+        finally:
+            if timer is not None:
+                timer.cancel()
+        if job.reason is not None and error is None:
+            error = job.reason
+        return {
+            "success": success,
+            "duration": round(time.time() - start, 2) if start is not None else 0.0,
+            "devices": devices,
+            "error": error
+        }
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import re
+import sys
+import time
+import threading
+from typing import Callable, Dict, Optional
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+from config.settings import PROGRESS_INTERVAL, PROGRESS_BARS
+from .utils import print_info, set_line_writer
+
+# rsync --info=progress2 的进度行，如 "  1,234,567  12%  1.23MB/s    0:00:10"
+_RSYNC_PROGRESS = re.compile(r"^\s*([\d,]+)\s+(\d+)%")
+
+class ProgressReporter:
+    """
+    汇总多个并行任务的进度
+
+    各任务通过回调报告已完成的字节数。终端中安装了tqdm时每个任务显示一个进度条，
+    其他情况下由后台线程按固定间隔输出一行汇总，避免多个任务各自的进度输出在终端上交错。
+    """
+
+    def __init__(self, totals: Dict[str, int], label: str = "进度", interval: float = PROGRESS_INTERVAL,
+                 bars: bool = PROGRESS_BARS):
+        """
+        初始化进度汇总
+
+        Args:
+            totals: 任务名称到预计总字节数的映射
+            label: 输出前缀
+            interval: 输出间隔（秒）
+            bars: 是否在终端中显示进度条
+        """
+        self.totals = dict(totals)
+        self.label = label
+        self.interval = interval
+        self._done: Dict[str, int] = {name: 0 for name in totals}
+        self._active: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_time = time.time()
+        self._use_bars = bars and tqdm is not None and sys.stdout.isatty()
+        self._bars: Dict[str, "tqdm"] = {}
+
+    def start(self, name: str) -> None:
+        """标记任务开始"""
+        with self._lock:
+            self._active[name] = True
+
+    def finish(self, name: str) -> None:
+        """标记任务结束"""
+        with self._lock:
+            self._active[name] = False
+
+    def advance(self, name: str, nbytes: int) -> None:
+        """累加任务已完成的字节数"""
+        with self._lock:
+            self._done[name] = self._done.get(name, 0) + nbytes
+            bar = self._bars.get(name)
+            if bar is not None:
+                bar.update(nbytes)
+
+    def update(self, name: str, done_bytes: int) -> None:
+        """设置任务已完成的字节数"""
+        with self._lock:
+            bar = self._bars.get(name)
+            if bar is not None:
+                bar.update(done_bytes - self._done.get(name, 0))
+            self._done[name] = done_bytes
+
+    def callback(self, name: str) -> Callable[[int], None]:
+        """返回供复制函数调用的累加回调"""
+        return lambda nbytes: self.advance(name, nbytes)
+
+    def done_bytes(self, name: str) -> int:
+        """任务已完成的字节数"""
+        with self._lock:
+            return self._done.get(name, 0)
+
+    def summary(self) -> str:
+        """生成当前的汇总进度行"""
+        with self._lock:
+            done = sum(self._done.values())
+            active = [name for name, running in self._active.items() if running]
+        total = sum(self.totals.values())
+        elapsed = max(time.time() - self._start_time, 1e-6)
+        percent = done / total * 100 if total else 100.0
+        gb, mb = 1024 ** 3, 1024 ** 2
+        line = (
+            f"{self.label}: {done / gb:.2f}/{total / gb:.2f} GB ({percent:.0f}%)，"
+            f"平均 {done / mb / elapsed:.1f} MB/s"
+        )
+        if active:
+            line += f"，进行中: {', '.join(active)}"
+        return line
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            print_info(self.summary())
+
+    def __enter__(self) -> "ProgressReporter":
+        self._start_time = time.time()
+        if self._use_bars:
+            for position, (name, total) in enumerate(self.totals.items()):
+                self._bars[name] = tqdm(
+                    total=total, desc=name, unit="B", unit_scale=True, unit_divisor=1024,
+                    position=position, dynamic_ncols=True
+                )
+            # 信息行改由tqdm输出，显示在进度条上方而不打断进度条
+            set_line_writer(lambda line, stream: tqdm.write(line, file=stream))
+        else:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._bars:
+            set_line_writer(None)
+            for bar in self._bars.values():
+                bar.close()
+            self._bars = {}
+            print_info(self.summary())
+
+def parse_rsync_progress(line: str) -> Optional[int]:
+    """
+    解析 rsync --info=progress2 的一行输出
+
+    rsync用回车符刷新同一行，调用方应按回车和换行拆分输出。
+
+    Args:
+        line: 一行输出
+
+    Returns:
+        Optional[int]: 累计传输字节数，非进度行返回None
+    """
+    match = _RSYNC_PROGRESS.match(line)
+    if match:
+        return int(match.group(1).replace(",", ""))
+    return None
@@ -2,25 +2,55 @@
 
 import os
 import time
+import shutil
+import threading
+import subprocess
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Tuple
+from typing import Callable, Optional, Dict, List, Tuple
 
 from config.settings import (
     BACKUP_ROOT,
-    #BACKUP_PREFIX,
+    BACKUP_PREFIX,
     MIN_FREE_SPACE_GB,
     RESTORE_PATHS,
+    RESTORE_SOURCES,
+    SOURCE_PATHS,
     RSYNC_OPTIONS,
-    VERIFY_CHECKSUM
+    VERIFY_CHECKSUM,
+    CHUNKSTORE_DIR,
+    RESTORE_ENGINES,
+    RESTORE_PLAN,
+    COPY_WORKERS,
+    PARALLEL_RESTORE,
+    RESTORE_WORKERS,
+    MAX_JOBS_PER_DEVICE,
+    RESTORE_VERIFY_MODE,
+    VERIFY_DROP_CACHE,
+    PROCESS_IDLE_TIMEOUT
 )
+from .archive import ArchiveReader, extract_archive, get_archive_path, load_archive_index
+from .chunkstore import ChunkStore, get_recipe_path, load_recipe, restore_file, restore_tree
+from .diff import plan_restore
+from .file_index import DIR, FILE, SYMLINK, IndexEntry, load_file_index, search_file_index
+from .local_copy import copy_file, finish_restore, sync_tree
+from .manifest import SIZE, MTIME_NS, MODE, get_manifest_path, load_manifest, verify_tree
+from .metrics import RunMetrics
+from .pack import SIZE as PACK_SIZE, extract_packed_files, get_pack_dir, load_pack_index, unpack_tree
+from .parallel import JobRunner, run_process
+from .progress import ProgressReporter, parse_rsync_progress
+from .scanner import FileIndex, scan_tree
+from .snapshot import get_latest_snapshot, list_snapshots
+from .throttle import IOScheduler, apply_priority
 from .utils import (
-    get_dir_size_gb,
+    get_physical_device,
     get_disk_free_gb,
     verify_path_exists,
-    calculate_checksum,
     format_duration,
     print_info,
+    print_warning,
     print_error
 )
 
@@ -36,10 +66,44 @@ class RestoreManager:
         self.restore_paths = RESTORE_PATHS.get(disk_model)
         if not self.restore_paths:
             raise ValueError(f"未找到硬盘型号 {disk_model} 的恢复路径配置")
+        # 各恢复目录在备份中的目录名（源路径的basename，与恢复位置的目录名可以不同）
+        self.sources = {name: self._backup_name(name, dst_path) for name, dst_path in self.restore_paths.items()}
+        # 备份中各目录的文件索引和数据量，供空间预检、进度汇总和后续步骤共用
+        self.indexes: Dict[str, FileIndex] = {}
+        self.entry_sizes: Dict[str, int] = {}
+        # 各目录的差异恢复计划，没有计划的目录按引擎完整恢复
+        self.plans: Dict[str, Dict] = {}
+        # 本次恢复的阶段统计
+        self.metrics = RunMetrics("restore")
+        # 各目录的复制和验证作为任务阶段调度，rsync子进程由其事件循环管理
+        self.runner = JobRunner(RESTORE_WORKERS if PARALLEL_RESTORE else 1, MAX_JOBS_PER_DEVICE)
+        # 恢复的带宽限制，恢复期间按恢复位置所在磁盘的延迟自适应调整
+        self.io = IOScheduler()
             
+    @staticmethod
+    def _backup_name(name: str, dst_path: str) -> str:
+        """
+        获取恢复目录在备份中的目录名
+        
+        按 RESTORE_SOURCES 找到对应的源目录，取其路径的basename；没有配置时使用恢复位置的basename。
+        
+        Args:
+            name: 恢复目录名称
+            dst_path: 恢复位置
+            
+        Returns:
+            str: 备份中的目录名
+        """
+        source = RESTORE_SOURCES.get(name)
+        if source in SOURCE_PATHS:
+            return os.path.basename(SOURCE_PATHS[source].rstrip("/"))
+        if source is not None:
+            print_warning(f"恢复目录 {name} 对应的源目录 {source} 不在 SOURCE_PATHS 中")
+        return os.path.basename(dst_path.rstrip("/"))
+    
     def _get_latest_backup(self) -> Optional[Path]:
         """
-        获取最新的备份目录
+        获取最新的成功完成的备份目录
         
         Returns:
             Optional[Path]: 最新备份目录的路径，如果没有找到则返回None
@@ -48,42 +112,68 @@ class RestoreManager:
             print_error(f"备份根目录不存在: {BACKUP_ROOT}")
             return None
             
-        backup_dirs = [
-            d for d in Path(BACKUP_ROOT).iterdir()
-            if d.is_dir() and d.name.startswith(BACKUP_PREFIX)
-        ]
+        # 失败或中断的备份留下的快照可能不完整，只使用备份记录中成功完成的最新快照
+        backup_dir = get_latest_snapshot(BACKUP_ROOT)
         
-        if not backup_dirs:
-            print_error("未找到任何备份目录")
+        if not backup_dir:
+            print_error("未找到任何成功完成的备份目录")
             return None
             
-        # 按日期排序，返回最新的
-        return sorted(backup_dirs, key=lambda x: x.name)[-1]
+        return Path(backup_dir)
     
-    def _verify_restore(self, src_path: Path, dst_path: Path) -> bool:
+    def _verify_restore(self, name: str, dst_path: str, backup_dir: Path) -> bool:
         """
-        验证恢复的完整性
+        按备份中的清单验证恢复结果，只读取恢复后的目录
+        
+        备份中没有清单时（如抽样验证模式的备份），退回到与备份目录索引比较大小和修改时间。
         
         Args:
-            src_path: 源路径（备份目录）
-            dst_path: 目标路径（恢复位置）
+            name: 恢复目录名称
+            dst_path: 恢复位置
+            backup_dir: 备份目录
             
         Returns:
             bool: 验证是否通过
         """
         if not VERIFY_CHECKSUM:
             return True
-            
-        src_checksum = calculate_checksum(src_path)
-        dst_checksum = calculate_checksum(dst_path)
         
-        if src_checksum != dst_checksum:
-            print_error(f"恢复验证失败: {dst_path}")
-            print_error(f"源校验和: {src_checksum}")
-            print_error(f"目标校验和: {dst_checksum}")
-            return False
-            
-        return True
+        manifest = load_manifest(get_manifest_path(backup_dir, self.sources[name]))
+        full = RESTORE_VERIFY_MODE == "full"
+        if manifest is None:
+            index = self.indexes.get(name)
+            if index is None and name not in self.plans:
+                print_warning(f"备份中没有清单，跳过恢复验证: {name}")
+                return True
+            print_warning(f"备份中没有清单，只比较大小和修改时间: {name}")
+            full = False
+            if index is None:
+                manifest = {"entries": self.plans[name]["entries"]}
+            else:
+                manifest = {
+                    "entries": {
+                        rel_path: [st.st_size, st.st_mtime_ns, st.st_mode, None, None]
+                        for rel_path, st in index.files.items()
+                    }
+                }
+        
+        dst_index = scan_tree(dst_path, RSYNC_OPTIONS.get("exclude", []))
+        report = verify_tree(
+            manifest, dst_index, full, drop_cache=VERIFY_DROP_CACHE, throttle=self.io.throttle("restore")
+        )
+        method = "校验和" if full and not report["missing"] and not report["mismatched"] else "大小和修改时间"
+        print_info(
+            f"恢复验证 {name}: 共 {len(manifest['entries'])} 个文件，"
+            f"按{method}检查，计算校验和 {len(report['hashed'])} 个"
+        )
+        for rel_path in report["extra"]:
+            print_warning(f"恢复目录中存在备份以外的文件: {rel_path}")
+        for rel_path in report["missing"]:
+            print_error(f"恢复后文件不存在: {rel_path}")
+        for rel_path in report["mismatched"]:
+            print_error(f"恢复后文件不一致: {rel_path}")
+        
+        return not report["missing"] and not report["mismatched"]
     
     def _check_space_requirements(self, backup_dir: Path) -> Tuple[bool, float, float]:
         """
@@ -95,11 +185,31 @@ class RestoreManager:
         Returns:
             Tuple[bool, float, float]: (是否满足要求, 需要的空间, 可用空间)
         """
-        # 计算所需空间
+        # 计算所需空间（每个备份目录只扫描一次，块存储、归档和打包备份直接按配方或索引统计，
+        # 有差异计划的目录只计算需要传输的部分）
+        self.indexes = {}
+        self.entry_sizes = {}
+        for name, source in self.sources.items():
+            if name in self.plans:
+                self.entry_sizes[name] = self.plans[name]["bytes"]
+                continue
+            recipe = load_recipe(get_recipe_path(backup_dir, source))
+            if recipe is None:
+                recipe = load_archive_index(get_archive_path(backup_dir, source))
+            if recipe is None:
+                pack_index = load_pack_index(get_pack_dir(backup_dir, source))
+                if pack_index is not None:
+                    self.entry_sizes[name] = sum(entry[PACK_SIZE] for entry in pack_index["files"].values())
+                    continue
+            if recipe is not None:
+                self.entry_sizes[name] = sum(entry["size"] for entry in recipe["files"].values())
+                continue
+            self.indexes[name] = scan_tree(os.path.join(backup_dir, source))
+            self.entry_sizes[name] = self.indexes[name].total_size
         total_size = sum(
-            get_dir_size_gb(os.path.join(backup_dir, os.path.basename(path)))
-            for path in self.restore_paths.values()
-        )
+            self.plans[name]["required_bytes"] if name in self.plans else size
+            for name, size in self.entry_sizes.items()
+        ) / (1024 ** 3)
         
         # 检查目标磁盘剩余空间
         available_space = get_disk_free_gb("/")
@@ -111,15 +221,386 @@ class RestoreManager:
                 total_size,
                 available_space)
     
-    def perform_restore(self) -> bool:
+    def _build_rsync_command(self, src_path: str, dst_path: str) -> List[str]:
+        """
+        构建恢复用的rsync命令
+        
+        本地到本地的复制不压缩；进度以 --info=progress2 输出，由进度汇总读取。
+        恢复阶段设有带宽上限时加上 --bwlimit。
+        
+        Args:
+            src_path: 备份中的目录
+            dst_path: 恢复位置
+            
+        Returns:
+            List[str]: rsync命令及其参数列表
+        """
+        cmd = ["rsync", "-a", "--delete", "--info=progress2"]
+        if RSYNC_OPTIONS.get("sparse"):
+            cmd.append("--sparse")
+        cmd.extend(self.io.rsync_args("restore"))
+        cmd.extend([str(src_path).rstrip("/") + "/", str(dst_path).rstrip("/") + "/"])
+        return cmd
+    
+    def _restore_entry(self, name: str, dst_path: str, backup_dir: Path, progress: ProgressReporter) -> bool:
+        """
+        恢复单个目录（验证由 _verify_entry 完成）
+        
+        Args:
+            name: 恢复目录名称
+            dst_path: 恢复位置
+            backup_dir: 备份目录
+            progress: 进度汇总
+            
+        Returns:
+            bool: 恢复是否成功
+        """
+        plan = self.plans.get(name)
+        with self.metrics.phase("transfer", name) as counters:
+            if plan is not None:
+                transferred = self._apply_plan(name, dst_path, backup_dir, plan, progress)
+                counters["files"] = len(plan["create"]) + len(plan["update"])
+            else:
+                transferred = self._transfer_entry(name, dst_path, backup_dir, progress)
+            counters["bytes"] = progress.done_bytes(name)
+        return transferred
+    
+    def _verify_entry(self, name: str, dst_path: str, backup_dir: Path) -> bool:
+        """
+        验证恢复后的单个目录，作为任务的第二个阶段执行，可与下一个目录的复制同时进行
+        
+        Args:
+            name: 恢复目录名称
+            dst_path: 恢复位置
+            backup_dir: 备份目录
+            
+        Returns:
+            bool: 验证是否通过
+        """
+        plan = self.plans.get(name)
+        with self.metrics.phase("verify", name) as counters:
+            if plan is not None:
+                counters["files"] = len(plan["entries"])
+                counters["bytes"] = sum(entry[SIZE] for entry in plan["entries"].values())
+            if not self._verify_restore(name, dst_path, backup_dir):
+                print_error(f"恢复验证失败: {name}")
+                return False
+        return True
+    
+    def _transfer_entry(self, name: str, dst_path: str, backup_dir: Path, progress: ProgressReporter) -> bool:
+        """
+        按备份格式把单个目录复制到恢复位置
+        
+        Args:
+            name: 恢复目录名称
+            dst_path: 恢复位置
+            backup_dir: 备份目录
+            progress: 进度汇总
+            
+        Returns:
+            bool: 恢复是否成功
+        """
+        source = self.sources[name]
+        src_path = os.path.join(backup_dir, source)
+        on_bytes = progress.callback(name)
+        
+        # 块存储备份按配方重建文件
+        recipe = load_recipe(get_recipe_path(backup_dir, source))
+        if recipe is not None:
+            print_info(f"恢复 {name}: 块存储配方 -> {dst_path}")
+            return restore_tree(recipe, ChunkStore(CHUNKSTORE_DIR), dst_path, progress=on_bytes)
+        
+        # 打包备份顺序读取包文件解包
+        pack_dir = get_pack_dir(backup_dir, source)
+        if os.path.exists(pack_dir):
+            print_info(f"恢复 {name}: {pack_dir} -> {dst_path}")
+            return unpack_tree(pack_dir, dst_path, progress=on_bytes)
+        
+        # 归档备份按尾部索引解压
+        archive_path = get_archive_path(backup_dir, source)
+        if os.path.exists(archive_path):
+            print_info(f"恢复 {name}: {archive_path} -> {dst_path}")
+            return extract_archive(archive_path, dst_path, progress=on_bytes)
+        
+        if not os.path.exists(src_path):
+            print_error(f"备份源路径不存在: {src_path}")
+            return False
+            
+        print_info(f"恢复 {name}: {src_path} -> {dst_path}")
+        
+        # 确保目标目录存在
+        if not verify_path_exists(os.path.dirname(dst_path), create=True):
+            return False
+            
+        if RESTORE_ENGINES.get(name, "rsync") == "native":
+            # 本地复制引擎，直接复用空间预检时生成的备份目录索引
+            index = self.indexes.get(name) or scan_tree(src_path)
+            stats = sync_tree(index, dst_path, delete=True, progress=on_bytes, throttle=self.io.throttle("restore"))
+            print_info(
+                f"{name}: 复制 {stats['copied_files']} 个文件，"
+                f"未变化 {stats['skipped_files']} 个，删除 {stats['deleted']} 个"
+            )
+            if stats["errors"]:
+                return False
+        else:
+            # rsync的逐文件输出不再直接打印，进度汇总后统一输出
+            last = [0]
+            
+            def on_line(line: str) -> Optional[int]:
+                done = parse_rsync_progress(line)
+                if done is None:
+                    return None
+                # 返回新传输的字节数，自适应限速降低速度时据此暂停rsync
+                delta = done - last[0]
+                last[0] = done
+                progress.update(name, done)
+                return delta
+            
+            try:
+                run_process(
+                    self._build_rsync_command(src_path, dst_path),
+                    on_line=on_line,
+                    on_stderr=print_warning,
+                    throttle=self.io.throttle("restore"),
+                    idle_timeout=PROCESS_IDLE_TIMEOUT
+                )
+            except subprocess.CalledProcessError as e:
+                print_error(f"rsync 返回错误码 {e.returncode}: {name}")
+                return False
+            except subprocess.TimeoutExpired:
+                print_error(f"rsync 超过 {PROCESS_IDLE_TIMEOUT} 秒没有进度输出，已终止: {name}")
+                return False
+            except (subprocess.SubprocessError, OSError) as e:
+                print_error(f"恢复失败 {name}: {e}")
+                return False
+            progress.update(name, self.entry_sizes.get(name, 0))
+        return True
+    
+    def _load_listing(self, backup_dir: Path, source: str) -> Optional[Dict]:
+        """
+        读取备份中一个目录的内容清单：文件来自清单，目录和符号链接来自快照文件索引
+        
+        Args:
+            backup_dir: 备份目录
+            source: 备份中的目录名
+            
+        Returns:
+            Optional[Dict]: entries（清单格式的文件条目）、dirs、symlinks（未知时为None），
+            两者都没有时返回None
+        """
+        manifest = load_manifest(get_manifest_path(backup_dir, source))
+        index_entries = load_file_index(backup_dir, source)
+        if manifest is None and index_entries is None:
+            return None
+        listing: Dict = {"entries": manifest["entries"] if manifest else {}, "dirs": None, "symlinks": None}
+        if index_entries is not None:
+            listing["dirs"] = {entry.rel_path: entry.mode for entry in index_entries if entry.type == DIR}
+            listing["symlinks"] = {entry.rel_path: entry.target for entry in index_entries if entry.type == SYMLINK}
+            if manifest is None:
+                listing["entries"] = {
+                    entry.rel_path: [entry.size, entry.mtime_ns, entry.mode, None, None]
+                    for entry in index_entries if entry.type == FILE
+                }
+        return listing
+    
+    def _build_plan(self, name: str, dst_path: str, backup_dir: Path) -> Optional[Dict]:
+        """
+        扫描恢复位置并与备份清单比较，生成差异恢复计划
+        
+        Args:
+            name: 恢复目录名称
+            dst_path: 恢复位置
+            backup_dir: 备份目录
+            
+        Returns:
+            Optional[Dict]: 恢复计划（见 plan_restore），另含 entries、dirs、symlinks
+            和只需修正权限的文件 chmod；备份中没有清单时返回None
+        """
+        listing = self._load_listing(backup_dir, self.sources[name])
+        if listing is None:
+            return None
+        dst_index = scan_tree(dst_path, RSYNC_OPTIONS.get("exclude", []))
+        entries = listing["entries"]
+        plan = plan_restore(
+            {rel_path: (entry[SIZE], entry[MTIME_NS]) for rel_path, entry in entries.items()},
+            dst_index,
+            listing["dirs"],
+            listing["symlinks"]
+        )
+        plan["chmod"] = [
+            rel_path for rel_path in plan["unchanged"]
+            if (dst_index.files[rel_path].st_mode & 0o7777) != (entries[rel_path][MODE] & 0o7777)
+        ]
+        plan.update(listing)
+        return plan
+    
+    def _print_plan(self, name: str, dst_path: str, plan: Dict) -> None:
+        """按 rsync --dry-run 的方式列出计划中的操作"""
+        print_info(
+            f"{name} -> {dst_path}: 新建 {len(plan['create'])} 个，更新 {len(plan['update'])} 个，"
+            f"删除 {len(plan['delete']) + len(plan['delete_dirs'])} 个，未变化 {len(plan['unchanged'])} 个，"
+            f"需传输 {plan['bytes'] / (1024 ** 3):.2f} GB"
+        )
+        for rel_path in sorted(plan["delete_dirs"]):
+            print_info(f"  - {rel_path}/")
+        for rel_path in sorted(plan["delete"]):
+            print_info(f"  - {rel_path}")
+        for rel_path in sorted(plan["create"]):
+            print_info(f"  + {rel_path}")
+        for rel_path in sorted(plan["update"]):
+            print_info(f"  * {rel_path}")
+        for rel_path in sorted(plan["links"]):
+            print_info(f"  + {rel_path} -> {plan['symlinks'][rel_path]}")
+        for rel_path in sorted(plan["chmod"]):
+            print_info(f"  . {rel_path}")
+    
+    def _fetch_files(
+        self,
+        source: str,
+        backup_dir: Path,
+        targets: Dict[str, str],
+        progress: Optional[Callable[[int], None]] = None
+    ) -> bool:
+        """
+        按备份格式把指定文件写到目标位置
+        
+        打包备份按包内顺序读取；其他格式由线程池并行处理，归档备份每个线程使用自己的读取器。
+        
+        Args:
+            source: 备份中的目录名
+            backup_dir: 备份目录
+            targets: 相对路径到目标文件路径的映射
+            progress: 进度回调，参数为新写入的字节数
+            
+        Returns:
+            bool: 是否全部写入成功
+        """
+        if not targets:
+            return True
+        recipe = load_recipe(get_recipe_path(backup_dir, source))
+        pack_dir = get_pack_dir(backup_dir, source)
+        archive_path = get_archive_path(backup_dir, source)
+        readers: List[ArchiveReader] = []
+        if recipe is not None:
+            store = ChunkStore(CHUNKSTORE_DIR)
+            
+            def fetch(rel_path: str, dst_file: str) -> None:
+                restore_file(recipe["files"][rel_path], store, dst_file)
+        elif os.path.exists(pack_dir):
+            return extract_packed_files(pack_dir, targets, progress)
+        elif os.path.exists(archive_path):
+            local = threading.local()
+            
+            def fetch(rel_path: str, dst_file: str) -> None:
+                reader = getattr(local, "reader", None)
+                if reader is None:
+                    reader = local.reader = ArchiveReader(archive_path)
+                    readers.append(reader)
+                reader.extract_file(rel_path, dst_file)
+        else:
+            src_root = os.path.join(backup_dir, source)
+            throttle = self.io.throttle("restore")
+            
+            def fetch(rel_path: str, dst_file: str) -> None:
+                src_file = os.path.join(src_root, rel_path)
+                os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+                copy_file(src_file, dst_file, os.lstat(src_file), throttle=throttle)
+        
+        ok = True
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, COPY_WORKERS)) as executor:
+                futures = {
+                    executor.submit(fetch, rel_path, dst_file): rel_path
+                    for rel_path, dst_file in sorted(targets.items())
+                }
+                for future in as_completed(futures):
+                    rel_path = futures[future]
+                    try:
+                        future.result()
+                    except (OSError, KeyError, ValueError, RuntimeError) as e:
+                        print_error(f"恢复文件失败 {rel_path}: {e}")
+                        ok = False
+                        continue
+                    if progress:
+                        progress(os.path.getsize(targets[rel_path]))
+        finally:
+            for reader in readers:
+                reader.close()
+        return ok
+    
+    def _apply_plan(self, name: str, dst_path: str, backup_dir: Path, plan: Dict, progress: ProgressReporter) -> bool:
+        """
+        执行差异恢复计划：删除多余条目，只传输新建和更新的文件，修正权限和符号链接
+        
+        Args:
+            name: 恢复目录名称
+            dst_path: 恢复位置
+            backup_dir: 备份目录
+            plan: 恢复计划
+            progress: 进度汇总
+            
+        Returns:
+            bool: 恢复是否成功
+        """
+        print_info(
+            f"恢复 {name}: 差异计划 -> {dst_path}（新建 {len(plan['create'])}，更新 {len(plan['update'])}，"
+            f"删除 {len(plan['delete']) + len(plan['delete_dirs'])}，未变化 {len(plan['unchanged'])}）"
+        )
+        if not verify_path_exists(os.path.dirname(dst_path), create=True):
+            return False
+        
+        for rel_path in plan["delete"]:
+            try:
+                os.remove(os.path.join(dst_path, rel_path))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print_warning(f"删除多余文件失败 {rel_path}: {e}")
+        for rel_path in sorted(plan["delete_dirs"], reverse=True):
+            shutil.rmtree(os.path.join(dst_path, rel_path), ignore_errors=True)
+        
+        dirs = plan["dirs"] or {}
+        try:
+            os.makedirs(dst_path, exist_ok=True)
+            for rel_path in sorted(dirs):
+                os.makedirs(os.path.join(dst_path, rel_path), exist_ok=True)
+        except OSError as e:
+            print_error(f"创建目录失败 {dst_path}: {e}")
+            return False
+        
+        targets = {rel_path: os.path.join(dst_path, rel_path) for rel_path in plan["create"] + plan["update"]}
+        ok = self._fetch_files(self.sources[name], backup_dir, targets, progress.callback(name))
+        
+        # 内容未变化、只有权限不同的文件直接修正权限
+        for rel_path in plan["chmod"]:
+            try:
+                os.chmod(os.path.join(dst_path, rel_path), plan["entries"][rel_path][MODE] & 0o7777)
+            except OSError as e:
+                print_warning(f"修正权限失败 {rel_path}: {e}")
+        
+        symlinks = {rel_path: plan["symlinks"][rel_path] for rel_path in plan["links"]}
+        if not finish_restore(dst_path, plan["entries"], dirs, symlinks, delete=False):
+            ok = False
+        return ok
+    
+    def perform_restore(self, dry_run: bool = False) -> bool:
         """
         执行恢复操作
         
+        各目录在线程池中并行恢复，同一物理设备上的并发数受 MAX_JOBS_PER_DEVICE 限制。
+        备份中有清单时先与恢复位置比较，只传输有差异的文件。
+        
+        Args:
+            dry_run: 只列出差异计划，不修改恢复位置
+        
         Returns:
             bool: 恢复是否成功
         """
         start_time = time.time()
         print_info(f"开始恢复 - {datetime.now()}")
+        # 在创建恢复线程之前降低优先级，线程和rsync子进程都会继承
+        apply_priority()
+        self.metrics = RunMetrics("restore")
         
         # 获取最新备份
         backup_dir = self._get_latest_backup()
@@ -128,8 +609,26 @@ class RestoreManager:
             
         print_info(f"使用备份目录: {backup_dir}")
         
+        # 生成差异计划（只读取恢复位置的元数据）
+        self.plans = {}
+        if RESTORE_PLAN or dry_run:
+            with self.metrics.phase("plan") as counters:
+                for name, dst_path in self.restore_paths.items():
+                    plan = self._build_plan(name, dst_path, backup_dir)
+                    if plan is not None:
+                        self.plans[name] = plan
+                        counters["files"] += len(plan["entries"])
+        if dry_run:
+            for name, dst_path in self.restore_paths.items():
+                if name in self.plans:
+                    self._print_plan(name, dst_path, self.plans[name])
+                else:
+                    print_info(f"{name} -> {dst_path}: 备份中没有清单，将完整恢复")
+            return True
+        
         # 检查空间要求
-        space_ok, total_size, available_space = self._check_space_requirements(backup_dir)
+        with self.metrics.phase("space_check"):
+            space_ok, total_size, available_space = self._check_space_requirements(backup_dir)
         if not space_ok:
             print_error(
                 f"目标磁盘空间不足。需要: {total_size + MIN_FREE_SPACE_GB:.2f} GB, "
@@ -137,45 +636,197 @@ class RestoreManager:
             )
             return False
         
-        # 执行恢复
-        success = True
-        for name, dst_path in self.restore_paths.items():
-            src_path = os.path.join(backup_dir, os.path.basename(dst_path))
-            if not os.path.exists(src_path):
-                print_error(f"备份源路径不存在: {src_path}")
-                success = False
-                continue
-                
-            print_info(f"恢复 {name}: {src_path} -> {dst_path}")
+        # 执行恢复（并行模式下不同设备上的目录同时进行；一个目录验证时可开始下一个的复制）
+        job_paths = {
+            name: [os.path.join(backup_dir, self.sources[name]), dst_path]
+            for name, dst_path in self.restore_paths.items()
+        }
+        # 监视恢复位置所在磁盘（恢复时的生产磁盘）的I/O延迟，前台负载较重时降低恢复速度
+        self.io = IOScheduler({get_physical_device(dst_path) for dst_path in self.restore_paths.values()})
+        with self.metrics.phase("restore") as counters, \
+                ProgressReporter(self.entry_sizes, "恢复进度") as progress, self.io:
             
-            # 确保目标目录存在
-            if not verify_path_exists(os.path.dirname(dst_path), create=True):
-                success = False
-                continue
-                
-            try:
-                import subprocess
-                # 构建rsync命令
-                cmd = ["rsync", "-avz", "--delete"]
-                if RSYNC_OPTIONS["progress"]:
-                    cmd.append("--info=progress2")
-                cmd.extend([str(src_path) + "/", str(dst_path) + "/"])
-                
-                # 执行rsync
-                subprocess.run(cmd, check=True)
-                
-                # 验证恢复
-                if not self._verify_restore(Path(src_path), Path(dst_path)):
-                    print_error(f"恢复验证失败: {name}")
-                    success = False
-                    
-            except subprocess.SubprocessError as e:
-                print_error(f"恢复失败 {name}: {e}")
-                success = False
+            def transfer(name: str, dst_path: str) -> bool:
+                progress.start(name)
+                try:
+                    return self._restore_entry(name, dst_path, backup_dir, progress)
+                finally:
+                    progress.finish(name)
+            
+            jobs = {
+                name: [
+                    lambda name=name, dst_path=dst_path: transfer(name, dst_path),
+                    lambda name=name, dst_path=dst_path: self._verify_entry(name, dst_path, backup_dir)
+                ]
+                for name, dst_path in self.restore_paths.items()
+            }
+            results = self.runner.run_jobs(jobs, job_paths)
+            counters["bytes"] = sum(progress.done_bytes(name) for name in self.restore_paths)
+        
+        # 每个目录的恢复结果
+        print_info("恢复结果:")
+        for name, result in results.items():
+            status = "成功" if result["success"] else "失败"
+            line = (
+                f"  {name}: {status}，耗时 {format_duration(result['duration'])}，"
+                f"{progress.done_bytes(name) / (1024 ** 3):.2f} GB，设备 {', '.join(result['devices'])}"
+            )
+            if result["error"]:
+                line += f"，错误: {result['error']}"
+            print_info(line)
+        success = all(result["success"] for result in results.values())
         
         if success:
             end_time = time.time()
             duration = format_duration(end_time - start_time)
             print_info(f"恢复完成 - 耗时: {duration}")
+        else:
+            print_error("部分目录恢复失败")
         
+        self.metrics.finish(success)
+        self.metrics.report()
+        self.metrics.save()
+        return success
+    
+    def _find_backup(self, snapshot: Optional[str] = None) -> Optional[Path]:
+        """
+        查找指定的快照，未指定时使用最新的备份目录
+        
+        Args:
+            snapshot: 快照目录名或日期（YYYY-MM-DD）
+            
+        Returns:
+            Optional[Path]: 备份目录的路径，如果没有找到则返回None
+        """
+        if snapshot is None:
+            return self._get_latest_backup()
+        for path in list_snapshots(BACKUP_ROOT):
+            if os.path.basename(path) in (snapshot, f"{BACKUP_PREFIX}{snapshot}"):
+                return Path(path)
+        print_error(f"未找到快照: {snapshot}")
+        return None
+    
+    def _search_backup(self, pattern: str, snapshot: Optional[str]) -> Tuple[Optional[Path], List[IndexEntry]]:
+        """
+        在备份的文件索引中查找路径
+        
+        Args:
+            pattern: 路径或通配符模式，形如 "<备份目录名>/<相对路径>"
+            snapshot: 快照目录名或日期，None表示最新的备份
+            
+        Returns:
+            Tuple[Optional[Path], List[IndexEntry]]: (备份目录, 匹配的条目)，失败时备份目录为None
+        """
+        backup_dir = self._find_backup(snapshot)
+        if backup_dir is None:
+            return None, []
+        entries = search_file_index(backup_dir, pattern)
+        if entries is None:
+            print_error(f"备份中没有文件索引: {backup_dir}")
+            return None, []
+        return backup_dir, entries
+    
+    def list_entries(self, pattern: str, snapshot: Optional[str] = None) -> bool:
+        """
+        按文件索引列出备份中匹配的路径，不读取备份盘上的目录树
+        
+        Args:
+            pattern: 路径或通配符模式
+            snapshot: 快照目录名或日期，None表示最新的备份
+            
+        Returns:
+            bool: 是否找到匹配的路径
+        """
+        backup_dir, entries = self._search_backup(pattern, snapshot)
+        if backup_dir is None:
+            return False
+        print_info(f"备份目录 {backup_dir} 中匹配 {pattern} 的条目: {len(entries)} 个")
+        for entry in entries:
+            mtime = datetime.fromtimestamp(entry.mtime_ns / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+            line = f"  {entry.type} {entry.size:>15,} {mtime} {entry.path}"
+            if entry.target is not None:
+                line += f" -> {entry.target}"
+            print_info(line)
+        return bool(entries)
+    
+    def _restore_selected_source(self, source: str, entries: List[IndexEntry], backup_dir: Path, dst_root: str) -> bool:
+        """
+        按备份格式恢复同一备份目录中选中的条目，不删除恢复位置中已有的其他文件
+        
+        Args:
+            source: 备份中的目录名
+            entries: 选中的条目
+            backup_dir: 备份目录
+            dst_root: 该目录的恢复位置
+            
+        Returns:
+            bool: 是否全部恢复成功
+        """
+        files = {entry.rel_path: os.path.join(dst_root, entry.rel_path) for entry in entries if entry.type == FILE}
+        dirs = {entry.rel_path: entry.mode for entry in entries if entry.type == DIR}
+        symlinks = {entry.rel_path: entry.target for entry in entries if entry.type == SYMLINK}
+        try:
+            os.makedirs(dst_root, exist_ok=True)
+            for rel_path in sorted(dirs):
+                os.makedirs(os.path.join(dst_root, rel_path), exist_ok=True)
+            for rel_path in symlinks:
+                os.makedirs(os.path.dirname(os.path.join(dst_root, rel_path)), exist_ok=True)
+        except OSError as e:
+            print_error(f"创建目录失败 {dst_root}: {e}")
+            return False
+        
+        ok = self._fetch_files(source, backup_dir, files)
+        if not finish_restore(dst_root, files, dirs, symlinks, delete=False):
+            ok = False
+        return ok
+    
+    def restore_selected(self, pattern: str, snapshot: Optional[str] = None, target: Optional[str] = None) -> bool:
+        """
+        按路径或通配符恢复单个文件或子目录
+        
+        通过备份中的文件索引定位条目，只读取选中的文件，恢复位置中的其他文件保持不变。
+        
+        Args:
+            pattern: 路径或通配符模式，形如 "<备份目录名>/<相对路径>"
+            snapshot: 快照目录名或日期，None表示最新的备份
+            target: 恢复到该目录下（保留 "<备份目录名>/<相对路径>" 结构），None表示恢复到配置的恢复位置
+            
+        Returns:
+            bool: 恢复是否成功
+        """
+        start_time = time.time()
+        apply_priority()
+        backup_dir, entries = self._search_backup(pattern, snapshot)
+        if backup_dir is None:
+            return False
+        if not entries:
+            print_error(f"备份中没有匹配的路径: {pattern}")
+            return False
+        print_info(f"使用备份目录: {backup_dir}")
+        
+        # 备份中的目录名 -> 配置的恢复位置
+        dst_roots = {self.sources[name]: dst_path for name, dst_path in self.restore_paths.items()}
+        by_source: Dict[str, List[IndexEntry]] = defaultdict(list)
+        for entry in entries:
+            by_source[entry.source].append(entry)
+        
+        success = True
+        for source, source_entries in by_source.items():
+            if target is not None:
+                dst_root = os.path.join(target, source)
+            elif source in dst_roots:
+                dst_root = dst_roots[source]
+            else:
+                print_error(f"没有 {source} 的恢复位置配置，请用 --target 指定恢复目录")
+                success = False
+                continue
+            size = sum(entry.size for entry in source_entries) / (1024 ** 2)
+            print_info(f"恢复 {source}: {len(source_entries)} 个条目（{size:.1f} MB） -> {dst_root}")
+            if not self._restore_selected_source(source, source_entries, backup_dir, dst_root):
+                success = False
+        
+        if success:
+            print_info(f"恢复完成 - 耗时: {format_duration(time.time() - start_time)}")
+        else:
+            print_error("部分条目恢复失败")
         return success
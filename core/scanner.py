@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+from config.settings import SCAN_WORKERS
+from .utils import is_excluded, print_warning
+
+class FileIndex:
+    """
+    目录树的内存索引
+
+    记录每个普通文件、目录和符号链接的lstat结果（以"/"分隔的相对路径为键），
+    供空间检查、清单生成、验证和恢复预检共用，避免重复遍历和重复stat。
+    overrides 中的文件内容从其他位置读取（如SQLite数据库的一致性快照）。
+    """
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = str(root)
+        self.files: Dict[str, os.stat_result] = {}
+        self.dirs: Dict[str, os.stat_result] = {}
+        self.symlinks: Dict[str, os.stat_result] = {}
+        self.errors: List[str] = []
+        self.overrides: Dict[str, str] = {}
+
+    @property
+    def total_size(self) -> int:
+        """普通文件的总大小（字节）"""
+        return sum(st.st_size for st in self.files.values())
+
+    def abspath(self, rel_path: str) -> str:
+        """将相对路径转换为读取内容时使用的绝对路径"""
+        return self.overrides.get(rel_path) or os.path.join(self.root, rel_path)
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+def _scan_dir(
+    root: str,
+    rel_dir: str,
+    excludes: Sequence[str]
+) -> Tuple[List[Tuple[str, os.stat_result]], List[str], List[str]]:
+    """
+    扫描单个目录（不递归）
+
+    Returns:
+        Tuple: (条目列表 [(相对路径, lstat结果)], 子目录相对路径列表, 错误信息列表)
+    """
+    items: List[Tuple[str, os.stat_result]] = []
+    subdirs: List[str] = []
+    errors: List[str] = []
+    prefix = rel_dir + "/" if rel_dir else ""
+    try:
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                rel_path = prefix + entry.name
+                if excludes and is_excluded(rel_path, excludes):
+                    continue
+                try:
+                    # DirEntry会缓存lstat结果，每个inode只stat一次
+                    st = entry.stat(follow_symlinks=False)
+                except OSError as e:
+                    errors.append(f"{rel_path}: {e}")
+                    continue
+                items.append((rel_path, st))
+                if stat.S_ISDIR(st.st_mode):
+                    subdirs.append(rel_path)
+    except OSError as e:
+        errors.append(f"{rel_dir or '.'}: {e}")
+    return items, subdirs, errors
+
+def scan_tree(
+    root: Union[str, Path],
+    excludes: Sequence[str] = (),
+    workers: int = SCAN_WORKERS
+) -> FileIndex:
+    """
+    使用os.scandir并行扫描目录树，生成文件索引
+
+    每个目录作为一个任务提交到线程池，子目录在父目录扫描完成后立即并行扫描。
+
+    Args:
+        root: 根目录
+        excludes: 排除模式（与rsync一致）
+        workers: 扫描线程数
+
+    Returns:
+        FileIndex: 文件索引
+    """
+    index = FileIndex(root)
+    root = index.root
+    if not os.path.isdir(root):
+        index.errors.append(f"目录不存在: {root}")
+        return index
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        pending = {executor.submit(_scan_dir, root, "", excludes)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                items, subdirs, errors = future.result()
+                for rel_path, st in items:
+                    if stat.S_ISREG(st.st_mode):
+                        index.files[rel_path] = st
+                    elif stat.S_ISDIR(st.st_mode):
+                        index.dirs[rel_path] = st
+                    elif stat.S_ISLNK(st.st_mode):
+                        index.symlinks[rel_path] = st
+                index.errors.extend(errors)
+                for rel_dir in subdirs:
+                    pending.add(executor.submit(_scan_dir, root, rel_dir, excludes))
+
+    for error in index.errors:
+        print_warning(f"扫描目录时出错 {root}: {error}")
+    return index
+
+def stat_paths(root: Union[str, Path], rel_paths: Iterable[str]) -> FileIndex:
+    """
+    只对给定的相对路径做lstat，生成部分文件索引（不遍历目录）
+
+    Args:
+        root: 根目录
+        rel_paths: 相对路径（使用"/"分隔），不存在的路径被忽略
+
+    Returns:
+        FileIndex: 只包含给定路径的文件索引
+    """
+    index = FileIndex(root)
+    for rel_path in rel_paths:
+        try:
+            st = os.lstat(os.path.join(index.root, rel_path))
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            index.errors.append(f"{rel_path}: {e}")
+            continue
+        if stat.S_ISREG(st.st_mode):
+            index.files[rel_path] = st
+        elif stat.S_ISDIR(st.st_mode):
+            index.dirs[rel_path] = st
+        elif stat.S_ISLNK(st.st_mode):
+            index.symlinks[rel_path] = st
+    return index
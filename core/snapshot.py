@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+from datetime import date, datetime
+from pathlib import Path
+from typing import List, Optional, Set, Union
+
+from config.settings import BACKUP_ROOT, BACKUP_PREFIX, CATALOG_FILE
+from .catalog import BackupCatalog
+from .utils import print_error, print_info, print_warning
+
+SNAPSHOT_DATE_FORMAT = "%Y-%m-%d"
+
+def snapshot_date(path: Union[str, Path]) -> Optional[date]:
+    """
+    从快照目录名解析日期
+
+    Args:
+        path: 快照目录路径，名称形如 backup_YYYY-MM-DD
+
+    Returns:
+        Optional[date]: 快照日期，名称不符合格式时返回None
+    """
+    name = Path(path).name
+    if not name.startswith(BACKUP_PREFIX):
+        return None
+    try:
+        return datetime.strptime(name[len(BACKUP_PREFIX):], SNAPSHOT_DATE_FORMAT).date()
+    except ValueError:
+        return None
+
+def get_snapshot_path(day: date, root: Union[str, Path] = BACKUP_ROOT) -> str:
+    """获取指定日期的快照目录路径"""
+    return os.path.join(str(root), f"{BACKUP_PREFIX}{day.strftime(SNAPSHOT_DATE_FORMAT)}")
+
+def list_snapshots(root: Union[str, Path] = BACKUP_ROOT) -> List[str]:
+    """
+    列出备份根目录下的所有快照，按日期从旧到新排序
+
+    Args:
+        root: 备份根目录
+
+    Returns:
+        List[str]: 快照目录路径列表
+    """
+    if not os.path.isdir(root):
+        return []
+    snapshots = [
+        entry.path for entry in os.scandir(root)
+        if entry.is_dir(follow_symlinks=False) and snapshot_date(entry.path) is not None
+    ]
+    return sorted(snapshots, key=snapshot_date)
+
+def supports_hardlinks(directory: Union[str, Path]) -> bool:
+    """
+    探测目录所在文件系统是否支持硬链接（exFAT、FAT32等不支持）
+
+    Args:
+        directory: 已存在的目录
+
+    Returns:
+        bool: 是否支持硬链接
+    """
+    probe = os.path.join(str(directory), ".hardlink_probe")
+    link = probe + ".link"
+    try:
+        with open(probe, "w"):
+            pass
+        os.link(probe, link)
+        return True
+    except OSError:
+        return False
+    finally:
+        for path in (link, probe):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def prune_snapshots(keep: int, root: Union[str, Path] = BACKUP_ROOT) -> List[str]:
+    """
+    删除最旧的快照，只保留最近的keep个
+
+    Args:
+        keep: 保留的快照数量
+        root: 备份根目录
+
+    Returns:
+        List[str]: 已删除的快照目录
+    """
+    snapshots = list_snapshots(root)
+    removed = []
+    for path in snapshots[:max(0, len(snapshots) - max(1, keep))]:
+        try:
+            shutil.rmtree(path)
+            removed.append(path)
+            print_info(f"已删除旧快照: {path}")
+        except OSError as e:
+            print_error(f"删除旧快照失败 {path}: {e}")
+    return removed
+
+def complete_snapshots(root: Union[str, Path] = BACKUP_ROOT) -> Optional[Set[str]]:
+    """
+    按备份记录找出成功完成的快照
+
+    快照模式的备份记录位于备份根目录，固定目录模式的位于各备份目录中，两处都读取。
+
+    Args:
+        root: 备份根目录
+
+    Returns:
+        Optional[Set[str]]: 最近一次备份成功的目录（绝对路径），没有任何备份记录时返回None
+    """
+    catalog_files = [os.path.join(str(root), CATALOG_FILE)]
+    catalog_files += [os.path.join(path, CATALOG_FILE) for path in list_snapshots(root)]
+    complete: Optional[Set[str]] = None
+    for catalog_file in catalog_files:
+        if os.path.exists(catalog_file):
+            complete = (complete or set()) | BackupCatalog(catalog_file).successful_backup_dirs()
+    return complete
+
+def get_latest_snapshot(root: Union[str, Path] = BACKUP_ROOT, before: Optional[date] = None) -> Optional[str]:
+    """
+    获取最新的成功完成的快照
+
+    失败或中断的备份留下的快照可能不完整，跳过；没有任何备份记录时无法判断，按日期取最新的快照。
+
+    Args:
+        root: 备份根目录
+        before: 只查找早于该日期的快照（可选）
+
+    Returns:
+        Optional[str]: 快照目录路径，不存在时返回None
+    """
+    snapshots = list_snapshots(root)
+    if before is not None:
+        snapshots = [path for path in snapshots if snapshot_date(path) < before]
+    complete = complete_snapshots(root)
+    for path in reversed(snapshots):
+        if complete is None or os.path.abspath(path) in complete:
+            return path
+        print_warning(f"快照未成功完成，跳过: {path}")
+    return None
+
+def get_previous_snapshot(today: date, root: Union[str, Path] = BACKUP_ROOT) -> Optional[str]:
+    """
+    获取早于指定日期的最新的成功完成的快照，作为 --link-dest 和增量估算的基准
+
+    Args:
+        today: 当前快照日期
+        root: 备份根目录
+
+    Returns:
+        Optional[str]: 快照目录路径，不存在时返回None
+    """
+    return get_latest_snapshot(root, before=today)
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import os
+import errno
+from pathlib import Path
+from typing import Iterator, Optional, Tuple, Union
+
+from config.settings import HASH_CHUNK_SIZE
+from .throttle import Throttle
+
+# 在数据区内检测全零块的粒度，与常见文件系统块大小一致
+SPARSE_BLOCK_SIZE = 4096
+
+_ZERO = bytes(HASH_CHUNK_SIZE)
+
+def is_sparse(st: os.stat_result) -> bool:
+    """根据已分配块数判断文件是否包含空洞"""
+    return getattr(st, "st_blocks", 0) * 512 < st.st_size
+
+def iter_extents(fd: int, size: int) -> Iterator[Tuple[int, int, bool]]:
+    """
+    使用 SEEK_DATA/SEEK_HOLE 遍历文件的数据区和空洞
+
+    文件系统不支持时把整个文件视为一个数据区。
+
+    Args:
+        fd: 文件描述符
+        size: 文件大小
+
+    Yields:
+        Tuple[int, int, bool]: (偏移, 长度, 是否为数据区)
+    """
+    if size == 0:
+        return
+    if not hasattr(os, "SEEK_DATA"):
+        yield 0, size, True
+        return
+    offset = 0
+    while offset < size:
+        try:
+            data = os.lseek(fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # 从offset到文件末尾都是空洞
+                yield offset, size - offset, False
+                return
+            if offset == 0:
+                yield 0, size, True
+                return
+            raise
+        if data > offset:
+            yield offset, data - offset, False
+        hole = min(os.lseek(fd, data, os.SEEK_HOLE), size)
+        yield data, hole - data, True
+        offset = hole
+
+def read_range(fd: int, offset: int, length: int) -> bytearray:
+    """
+    读取文件的一段内容，空洞部分直接以零填充而不读取磁盘
+
+    Args:
+        fd: 文件描述符
+        offset: 起始偏移
+        length: 读取长度
+
+    Returns:
+        bytearray: 数据（文件末尾之后的部分被截断）
+    """
+    size = os.fstat(fd).st_size
+    length = max(0, min(length, size - offset))
+    buf = bytearray(length)
+    view = memoryview(buf)
+    end = offset + length
+    for ext_offset, ext_length, is_data in iter_extents(fd, size):
+        start = max(ext_offset, offset)
+        stop = min(ext_offset + ext_length, end)
+        if not is_data or start >= stop:
+            continue
+        pos = start
+        while pos < stop:
+            n = os.preadv(fd, [view[pos - offset:stop - offset]], pos)
+            if n <= 0:
+                break
+            pos += n
+    return buf
+
+def iter_content(fd: int, size: int, block_size: int = HASH_CHUNK_SIZE) -> Iterator[Union[bytes, memoryview]]:
+    """
+    按顺序产出文件内容，空洞以共享的零缓冲区表示，不读取磁盘
+
+    产出的内容与普通顺序读取完全一致，可直接送入哈希对象。
+
+    Args:
+        fd: 文件描述符
+        size: 文件大小
+        block_size: 每次产出的最大长度
+
+    Yields:
+        Union[bytes, memoryview]: 文件内容片段
+    """
+    zero = _ZERO if block_size <= len(_ZERO) else bytes(block_size)
+    zero_view = memoryview(zero)
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    for offset, length, is_data in iter_extents(fd, size):
+        end = offset + length
+        while offset < end:
+            n = min(block_size, end - offset)
+            if is_data:
+                n = os.preadv(fd, [view[:n]], offset)
+                if n <= 0:
+                    return
+                yield view[:n]
+            else:
+                yield zero_view[:n]
+            offset += n
+
+def copy_sparse(
+    src: Union[str, Path],
+    dst: Union[str, Path],
+    hasher=None,
+    throttle: Optional[Throttle] = None
+) -> int:
+    """
+    保留空洞地复制文件
+
+    只复制源文件的数据区；目标文件先截断到源文件大小，未写入的部分即为空洞。
+    数据区中整块为零的部分同样跳过，使厚置备镜像中的零块在目标上变为空洞。
+
+    Args:
+        src: 源文件
+        dst: 目标文件（会被覆盖）
+        hasher: 哈希对象（可选），复制的同时按完整内容（空洞以零计）计算源文件的校验和
+        throttle: 读取限速器（可选），只计入数据区
+
+    Returns:
+        int: 实际写入的字节数
+    """
+    written = 0
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        src_fd, dst_fd = fsrc.fileno(), fdst.fileno()
+        size = os.fstat(src_fd).st_size
+        os.ftruncate(dst_fd, size)
+        zero_block = memoryview(_ZERO)[:SPARSE_BLOCK_SIZE]
+        buf = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buf)
+        for offset, length, is_data in iter_extents(src_fd, size):
+            if not is_data:
+                if hasher is not None:
+                    for pos in range(0, length, len(_ZERO)):
+                        hasher.update(memoryview(_ZERO)[:min(len(_ZERO), length - pos)])
+                continue
+            end = offset + length
+            while offset < end:
+                n = os.preadv(src_fd, [view[:min(len(buf), end - offset)]], offset)
+                if n <= 0:
+                    break
+                if throttle is not None:
+                    throttle.consume(n)
+                if hasher is not None:
+                    hasher.update(view[:n])
+                if view[:n] == _ZERO[:n]:
+                    offset += n
+                    continue
+                # 按文件系统块检查，连续的非零块合并为一次写入
+                run_start = None
+                for pos in range(0, n, SPARSE_BLOCK_SIZE):
+                    block = view[pos:min(pos + SPARSE_BLOCK_SIZE, n)]
+                    if len(block) == SPARSE_BLOCK_SIZE and block == zero_block:
+                        if run_start is not None:
+                            written += os.pwrite(dst_fd, view[run_start:pos], offset + run_start)
+                            run_start = None
+                    elif run_start is None:
+                        run_start = pos
+                if run_start is not None:
+                    written += os.pwrite(dst_fd, view[run_start:n], offset + run_start)
+                offset += n
+    return written
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import stat
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Union
+from urllib.parse import quote
+
+from config.settings import (
+    SQLITE_CAPTURE_METHOD,
+    SQLITE_STAGING_DIR,
+    SQLITE_BUSY_TIMEOUT
+)
+from .scanner import FileIndex
+from .utils import print_info, print_warning
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+# 数据库的附属文件，快照已包含其中的内容，不再单独备份
+SIDE_SUFFIXES = ("-wal", "-shm", "-journal")
+
+# 只检查这些扩展名的文件，以及带有WAL或回滚日志的文件，避免逐个读取大量小文件的文件头
+_DB_EXTENSIONS = (".sqlite", ".db")
+
+def get_staging_dir(name: str, staging_root: Union[str, Path] = SQLITE_STAGING_DIR) -> str:
+    """获取源目录的数据库快照暂存目录"""
+    return os.path.join(str(staging_root), name)
+
+def is_sqlite_file(path: Union[str, Path]) -> bool:
+    """根据文件头判断是否为SQLite数据库"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+    except OSError:
+        return False
+
+def rsync_filters(overrides: Dict[str, str]) -> List[str]:
+    """
+    生成rsync过滤规则：数据库本身排除（目标端保留，随后用快照覆盖），
+    附属文件只在发送端隐藏，使目标端残留的旧WAL文件被 --delete 删除
+
+    Args:
+        overrides: 数据库相对路径到快照文件的映射
+
+    Returns:
+        List[str]: 过滤规则，每条对应一个 --filter 参数
+    """
+    rules = []
+    for rel_path in sorted(overrides):
+        pattern = "/" + re.sub(r"([*?\[\\])", r"\\\1", rel_path)
+        rules.append(f"- {pattern}")
+        rules.extend(f"H {pattern}{suffix}" for suffix in SIDE_SUFFIXES)
+    return rules
+
+def find_databases(index: FileIndex) -> List[str]:
+    """
+    在文件索引中查找SQLite数据库
+
+    Args:
+        index: 源目录的文件索引
+
+    Returns:
+        List[str]: 数据库文件的相对路径
+    """
+    databases = []
+    for rel_path in sorted(index.files):
+        if rel_path.endswith(SIDE_SUFFIXES):
+            continue
+        if not rel_path.endswith(_DB_EXTENSIONS) and not any(
+                rel_path + suffix in index.files for suffix in SIDE_SUFFIXES):
+            continue
+        if index.files[rel_path].st_size >= 100 and is_sqlite_file(index.abspath(rel_path)):
+            databases.append(rel_path)
+    return databases
+
+def _signature(index: FileIndex, rel_path: str) -> List[int]:
+    """数据库及其WAL文件的大小和修改时间，任一变化说明数据库内容可能已变化"""
+    signature = []
+    for suffix in ("", "-wal"):
+        st = index.files.get(rel_path + suffix)
+        signature.extend([st.st_size, st.st_mtime_ns] if st else [0, 0])
+    return signature
+
+def snapshot_database(
+    src: Union[str, Path],
+    dst: Union[str, Path],
+    method: str = SQLITE_CAPTURE_METHOD
+) -> None:
+    """
+    在数据库正在使用时生成一致的快照
+
+    以只读方式打开源数据库，通过在线备份API或 VACUUM INTO 写入临时文件后改名。
+    快照在一个读事务内完成，包含WAL中已提交的内容，不需要附带WAL文件。
+
+    Args:
+        src: 源数据库
+        dst: 快照文件
+        method: "backup" 或 "vacuum"
+
+    Raises:
+        sqlite3.Error: 数据库无法读取（如被独占锁定）
+    """
+    src, dst = str(src), str(dst)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp = dst + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    source = sqlite3.connect(f"file:{quote(src)}?mode=ro", uri=True, timeout=SQLITE_BUSY_TIMEOUT)
+    try:
+        if method == "vacuum":
+            # VACUUM INTO 自身在一个读事务中完成，不能放在显式事务中执行
+            source.execute("VACUUM INTO ?", (tmp,))
+        else:
+            # 先开启读事务：被独占锁定时在超时后报错，而不是让备份API无限重试
+            source.execute("BEGIN")
+            source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            target = sqlite3.connect(tmp)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    finally:
+        source.close()
+    os.replace(tmp, dst)
+
+def _snapshot_from_copy(src: str, dst: str) -> None:
+    """
+    数据库被锁定时的退路：复制数据库及其WAL文件，从副本生成快照
+
+    复制过程中数据库仍可能被写入，不能保证一致性。
+    """
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(dst)) as tmp_dir:
+        copy = os.path.join(tmp_dir, os.path.basename(src))
+        shutil.copyfile(src, copy)
+        if os.path.exists(src + "-wal"):
+            shutil.copyfile(src + "-wal", copy + "-wal")
+        # 以读写方式打开副本，使SQLite回放WAL中已提交的事务
+        source = sqlite3.connect(copy, timeout=SQLITE_BUSY_TIMEOUT)
+        try:
+            target = sqlite3.connect(dst + ".tmp")
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+    os.replace(dst + ".tmp", dst)
+
+def _apply_source_metadata(index: FileIndex, rel_path: str, staged: str) -> None:
+    """
+    把源数据库的属主、权限和修改时间设置到快照文件上
+
+    快照文件由备份进程创建，属主和权限取决于运行备份的用户和umask，修改时间为快照时间；
+    rsync、内置复制引擎和清单都从快照文件读取这些属性，不修正时恢复后的数据库无法被原用户写入。
+    WAL模式下提交只写入WAL文件，修改时间取数据库和WAL文件中较新的一个，
+    使数据库内容变化后快照的修改时间也随之变化，快速检查不会漏掉。
+    """
+    st = index.files[rel_path]
+    wal = index.files.get(rel_path + "-wal")
+    mtime_ns = max(st.st_mtime_ns, wal.st_mtime_ns) if wal else st.st_mtime_ns
+    try:
+        os.chown(staged, st.st_uid, st.st_gid)
+    except OSError as e:
+        print_warning(f"无法设置数据库快照的属主 {staged}: {e}")
+    os.chmod(staged, stat.S_IMODE(st.st_mode))
+    os.utime(staged, ns=(st.st_atime_ns, mtime_ns))
+
+def capture_databases(
+    name: str,
+    index: FileIndex,
+    staging_root: Union[str, Path] = SQLITE_STAGING_DIR
+) -> Dict[str, str]:
+    """
+    为源目录中的SQLite数据库生成一致性快照，并让文件索引改为读取快照
+
+    快照保存在暂存目录中并跨次备份保留；数据库及其WAL文件的大小和修改时间都未变化时
+    直接沿用上次的快照。成功快照的数据库在索引中的附属文件（-wal、-shm、-journal）被移除，
+    备份中只保留自洽的数据库文件。
+
+    Args:
+        name: 源目录名称（暂存目录的子目录名）
+        index: 源目录的文件索引，会被原地修改
+        staging_root: 暂存根目录
+
+    Returns:
+        Dict[str, str]: 数据库相对路径到快照文件的映射
+    """
+    staging_dir = get_staging_dir(name, staging_root)
+    state_file = os.path.join(str(staging_root), f"{name}.json")
+    state: Dict[str, List[int]] = {}
+    if os.path.exists(state_file):
+        try:
+            with open(state_file, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print_warning(f"加载数据库快照状态失败 {state_file}: {e}")
+
+    overrides: Dict[str, str] = {}
+    new_state: Dict[str, List[int]] = {}
+    captured = 0
+    for rel_path in find_databases(index):
+        src = os.path.join(index.root, rel_path)
+        staged = os.path.join(staging_dir, rel_path)
+        signature = _signature(index, rel_path)
+        if state.get(rel_path) != signature or not os.path.exists(staged):
+            try:
+                snapshot_database(src, staged)
+            except sqlite3.Error as e:
+                print_warning(f"数据库在线快照失败 {rel_path}: {e}，改为复制后生成快照（可能不一致）")
+                try:
+                    _snapshot_from_copy(src, staged)
+                except (sqlite3.Error, OSError) as e:
+                    print_warning(f"数据库快照失败 {rel_path}: {e}，将按普通文件备份")
+                    continue
+            except OSError as e:
+                print_warning(f"数据库快照失败 {rel_path}: {e}，将按普通文件备份")
+                continue
+            captured += 1
+        # 沿用的快照也重新设置：源数据库的属主和权限可能在内容不变时被修改
+        try:
+            _apply_source_metadata(index, rel_path, staged)
+        except OSError as e:
+            print_warning(f"数据库快照失败 {rel_path}: {e}，将按普通文件备份")
+            continue
+        new_state[rel_path] = signature
+        overrides[rel_path] = staged
+
+    # 清理已不存在的数据库的旧快照
+    if os.path.isdir(staging_dir):
+        for dirpath, _, filenames in os.walk(staging_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if os.path.relpath(path, staging_dir).replace(os.sep, "/") not in overrides:
+                    os.remove(path)
+
+    try:
+        os.makedirs(str(staging_root), exist_ok=True)
+        with open(state_file, "w", encoding="utf-8") as f:
+            json.dump(new_state, f, ensure_ascii=False, indent=2)
+    except OSError as e:
+        print_warning(f"保存数据库快照状态失败 {state_file}: {e}")
+
+    for rel_path, staged in overrides.items():
+        index.files[rel_path] = os.stat(staged)
+        index.overrides[rel_path] = staged
+        for suffix in SIDE_SUFFIXES:
+            index.files.pop(rel_path + suffix, None)
+    if overrides:
+        print_info(f"{name}: 数据库快照 {len(overrides)} 个，本次重新生成 {captured} 个")
+    return overrides
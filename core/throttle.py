@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import signal
+import asyncio
+import subprocess
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.settings import (
+    IO_PRIORITY_CLASS,
+    IO_PRIORITY_LEVEL,
+    CPU_NICE,
+    PHASE_BANDWIDTH_MBPS,
+    ADAPTIVE_THROTTLE,
+    THROTTLE_TARGET_LATENCY_MS,
+    THROTTLE_MIN_MBPS,
+    THROTTLE_INTERVAL,
+    COMMAND_TIMEOUT
+)
+from .utils import print_info, print_warning
+
+MB = 1024 * 1024
+
+# 不设上限时，自适应限速恢复到该速度后即解除限速（字节/秒）
+_UNLIMITED_RATE = 1024 * MB
+
+_IONICE_CLASSES = {"realtime": "1", "best-effort": "2", "idle": "3"}
+
+def apply_priority(
+    io_class: str = IO_PRIORITY_CLASS,
+    io_level: int = IO_PRIORITY_LEVEL,
+    nice: int = CPU_NICE
+) -> None:
+    """
+    降低当前进程的CPU和I/O优先级
+
+    在创建线程池和子进程之前调用：之后创建的线程和子进程（如rsync）继承同样的优先级。
+
+    Args:
+        io_class: I/O调度类，"idle"、"best-effort" 或 "none"（不调整）
+        io_level: best-effort 调度类中的优先级（0最高，7最低）
+        nice: nice值，0表示不调整
+    """
+    if nice > 0:
+        try:
+            current = os.getpriority(os.PRIO_PROCESS, 0)
+            if current < nice:
+                os.setpriority(os.PRIO_PROCESS, 0, nice)
+        except OSError as e:
+            print_warning(f"无法设置进程优先级: {e}")
+    if io_class == "none":
+        return
+    if io_class not in _IONICE_CLASSES:
+        print_warning(f"未知的I/O调度类: {io_class}")
+        return
+    cmd = ["ionice", "-c", _IONICE_CLASSES[io_class]]
+    if io_class == "best-effort":
+        cmd += ["-n", str(io_level)]
+    cmd += ["-p", str(os.getpid())]
+    from .parallel import run_process
+    try:
+        run_process(cmd, timeout=COMMAND_TIMEOUT)
+    except (OSError, subprocess.SubprocessError) as e:
+        print_warning(f"无法设置I/O优先级: {e}")
+
+def read_diskstats(devices: Iterable[str]) -> Tuple[int, int]:
+    """
+    读取 /proc/diskstats 中指定设备的累计I/O次数和I/O耗时
+
+    Args:
+        devices: 设备名称（如 sda、nvme0n1）
+
+    Returns:
+        Tuple[int, int]: (完成的读写次数, 读写耗时毫秒数)，各设备之和
+    """
+    devices = set(devices)
+    ios = ticks = 0
+    with open("/proc/diskstats", "r") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) < 14 or fields[2] not in devices:
+                continue
+            # 读完成次数、读耗时、写完成次数、写耗时
+            ios += int(fields[3]) + int(fields[7])
+            ticks += int(fields[6]) + int(fields[10])
+    return ios, ticks
+
+class Throttle:
+    """
+    令牌桶限速器，同一阶段的所有线程共用
+
+    rate 为None时不限速。自适应调整由 IOScheduler 的监视线程修改 rate。
+    """
+
+    def __init__(self, phase: str, cap: Optional[float], burst_seconds: float = 0.25):
+        """
+        初始化限速器
+
+        Args:
+            phase: 阶段名称
+            cap: 带宽上限（字节/秒），None表示不设上限
+            burst_seconds: 允许的突发量（按当前速度计的秒数）
+        """
+        self.phase = phase
+        self.cap = cap
+        self.rate = cap
+        self.burst_seconds = burst_seconds
+        self.consumed = 0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def delay(self, nbytes: int) -> float:
+        """
+        登记即将读写的字节数，返回为保持速度需要等待的时间（秒）
+
+        Args:
+            nbytes: 字节数
+
+        Returns:
+            float: 需要等待的秒数
+        """
+        with self._lock:
+            self.consumed += nbytes
+            if self.rate is None:
+                return 0.0
+            now = time.monotonic()
+            start = max(self._next, now - self.burst_seconds)
+            self._next = start + nbytes / self.rate
+            return max(0.0, self._next - now)
+
+    def consume(self, nbytes: int) -> None:
+        """在当前线程中按限速等待"""
+        wait = self.delay(nbytes)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def pace_process(self, process: asyncio.subprocess.Process, nbytes: int) -> None:
+        """
+        按限速暂停子进程：先用SIGSTOP暂停，等待后用SIGCONT继续
+
+        用于无法在进程内限速的rsync，nbytes 取自其进度输出。在任务调度的事件循环中执行，
+        等待期间不影响其他子进程的输出读取。
+
+        Args:
+            process: 子进程
+            nbytes: 子进程新传输的字节数
+        """
+        wait = self.delay(nbytes)
+        if wait <= 0 or process.returncode is not None:
+            return
+        process.send_signal(signal.SIGSTOP)
+        try:
+            await asyncio.sleep(wait)
+        finally:
+            if process.returncode is None:
+                process.send_signal(signal.SIGCONT)
+
+class IOScheduler:
+    """
+    备份和恢复的I/O调度：每个阶段一个限速器，并根据生产设备的I/O延迟自适应调整
+
+    监视线程每隔 THROTTLE_INTERVAL 秒从 /proc/diskstats 计算生产设备（备份时为源目录所在磁盘，
+    恢复时为恢复位置所在磁盘）的平均每次I/O耗时。超过 THROTTLE_TARGET_LATENCY_MS 时把各阶段的速度减半
+    （不低于 THROTTLE_MIN_MBPS），延迟恢复正常后每次提高20%，直到配置的上限或解除限速。
+    """
+
+    def __init__(
+        self,
+        devices: Iterable[str] = (),
+        limits: Optional[Dict[str, float]] = None,
+        adaptive: bool = ADAPTIVE_THROTTLE,
+        target_latency_ms: float = THROTTLE_TARGET_LATENCY_MS,
+        min_mbps: float = THROTTLE_MIN_MBPS,
+        interval: float = THROTTLE_INTERVAL
+    ):
+        """
+        初始化I/O调度
+
+        Args:
+            devices: 需要保护的设备名称（如 sda），为空时不做自适应调整
+            limits: 各阶段的带宽上限（MB/s，0表示不限制），默认为 PHASE_BANDWIDTH_MBPS
+            adaptive: 是否根据设备延迟自适应调整
+            target_latency_ms: 目标延迟（毫秒）
+            min_mbps: 自适应降速的最低带宽（MB/s）
+            interval: 采样间隔（秒）
+        """
+        self.devices = sorted(set(devices))
+        self.limits = dict(PHASE_BANDWIDTH_MBPS if limits is None else limits)
+        self.adaptive = adaptive and bool(self.devices) and os.path.exists("/proc/diskstats")
+        self.target_latency_ms = target_latency_ms
+        self.min_rate = min_mbps * MB
+        self.interval = interval
+        self.throttles: Dict[str, Throttle] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def throttle(self, phase: str) -> Optional[Throttle]:
+        """
+        获取阶段的限速器
+
+        Args:
+            phase: 阶段名称（"transfer"、"verify"、"restore"）
+
+        Returns:
+            Optional[Throttle]: 限速器；既没有上限也不做自适应调整时返回None
+        """
+        cap = self.limits.get(phase, 0)
+        if not cap and not self.adaptive:
+            return None
+        with self._lock:
+            if phase not in self.throttles:
+                self.throttles[phase] = Throttle(phase, cap * MB if cap else None)
+            return self.throttles[phase]
+
+    def rsync_args(self, phase: str) -> List[str]:
+        """rsync的限速参数（--bwlimit，单位KB/s），阶段没有上限时为空"""
+        cap = self.limits.get(phase, 0)
+        return [f"--bwlimit={int(cap * 1024)}"] if cap else []
+
+    def start(self) -> None:
+        """启动延迟监视线程"""
+        if not self.adaptive or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._monitor, name="io-throttle", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止延迟监视线程"""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self) -> "IOScheduler":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _monitor(self) -> None:
+        """按采样间隔计算设备延迟并调整各阶段的速度"""
+        try:
+            last_ios, last_ticks = read_diskstats(self.devices)
+        except OSError as e:
+            print_warning(f"无法读取 /proc/diskstats，不做自适应限速: {e}")
+            return
+        last_time = time.monotonic()
+        last_consumed: Dict[str, int] = {}
+        throttled = False
+        while not self._stop.wait(self.interval):
+            try:
+                ios, ticks = read_diskstats(self.devices)
+            except OSError:
+                continue
+            now = time.monotonic()
+            elapsed = max(now - last_time, 1e-3)
+            latency = (ticks - last_ticks) / (ios - last_ios) if ios > last_ios else 0.0
+            last_ios, last_ticks, last_time = ios, ticks, now
+            congested = latency > self.target_latency_ms
+            with self._lock:
+                throttles = list(self.throttles.values())
+            for throttle in throttles:
+                observed = (throttle.consumed - last_consumed.get(throttle.phase, 0)) / elapsed
+                last_consumed[throttle.phase] = throttle.consumed
+                if congested:
+                    if not observed:
+                        # 该阶段本周期没有读写，延迟与它无关
+                        continue
+                    # 乘性减小：从当前速度（不限速时为实际速度）减半
+                    base = throttle.rate if throttle.rate is not None else max(observed, self.min_rate)
+                    throttle.rate = max(self.min_rate, base / 2)
+                elif throttle.rate is not None:
+                    rate = throttle.rate * 1.2
+                    if throttle.cap is not None:
+                        throttle.rate = min(rate, throttle.cap)
+                    else:
+                        throttle.rate = None if rate >= _UNLIMITED_RATE else rate
+            if congested and not throttled:
+                print_info(f"设备 {', '.join(self.devices)} 的I/O延迟 {latency:.1f} ms，备份读写降速")
+            elif throttled and not congested and all(
+                    throttle.rate == throttle.cap for throttle in throttles):
+                print_info(f"设备 {', '.join(self.devices)} 的I/O延迟恢复正常，解除降速")
+            throttled = congested or any(throttle.rate != throttle.cap for throttle in throttles)
@@ -2,22 +2,44 @@
 
 import os
 import sys
+import fnmatch
+import threading
 import subprocess
 from pathlib import Path
-from typing import Optional, Dict, List, Union
+from typing import Callable, IO, Optional, Dict, List, Sequence, Union
 from datetime import datetime
 
+from config.settings import BACKUP_ROOT, CHECKSUM_ALGORITHM, COMMAND_TIMEOUT, USB_MOUNT
+
+# 并行任务共用终端输出，整行写入避免不同线程的输出交错
+_print_lock = threading.Lock()
+# 显示进度条时由进度条接管输出，避免信息行打断进度条
+_line_writer: Optional[Callable[[str, IO], None]] = None
+
+def set_line_writer(writer: Optional[Callable[[str, IO], None]]) -> None:
+    """设置输出信息行的函数，None表示直接写入终端"""
+    global _line_writer
+    _line_writer = writer
+
+def _print_line(line: str, stream) -> None:
+    with _print_lock:
+        if _line_writer is not None:
+            _line_writer(line, stream)
+            return
+        stream.write(line + "\n")
+        stream.flush()
+
 def print_error(message: str) -> None:
     """打印错误信息"""
-    print(f"错误: {message}", file=sys.stderr)
+    _print_line(f"错误: {message}", sys.stderr)
 
 def print_warning(message: str) -> None:
     """打印警告信息"""
-    print(f"警告: {message}", file=sys.stderr)
+    _print_line(f"警告: {message}", sys.stderr)
 
 def print_info(message: str) -> None:
     """打印信息"""
-    print(f"信息: {message}")
+    _print_line(f"信息: {message}", sys.stdout)
 
 def setup_logging() -> None:
     """配置日志系统"""
@@ -26,16 +48,11 @@ def setup_logging() -> None:
 
 def get_disk_model() -> str:
     """获取当前系统的硬盘型号"""
+    from .parallel import run_process
     try:
-        result = subprocess.run(
-            ["lsblk", "-dno", "MODEL", "/dev/sda"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True
-        )
+        result = run_process(["lsblk", "-dno", "MODEL", "/dev/sda"], timeout=COMMAND_TIMEOUT)
         return result.stdout.strip()
-    except subprocess.SubprocessError as e:
+    except (subprocess.SubprocessError, OSError) as e:
         print_error(f"获取硬盘型号失败: {e}")
         return "Unknown"
 
@@ -59,30 +76,54 @@ def get_dir_size_gb(path: Union[str, Path]) -> float:
     Returns:
         float: 目录大小（GB）
     """
-    total = 0
-    try:
-        for dirpath, _, filenames in os.walk(str(path)):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                try:
-                    total += os.path.getsize(fp)
-                except (OSError, FileNotFoundError) as e:
-                    print_warning(f"无法获取文件大小 {fp}: {e}")
-    except Exception as e:
-        print_error(f"计算目录大小失败 {path}: {e}")
+    from .scanner import scan_tree
+    return scan_tree(path).total_size / (1024 ** 3)  # 转换为GB
+
+def is_backup_disk_missing(path: Union[str, Path]) -> bool:
+    """
+    判断路径位于备份盘挂载点之下而备份盘未挂载
+    
+    未挂载时挂载点只是系统盘上的普通目录（或不存在），写入其中的备份会落到系统盘上。
     
-    return total / (1024 ** 3)  # 转换为GB
+    Args:
+        path: 路径
+        
+    Returns:
+        bool: 备份盘是否缺失
+    """
+    path = Path(os.path.abspath(str(path)))
+    mount = Path(USB_MOUNT)
+    return (path == mount or mount in path.parents) and not os.path.ismount(str(mount))
+
+def _existing_path(path: Union[str, Path], root: Optional[Union[str, Path]] = None) -> Path:
+    """
+    向上查找最近的已存在路径
+    
+    root 不为None时只在 root 之内查找：path 不在 root 之下时直接返回 path。
+    """
+    path = Path(os.path.abspath(str(path)))
+    limit = Path(os.path.abspath(str(root))) if root is not None else None
+    if limit is not None and path != limit and limit not in path.parents:
+        return path
+    while not path.exists() and path != limit and path != path.parent:
+        path = path.parent
+    return path
 
-def get_disk_free_gb(path: Union[str, Path]) -> float:
+def get_disk_free_gb(path: Union[str, Path], root: Union[str, Path] = BACKUP_ROOT) -> float:
     """
     获取指定路径所在磁盘的剩余空间（GB）
     
     Args:
-        path: 路径
+        path: 路径（不存在时使用最近的已存在父目录，但不超出 root）
+        root: 向上查找的边界，默认为备份根目录
         
     Returns:
-        float: 剩余空间（GB）
+        float: 剩余空间（GB），备份盘未挂载或路径不存在时为0
     """
+    if is_backup_disk_missing(path):
+        print_error(f"备份盘未挂载: {USB_MOUNT}")
+        return 0.0
+    path = _existing_path(path, root)
     try:
         if hasattr(os, 'statvfs'):  # Unix/Linux系统
             statvfs = os.statvfs(str(path))
@@ -102,6 +143,70 @@ def get_disk_free_gb(path: Union[str, Path]) -> float:
         print_error(f"获取磁盘剩余空间失败 {path}: {e}")
         return 0.0
 
+def get_physical_device(path: Union[str, Path]) -> str:
+    """
+    获取路径所在的物理设备名称（如 sda、nvme0n1）
+    
+    分区会被归并到其所属的整块磁盘，无法识别时返回 "dev-主:次" 形式的标识。
+    
+    Args:
+        path: 路径（不存在时向上查找最近的已存在父目录）
+        
+    Returns:
+        str: 物理设备名称，备份盘未挂载时为 "unknown"
+    """
+    # 备份盘未挂载时向上查找会得到系统盘，不能把它当作备份盘
+    if is_backup_disk_missing(path):
+        print_warning(f"备份盘未挂载: {USB_MOUNT}")
+        return "unknown"
+    path = _existing_path(path)
+    try:
+        st_dev = os.stat(str(path)).st_dev
+    except OSError as e:
+        print_warning(f"无法获取设备信息 {path}: {e}")
+        return "unknown"
+    
+    major, minor = os.major(st_dev), os.minor(st_dev)
+    sys_path = Path(f"/sys/dev/block/{major}:{minor}")
+    try:
+        real = sys_path.resolve(strict=True)
+        # 分区目录下存在partition文件，其父目录即为整块磁盘
+        if (real / "partition").exists():
+            real = real.parent
+        return real.name
+    except OSError:
+        return f"dev-{major}:{minor}"
+
+def is_excluded(rel_path: str, patterns: Sequence[str]) -> bool:
+    """
+    按rsync的排除规则判断相对路径是否被排除
+    
+    不含"/"的模式匹配路径中的任意一级名称；含"/"的模式匹配整个相对路径，
+    以"/"开头时锚定在源目录根部。
+    
+    Args:
+        rel_path: 相对于源目录的路径（使用"/"分隔）
+        patterns: 排除模式列表
+        
+    Returns:
+        bool: 是否被排除
+    """
+    parts = rel_path.split("/")
+    # 父目录被排除时其下所有内容也被排除，因此逐级检查路径前缀
+    prefixes = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+    for pattern in patterns:
+        pattern = pattern.rstrip("/")
+        if "/" not in pattern:
+            if any(fnmatch.fnmatchcase(part, pattern) for part in parts):
+                return True
+        elif pattern.startswith("/"):
+            if any(fnmatch.fnmatchcase(prefix, pattern[1:]) for prefix in prefixes):
+                return True
+        elif any(fnmatch.fnmatchcase(prefix, pattern) or fnmatch.fnmatchcase(prefix, "*/" + pattern)
+                 for prefix in prefixes):
+            return True
+    return False
+
 def format_duration(seconds: float) -> str:
     """
     格式化持续时间
@@ -143,28 +248,19 @@ def verify_path_exists(path: Union[str, Path], create: bool = False) -> bool:
     
     return False
 
-def calculate_checksum(file_path: Union[str, Path]) -> Optional[str]:
+def calculate_checksum(file_path: Union[str, Path], algorithm: Optional[str] = None) -> Optional[str]:
     """
-    计算文件的MD5校验和
+    计算文件的校验和（进程内计算，不再调用md5sum）
     
     Args:
         file_path: 文件路径
+        algorithm: 哈希算法名称，默认使用配置中的CHECKSUM_ALGORITHM
         
     Returns:
-        Optional[str]: MD5校验和，失败返回None
+        Optional[str]: 校验和，失败返回None
     """
-    try:
-        result = subprocess.run(
-            ["md5sum", str(file_path)],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=True
-        )
-        return result.stdout.split()[0]
-    except subprocess.SubprocessError as e:
-        print_error(f"计算文件校验和失败 {file_path}: {e}")
-        return None
+    from .hasher import hash_file
+    return hash_file(file_path, algorithm or CHECKSUM_ALGORITHM)
 
 def check_root_privileges() -> bool:
     """
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import errno
+import select
+import signal
+import struct
+import ctypes
+import ctypes.util
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config.settings import RSYNC_OPTIONS, SOURCE_PATHS, WATCH_FLUSH_SECONDS, WATCH_JOURNAL_FILE
+from .changes import PATH, TREE, ChangeJournal
+from .utils import is_excluded, print_error, print_info, print_warning
+
+# inotify 事件掩码（linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (
+    IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR | IN_DONT_FOLLOW | IN_EXCL_UNLINK
+)
+
+# struct inotify_event { int wd; uint32_t mask; uint32_t cookie; uint32_t len; char name[]; }
+_EVENT = struct.Struct("iIII")
+_READ_SIZE = 64 * 1024
+
+class Inotify:
+    """inotify 系统调用的最小封装（通过ctypes调用libc，不需要额外依赖）"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        """添加监视，返回监视描述符（同一目录重复添加时返回原有的描述符）"""
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), ctypes.c_uint32(mask))
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        """移除监视（目录已删除时内核已自动移除，忽略错误）"""
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self) -> List[Tuple[int, int, str]]:
+        """
+        读取当前队列中的全部事件（不阻塞）
+
+        Returns:
+            List[Tuple[int, int, str]]: (监视描述符, 事件掩码, 名称) 列表
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT.unpack_from(data, offset)
+                offset += _EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, name))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class ChangeWatcher:
+    """
+    变更监视进程：用inotify跟踪各源目录中变化的路径，写入变更日志
+
+    对每个源目录下的全部子目录添加监视；新建或移入的目录补充监视并标记为整个子树变化。
+    事件队列溢出（IN_Q_OVERFLOW）时重新添加监视并重新开始跟踪，之前的基线失效，
+    下一次备份执行完整扫描。监视数超过 fs.inotify.max_user_watches 时该源目录不再跟踪。
+    """
+
+    def __init__(self, sources: Optional[Dict[str, str]] = None,
+                 journal_path: str = WATCH_JOURNAL_FILE,
+                 flush_seconds: float = WATCH_FLUSH_SECONDS,
+                 excludes: Sequence[str] = ()):
+        """
+        初始化监视进程
+
+        Args:
+            sources: 源名称到源路径的映射，默认为配置的 SOURCE_PATHS
+            journal_path: 变更日志文件路径
+            flush_seconds: 写入变更日志的间隔（秒）
+            excludes: 排除模式，默认与rsync一致
+        """
+        self.sources = dict(SOURCE_PATHS if sources is None else sources)
+        self.journal = ChangeJournal(journal_path)
+        self.flush_seconds = flush_seconds
+        self.excludes = list(excludes or RSYNC_OPTIONS.get("exclude", []))
+        self.inotify: Optional[Inotify] = None
+        # 监视描述符 -> (源名称, 目录的相对路径)
+        self.watches: Dict[int, Tuple[str, str]] = {}
+        self.dirty: Dict[Tuple[str, str], str] = {}
+        self.running = False
+
+    def _mark(self, name: str, rel_path: str, kind: str) -> None:
+        """记录一个变化的路径，TREE 优先于 PATH"""
+        if not rel_path or is_excluded(rel_path, self.excludes):
+            return
+        key = (name, rel_path)
+        if self.dirty.get(key) != TREE:
+            self.dirty[key] = kind
+
+    def _watch_tree(self, name: str, rel_dir: str) -> bool:
+        """
+        为目录及其下的全部子目录添加监视
+
+        Args:
+            name: 源名称
+            rel_dir: 目录的相对路径（源目录本身为空字符串）
+
+        Returns:
+            bool: 是否全部添加成功（监视数达到上限时返回False）
+        """
+        root = self.sources[name]
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            path = os.path.join(root, current) if current else root
+            try:
+                wd = self.inotify.add_watch(path, WATCH_MASK)
+            except OSError as e:
+                if e.errno == errno.ENOSPC:
+                    print_error(
+                        f"{name}: inotify监视数达到上限，请增大 fs.inotify.max_user_watches"
+                        f"（如 sysctl fs.inotify.max_user_watches=1048576）"
+                    )
+                    self.journal.set_tracking(name, None, "inotify监视数达到上限")
+                    return False
+                # 目录在添加监视前已被删除或替换，父目录的事件会记录该变化
+                if e.errno not in (errno.ENOENT, errno.ENOTDIR):
+                    print_warning(f"无法监视目录 {path}: {e}")
+                continue
+            self.watches[wd] = (name, current)
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        rel_path = f"{current}/{entry.name}" if current else entry.name
+                        if entry.is_dir(follow_symlinks=False) and not is_excluded(rel_path, self.excludes):
+                            stack.append(rel_path)
+            except OSError:
+                continue
+        return True
+
+    def _unwatch_tree(self, name: str, rel_dir: str) -> None:
+        """移除目录及其下全部子目录的监视（目录被移出时使用）"""
+        prefix = rel_dir + "/"
+        for wd, (source, current) in list(self.watches.items()):
+            if source == name and (current == rel_dir or current.startswith(prefix)):
+                self.inotify.rm_watch(wd)
+                del self.watches[wd]
+
+    def _track_all(self) -> None:
+        """为全部源目录添加监视，成功后记录开始跟踪的时间"""
+        for name, root in self.sources.items():
+            if not os.path.isdir(root):
+                print_warning(f"源目录不存在，不监视: {root}")
+                self.journal.set_tracking(name, None, "源目录不存在")
+                continue
+            since = time.time()
+            if self._watch_tree(name, ""):
+                self.journal.set_tracking(name, since)
+        print_info(f"正在监视 {len(self.sources)} 个源目录，共 {len(self.watches)} 个目录")
+
+    def _handle(self, wd: int, mask: int, name: str) -> None:
+        """处理一个inotify事件"""
+        if mask & IN_Q_OVERFLOW:
+            # 事件已丢失：写入已收集的变化，重新添加监视（溢出期间新建的目录未被监视）后重新开始跟踪
+            print_warning("inotify事件队列溢出，下一次备份将执行完整扫描")
+            self.journal.flush(self.dirty, time.time())
+            self.dirty = {}
+            self._track_all()
+            return
+        watch = self.watches.get(wd)
+        if watch is None:
+            return
+        source, rel_dir = watch
+        if mask & IN_IGNORED:
+            del self.watches[wd]
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            if not rel_dir:
+                print_warning(f"源目录被删除或移动，停止跟踪: {self.sources[source]}")
+                self.journal.set_tracking(source, None, "源目录被删除或移动")
+            return
+        rel_path = f"{rel_dir}/{name}" if rel_dir and name else (name or rel_dir)
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            self._mark(source, rel_path, TREE)
+            if not is_excluded(rel_path, self.excludes):
+                self._watch_tree(source, rel_path)
+        elif mask & IN_ISDIR and mask & (IN_DELETE | IN_MOVED_FROM):
+            self._mark(source, rel_path, TREE)
+            if mask & IN_MOVED_FROM:
+                self._unwatch_tree(source, rel_path)
+        else:
+            self._mark(source, rel_path, PATH)
+        # 目录中新建、删除或移动条目会改变目录本身的修改时间
+        if name and mask & (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO):
+            self._mark(source, rel_dir, PATH)
+
+    def stop(self, *_args) -> None:
+        """停止监视（SIGTERM/SIGINT 处理函数）"""
+        self.running = False
+
+    def run(self) -> bool:
+        """
+        运行监视循环，直到收到SIGTERM或SIGINT
+
+        Returns:
+            bool: 是否正常退出
+        """
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            print_error(f"无法初始化inotify: {e}")
+            return False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.running = True
+        try:
+            self.journal.start_watcher(self.sources)
+            self._track_all()
+            poller = select.poll()
+            poller.register(self.inotify.fd, select.POLLIN)
+            last_flush = 0.0
+            while self.running:
+                poller.poll(self.flush_seconds * 1000)
+                # 先记下时间再读取队列：此前发生的事件都会包含在这一批中
+                drained_at = time.time()
+                for wd, mask, name in self.inotify.read_events():
+                    self._handle(wd, mask, name)
+                if drained_at - last_flush >= self.flush_seconds:
+                    self.journal.flush(self.dirty, drained_at)
+                    self.dirty = {}
+                    last_flush = drained_at
+            self.journal.flush(self.dirty, time.time())
+            self.dirty = {}
+            return True
+        except Exception as e:
+            print_error(f"监视进程出错: {e}")
+            return False
+        finally:
+            self.journal.stop_watcher()
+            self.journal.close()
+            self.inotify.close()
+            print_info("监视进程已退出")
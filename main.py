@@ -14,6 +14,7 @@ from core.utils import (
 )
 from core.backup import BackupManager
 from core.restore import RestoreManager
+from core.watcher import ChangeWatcher
 
 def parse_args() -> argparse.Namespace:
     """解析命令行参数"""
@@ -33,6 +34,48 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="执行恢复操作"
     )
+    group.add_argument(
+        "-l", "--list",
+        metavar="PATTERN",
+        help="按文件索引列出备份中匹配的路径，如 \"VirtualBox VMs/*.vbox\""
+    )
+    group.add_argument(
+        "-s", "--select",
+        metavar="PATTERN",
+        help="只恢复匹配的文件或子目录，恢复位置中的其他文件保持不变"
+    )
+    group.add_argument(
+        "-w", "--watch",
+        action="store_true",
+        help="运行变更监视进程，记录源目录中变化的路径，使下一次备份只处理这些路径"
+    )
+    
+    parser.add_argument(
+        "-n", "--dry-run",
+        action="store_true",
+        help="恢复时只列出与备份的差异，不修改恢复位置"
+    )
+    parser.add_argument(
+        "--snapshot",
+        metavar="NAME",
+        help="列出或选择性恢复时使用的快照（目录名或YYYY-MM-DD），默认最新"
+    )
+    parser.add_argument(
+        "--target",
+        metavar="DIR",
+        help="选择性恢复的目标目录，默认恢复到配置的恢复位置"
+    )
+    
+    parser.add_argument(
+        "-f", "--force",
+        action="store_true",
+        help="忽略最小备份间隔，强制执行备份（快照模式）"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="从上次中断的备份继续：跳过已验证的源目录，沿用中断前的扫描结果"
+    )
     
     parser.add_argument(
         "-v", "--version",
@@ -71,14 +114,25 @@ def main() -> int:
         disk_model = get_disk_model()
         print_info(f"检测到硬盘型号: {disk_model}")
         
-        if args.backup:
+        if args.watch:
+            # 前台运行监视进程，直到收到SIGTERM或SIGINT
+            success = ChangeWatcher().run()
+        elif args.backup:
             # 执行备份
             manager = BackupManager()
-            success = manager.perform_backup()
+            success = manager.perform_backup(force=args.force, resume=args.resume)
+        elif args.list is not None:
+            # 按文件索引列出备份内容
+            manager = RestoreManager(disk_model)
+            success = manager.list_entries(args.list, args.snapshot)
+        elif args.select is not None:
+            # 选择性恢复
+            manager = RestoreManager(disk_model)
+            success = manager.restore_selected(args.select, args.snapshot, args.target)
         else:
             # 执行恢复
             manager = RestoreManager(disk_model)
-            success = manager.perform_restore()
+            success = manager.perform_restore(dry_run=args.dry_run)
         
         return 0 if success else 1
         
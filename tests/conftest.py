@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+import pytest
+
+# 测试直接导入项目根目录下的 config 和 core 包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def backup_env(tmp_path, monkeypatch):
+    """单个源目录、内置复制引擎的备份环境，返回 (源目录, 备份目录)"""
+    import core.backup as backup
+    src = tmp_path / "src" / "profile"
+    (src / "sub").mkdir(parents=True)
+    for i in range(10):
+        (src / ("sub" if i % 2 else "") / f"f{i}").write_bytes(os.urandom(100 * (i + 1)))
+    backup_root = tmp_path / "usb" / "backup"
+    backup_root.mkdir(parents=True)
+    backup_dir = backup_root / "backup_2025-06-28"
+    monkeypatch.setattr(backup, "SOURCE_PATHS", {"profile_src": str(src)})
+    monkeypatch.setattr(backup, "BACKUP_ENGINES", {"profile_src": "native"})
+    monkeypatch.setattr(backup, "BACKUP_MODE", "fixed")
+    monkeypatch.setattr(backup, "BACKUP_ROOT", str(backup_root))
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(backup_dir))
+    monkeypatch.setattr(backup, "MIN_FREE_SPACE_GB", 0)
+    monkeypatch.setattr(backup, "RUN_JOURNAL_FILE", str(tmp_path / "journal.sqlite"))
+    monkeypatch.setattr(backup, "WATCH_JOURNAL_FILE", str(tmp_path / "changes.sqlite"))
+    monkeypatch.setattr(backup, "SQLITE_CAPTURE_SOURCES", [])
+    monkeypatch.setattr(backup, "apply_priority", lambda: None)
+    monkeypatch.setattr(backup.RunMetrics, "save", lambda self, directory=None: None)
+    return src, backup_dir
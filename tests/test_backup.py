@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import os
+from datetime import date
+
+import pytest
+
+import core.backup as backup
+from core.scanner import scan_tree
+
+@pytest.fixture
+def snapshot_day(backup_env, monkeypatch):
+    """快照模式的备份环境，返回设置“今天”日期的函数"""
+    today = [date(2025, 6, 27)]
+
+    class FakeDate(date):
+        @classmethod
+        def today(cls):
+            return today[0]
+
+    monkeypatch.setattr(backup, "BACKUP_MODE", "snapshot")
+    monkeypatch.setattr(backup, "date", FakeDate)
+
+    def set_day(day):
+        today[0] = day
+    return set_day
+
+@pytest.mark.parametrize("engine", ["native", "pack"])
+def test_snapshot_without_hardlinks_requires_full_copy(backup_env, snapshot_day, monkeypatch, engine):
+    src, _ = backup_env
+    monkeypatch.setattr(backup, "BACKUP_ENGINES", {"profile_src": engine})
+    monkeypatch.setattr(backup, "supports_hardlinks", lambda directory: False)
+    assert backup.BackupManager().perform_backup()
+
+    (src / "f0").write_bytes(os.urandom(100))
+    snapshot_day(date(2025, 6, 28))
+    manager = backup.BackupManager()
+    assert manager.previous_snapshot is not None and manager.link_dest is None
+    assert manager.perform_backup(force=True)
+    # 不支持硬链接时新快照是完整副本，所需空间按整个源目录计算
+    total = scan_tree(src).total_size
+    assert manager.deltas["profile_src"]["required_bytes"] == total
+    assert scan_tree(manager.backup_dir).total_size >= total
+
+def test_snapshot_with_hardlinks_requires_changed_files(backup_env, snapshot_day):
+    src, _ = backup_env
+    assert backup.BackupManager().perform_backup()
+
+    (src / "f0").write_bytes(os.urandom(100))
+    snapshot_day(date(2025, 6, 28))
+    manager = backup.BackupManager()
+    assert manager.link_dest is not None
+    assert manager.perform_backup(force=True)
+    assert manager.deltas["profile_src"]["required_bytes"] == 100
+
+def test_pack_compaction_requires_full_tree(backup_env, monkeypatch):
+    src, _ = backup_env
+    monkeypatch.setattr(backup, "BACKUP_ENGINES", {"profile_src": "pack"})
+    assert backup.BackupManager().perform_backup()
+
+    # 大部分文件被替换，包中的失效数据超过比例，整个目录树写入新的包
+    for i in range(1, 10):
+        (src / ("sub" if i % 2 else "") / f"f{i}").write_bytes(os.urandom(100 * (i + 1)))
+    manager = backup.BackupManager()
+    assert manager.perform_backup()
+    assert manager.deltas["profile_src"]["required_bytes"] == scan_tree(src).total_size
+
+def test_failed_snapshot_is_not_used_as_base(backup_env, snapshot_day, monkeypatch):
+    src, _ = backup_env
+    assert backup.BackupManager().perform_backup()
+    first = backup.BackupManager().backup_dir
+
+    # 第二天的备份验证失败，留下不完整的快照
+    snapshot_day(date(2025, 6, 28))
+    with monkeypatch.context() as m:
+        m.setattr(backup.BackupManager, "_verify_backup", lambda self, *args, **kwargs: False)
+        assert not backup.BackupManager().perform_backup(force=True)
+
+    snapshot_day(date(2025, 6, 29))
+    manager = backup.BackupManager()
+    assert manager.previous_snapshot == first
+    assert manager.link_dest == first
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+
+from core.changes import PATH, TREE, apply_changes
+from core.scanner import scan_tree
+
+def _make_tree(root):
+    for rel_dir in ("moved/sub", "removed/sub", "replaced", "tree/old", "kept"):
+        (root / rel_dir).mkdir(parents=True)
+    for rel_path in ("moved/a", "moved/sub/b", "removed/c", "removed/sub/d", "replaced/e", "tree/old/f", "kept/g"):
+        (root / rel_path).write_bytes(rel_path.encode())
+    os.symlink("a", str(root / "moved" / "link"))
+
+def _tables(index):
+    return {
+        "files": {p: (st.st_size, st.st_mtime_ns) for p, st in index.files.items()},
+        "dirs": set(index.dirs),
+        "symlinks": set(index.symlinks)
+    }
+
+def test_apply_changes_matches_full_scan(tmp_path):
+    root = tmp_path / "src"
+    _make_tree(root)
+    index = scan_tree(root)
+
+    # 目录改名、目录删除、目录替换为文件，以及标记为 TREE 的目录下的整体变化
+    os.rename(str(root / "moved"), str(root / "renamed"))
+    shutil.rmtree(str(root / "removed"))
+    shutil.rmtree(str(root / "replaced"))
+    (root / "replaced").write_bytes(b"now a file")
+    shutil.rmtree(str(root / "tree" / "old"))
+    (root / "tree" / "new").mkdir()
+    (root / "tree" / "new" / "h").write_bytes(b"h")
+    dirty = {"moved": PATH, "renamed": PATH, "removed": PATH, "replaced": PATH, "tree": TREE}
+
+    changed = apply_changes(index, dirty)
+    assert _tables(index) == _tables(scan_tree(root))
+    assert changed == {
+        "moved", "moved/a", "moved/sub", "moved/sub/b", "moved/link",
+        "renamed", "renamed/a", "renamed/sub", "renamed/sub/b", "renamed/link",
+        "removed", "removed/c", "removed/sub", "removed/sub/d",
+        "replaced", "replaced/e",
+        "tree", "tree/old", "tree/old/f", "tree/new", "tree/new/h"
+    }
+    assert "kept/g" in index.files
+
+def test_apply_changes_skips_excluded_and_covered_paths(tmp_path):
+    root = tmp_path / "src"
+    _make_tree(root)
+    index = scan_tree(root, ["cache/"])
+    (root / "cache").mkdir()
+    (root / "cache" / "x").write_bytes(b"x")
+    (root / "tree" / "old" / "f").write_bytes(b"changed")
+    (root / "tree" / "i").write_bytes(b"i")
+
+    # tree 整体重新扫描，其下单独标记的路径不再重复处理；排除的目录不进入索引
+    changed = apply_changes(
+        index, {"cache": PATH, "cache/x": PATH, "tree": TREE, "tree/old/f": PATH}, ["cache/"]
+    )
+    assert changed == {"tree", "tree/old", "tree/old/f", "tree/i"}
+    assert "cache" not in index.dirs and "cache/x" not in index.files
+    assert index.files["tree/old/f"].st_size == len(b"changed")
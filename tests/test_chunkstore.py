@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+
+import pytest
+
+import core.chunkstore as chunkstore
+from core.chunkstore import (
+    RECIPE_VERSION,
+    ChunkStore,
+    chunk_buffer,
+    chunk_digest,
+    get_recipe_path,
+    list_recipe_files,
+    restore_tree,
+    save_recipe,
+    store_tree
+)
+from core.scanner import scan_tree
+
+def _put(store, data):
+    digest = chunk_digest(data)
+    store.put(digest, data)
+    store.index[digest] = len(data)
+    return digest
+
+def _write_recipe(backup_dir, name, digests):
+    recipe = {
+        "version": RECIPE_VERSION,
+        "files": {"f": {"size": 0, "mtime_ns": 0, "mode": 0o644, "chunks": [[d, 0] for d in digests], "verified": None}},
+        "dirs": {},
+        "symlinks": {}
+    }
+    path = get_recipe_path(backup_dir, name)
+    assert save_recipe(recipe, path)
+    return path
+
+def test_collect_garbage_keeps_referenced_chunks(tmp_path):
+    store = ChunkStore(tmp_path / "chunkstore")
+    old, shared, current, orphan = (_put(store, data) for data in (b"old", b"shared", b"current", b"orphan"))
+    # 快照目录在备份根目录下，固定备份目录在别处
+    root = tmp_path / "backup"
+    _write_recipe(root / "backup_2025-06-27", "src", [old, shared])
+    current_recipe = _write_recipe(tmp_path / "fixed", "src", [shared, current])
+    stale_tmp = store.chunk_path(current) + ".123.tmp"
+    open(stale_tmp, "wb").close()
+
+    recipe_files = list_recipe_files(root, [tmp_path / "fixed"])
+    assert len(recipe_files) == 2
+    removed, freed = store.collect_garbage(recipe_files, [current_recipe])
+    assert (removed, freed) == (2, len(b"orphan"))
+    for digest in (old, shared, current):
+        assert os.path.exists(store.chunk_path(digest))
+    assert not os.path.exists(store.chunk_path(orphan))
+    assert not os.path.exists(stale_tmp)
+    assert store.index == {old: 3, shared: 6, current: 7}
+    assert ChunkStore(store.root).index == store.index
+
+def test_collect_garbage_refuses_without_current_recipe(tmp_path):
+    store = ChunkStore(tmp_path / "chunkstore")
+    current = _put(store, b"current")
+    current_recipe = _write_recipe(tmp_path / "fixed", "src", [current])
+
+    # 本次备份的配方不在列表中（如 BACKUP_DIR 不在备份根目录下）时不删除任何块
+    assert store.collect_garbage(list_recipe_files(tmp_path / "backup"), [current_recipe]) == (0, 0)
+    assert os.path.exists(store.chunk_path(current))
+
+def test_save_index_from_parallel_writers(tmp_path):
+    store = ChunkStore(tmp_path / "chunkstore")
+
+    def writer(n):
+        for i in range(50):
+            with store.lock:
+                store.index[f"{n}-{i}"] = i
+            store.save_index()
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(ChunkStore(store.root).index) == 200
+    assert os.listdir(store.root) == ["index.json"]
+
+@pytest.mark.parametrize("sizes", [(16, 64, 256), (2048, 8192, 32768)])
+def test_vectorized_chunking_matches_byte_loop(monkeypatch, sizes):
+    pytest.importorskip("numpy")
+    data = os.urandom(300000) + bytes(100000) + b"abcdefgh" * 20000 + os.urandom(99999)
+    lengths = chunk_buffer(data, *sizes)
+    assert sum(lengths) == len(data)
+    monkeypatch.setattr(chunkstore, "numpy", None)
+    assert chunk_buffer(data, *sizes) == lengths
+
+def test_store_tree_reuses_unchanged_segments(tmp_path, monkeypatch, capsys):
+    segment = 1024 * 1024
+    monkeypatch.setattr(chunkstore, "CHUNK_SEGMENT_SIZE", segment)
+    src = tmp_path / "src"
+    src.mkdir()
+    disk = src / "disk.vdi"
+    disk.write_bytes(os.urandom(3 * segment + 1000))
+    store = ChunkStore(tmp_path / "chunkstore")
+    first = store_tree(scan_tree(src), store, workers=2)
+
+    # 修改第二个分段中的数据，文件的修改时间随之改变
+    with open(str(disk), "r+b") as f:
+        f.seek(segment + 100)
+        f.write(b"changed")
+    capsys.readouterr()
+    second = store_tree(scan_tree(src), store, first, workers=2)
+    assert "沿用未变化的分段 3 个" in capsys.readouterr().out
+    old, new = first["files"]["disk.vdi"], second["files"]["disk.vdi"]
+    assert [a == b for a, b in zip(old["segments"], new["segments"])] == [True, False, True, True]
+    assert second["segment_size"] == segment
+
+    restore_tree(second, store, tmp_path / "out")
+    assert (tmp_path / "out" / "disk.vdi").read_bytes() == disk.read_bytes()
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+
+from core.file_index import load_file_index, search_file_index, write_file_index
+from core.scanner import scan_tree
+
+@pytest.mark.parametrize("dir_name", ["backup?x", "backup#1", "backup%20x"])
+def test_file_index_with_special_characters_in_path(tmp_path, dir_name):
+    src = tmp_path / "src"
+    (src / "sub").mkdir(parents=True)
+    (src / "sub" / "a").write_bytes(b"a")
+    backup_dir = tmp_path / dir_name
+    backup_dir.mkdir()
+
+    assert write_file_index(backup_dir, "src", scan_tree(src))
+    assert sorted(entry.rel_path for entry in load_file_index(backup_dir, "src")) == ["sub", "sub/a"]
+    assert [entry.rel_path for entry in search_file_index(backup_dir, "src/sub/*")] == ["sub/a"]
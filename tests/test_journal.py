@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import core.backup as backup
+from core.journal import SCANNED, TRANSFERRED, VERIFIED, RunJournal
+from core.manifest import HASH, get_manifest_path, load_manifest
+from core.hasher import hash_file
+from core.scanner import scan_tree
+
+def _interrupted_run(src, backup_dir, state):
+    """模拟在 state 状态下中断的备份：运行日志中只有扫描结果（和已完成的传输）"""
+    manager = backup.BackupManager()
+    manager.journal.begin(str(backup_dir), ["profile_src"])
+    index = scan_tree(src)
+    manager.journal.save_index("profile_src", index)
+    if state == TRANSFERRED:
+        backup.sync_tree(index, backup_dir / "profile")
+        manager.journal.set_state("profile_src", TRANSFERRED)
+    manager.journal.close()
+
+def test_run_journal_round_trip(tmp_path):
+    src = tmp_path / "src"
+    src.mkdir()
+    (src / "a").write_bytes(b"aaa")
+    os.symlink("a", str(src / "link"))
+    index = scan_tree(src)
+    index.overrides["a"] = str(tmp_path / "snapshot")
+
+    journal = RunJournal(tmp_path / "journal.sqlite", checkpoint_seconds=3600)
+    assert journal.begin("/backup/x", ["s1", "s2"])
+    journal.save_index("s1", index)
+    journal.record_entry("s1", "a", [3, 1, 0o644, "abc", None])
+    journal.set_state("s2", VERIFIED)
+    journal.close()
+
+    journal = RunJournal(tmp_path / "journal.sqlite")
+    run = journal.load()
+    assert run["backup_dir"] == "/backup/x"
+    assert run["states"] == {"s1": SCANNED, "s2": VERIFIED}
+    loaded = journal.load_index("s1")
+    assert loaded.root == index.root
+    assert loaded.overrides == index.overrides
+    assert loaded.files["a"].st_mtime_ns == index.files["a"].st_mtime_ns
+    assert set(loaded.symlinks) == {"link"}
+    # 缓存的清单条目在更新状态时已写入
+    assert journal.entries("s1") == {"a": [3, 1, 0o644, "abc", None]}
+    assert journal.load_index("s2") is None
+    journal.remove()
+    assert not os.path.exists(str(tmp_path / "journal.sqlite"))
+
+def test_resume_rescans_sources_not_yet_transferred(backup_env):
+    src, backup_dir = backup_env
+    _interrupted_run(src, backup_dir, SCANNED)
+    # 中断之后源目录被修改：新增、修改和删除文件
+    (src / "new").write_bytes(b"created after the interruption")
+    (src / "f0").write_bytes(b"edited after the interruption")
+    os.remove(str(src / "f2"))
+
+    assert backup.BackupManager().perform_backup(resume=True)
+
+    manifest = load_manifest(get_manifest_path(str(backup_dir), "profile"))
+    assert set(manifest["entries"]) == set(scan_tree(src).files)
+    assert manifest["entries"]["f0"][HASH] == hash_file(src / "f0")
+    assert (backup_dir / "profile" / "new").read_bytes() == b"created after the interruption"
+    assert not os.path.exists(backup.RUN_JOURNAL_FILE)
+
+def test_resume_transferred_source_skips_files_edited_since(backup_env):
+    src, backup_dir = backup_env
+    _interrupted_run(src, backup_dir, TRANSFERRED)
+    (src / "f0").write_bytes(b"edited after the interruption")
+    os.remove(str(src / "f2"))
+
+    assert backup.BackupManager().perform_backup(resume=True)
+
+    # 已传输的源目录不再传输：修改过的文件不验证，清单按备份中的副本记录且不带校验和
+    entries = load_manifest(get_manifest_path(str(backup_dir), "profile"))["entries"]
+    assert entries["f0"][HASH] is None
+    assert entries["f0"][0] == os.path.getsize(str(backup_dir / "profile" / "f0"))
+    assert entries["sub/f1"][HASH] == hash_file(src / "sub" / "f1")
+
+    # 下一次备份重新传输并补上校验和
+    assert backup.BackupManager().perform_backup()
+    entries = load_manifest(get_manifest_path(str(backup_dir), "profile"))["entries"]
+    assert entries["f0"][HASH] == hash_file(src / "f0")
+    assert "f2" not in entries
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+import os
+import signal
+import subprocess
+import time
+
+import pytest
+
+from core.parallel import JobCancelled, JobRunner, run_process
+
+def _sleep_stage(started, seconds=30):
+    def stage():
+        started.append(time.time())
+        run_process(["sleep", str(seconds)])
+        return True
+    return stage
+
+def test_job_timeout_terminates_subprocess():
+    started, verified = [], []
+    runner = JobRunner(2, 2, timeout=0.5)
+    begin = time.time()
+    results = runner.run_jobs(
+        {
+            "slow": [_sleep_stage(started), lambda: verified.append("slow") or True],
+            "fast": [lambda: True, lambda: verified.append("fast") or True]
+        },
+        {}
+    )
+    assert time.time() - begin < 10
+    assert not results["slow"]["success"]
+    assert "超过" in results["slow"]["error"]
+    # 超时的任务不再开始后续阶段，其他任务不受影响
+    assert results["fast"]["success"] and results["fast"]["error"] is None
+    assert verified == ["fast"]
+    assert started
+
+def test_signal_cancels_all_jobs():
+    started, verified, cancelled = [], [], []
+
+    def interrupt():
+        while len(started) < 2:
+            time.sleep(0.01)
+        os.kill(os.getpid(), signal.SIGINT)
+        time.sleep(0.5)
+        # 已取消的任务不再启动新的子进程
+        try:
+            run_process(["true"])
+        except JobCancelled:
+            cancelled.append(True)
+            raise
+        return True
+
+    runner = JobRunner(3, 3, timeout=0)
+    begin = time.time()
+    results = runner.run_jobs(
+        {
+            "a": [_sleep_stage(started), lambda: verified.append("a") or True],
+            "b": [_sleep_stage(started), lambda: verified.append("b") or True],
+            "trigger": [interrupt]
+        },
+        {}
+    )
+    assert time.time() - begin < 10
+    for name in ("a", "b", "trigger"):
+        assert not results[name]["success"]
+        assert results[name]["error"] == "收到终止信号"
+    assert cancelled
+    assert verified == []
+
+def test_run_process_idle_timeout():
+    begin = time.time()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_process(["sleep", "30"], on_line=lambda line: None, idle_timeout=0.5)
+    assert time.time() - begin < 10
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+import pytest
+
+import core.backup as backup
+import core.restore as restore
+from core.diff import plan_restore
+from core.scanner import scan_tree
+
+def _signature(path):
+    st = os.stat(str(path))
+    return (st.st_size, st.st_mtime_ns)
+
+def test_plan_restore_create_update_delete(tmp_path):
+    dst = tmp_path / "dst"
+    (dst / "keep").mkdir(parents=True)
+    (dst / "old_dir" / "nested").mkdir(parents=True)
+    (dst / "keep" / "same").write_bytes(b"same")
+    (dst / "keep" / "changed").write_bytes(b"old content")
+    (dst / "extra").write_bytes(b"not in the backup")
+    (dst / "as_file").mkdir()
+    os.symlink("keep/same", str(dst / "stale_link"))
+    os.symlink("keep/same", str(dst / "good_link"))
+
+    files = {
+        "keep/same": _signature(dst / "keep" / "same"),
+        "keep/changed": (len(b"new content!"), 1),
+        "keep/new": (100, 1),
+        # 备份中是文件，目标中是同名目录
+        "as_file": (10, 1),
+    }
+    dirs = {"keep": 0o755}
+    symlinks = {"good_link": "keep/same", "new_link": "keep/new"}
+
+    plan = plan_restore(files, scan_tree(dst), dirs, symlinks)
+    assert sorted(plan["create"]) == ["as_file", "keep/new"]
+    assert plan["update"] == ["keep/changed"]
+    assert plan["unchanged"] == ["keep/same"]
+    assert sorted(plan["delete"]) == ["extra", "stale_link"]
+    assert sorted(plan["delete_dirs"]) == ["as_file", "old_dir", "old_dir/nested"]
+    assert plan["links"] == ["new_link"]
+    assert plan["bytes"] == 100 + 10 + len(b"new content!")
+
+def test_plan_restore_without_listing_keeps_dirs_and_links(tmp_path):
+    dst = tmp_path / "dst"
+    (dst / "sub").mkdir(parents=True)
+    (dst / "sub" / "a").write_bytes(b"a")
+    os.symlink("sub/a", str(dst / "link"))
+
+    # 只有清单时不知道备份中的目录和符号链接，不删除它们
+    plan = plan_restore({"sub/a": _signature(dst / "sub" / "a")}, scan_tree(dst))
+    assert plan["delete"] == []
+    assert plan["delete_dirs"] == []
+    assert plan["links"] == []
+    assert plan["unchanged"] == ["sub/a"]
+
+@pytest.fixture
+def restore_env(backup_env, tmp_path, monkeypatch):
+    """备份 backup_env 的源目录，并把它配置为恢复到目录名不同的位置"""
+    src, backup_dir = backup_env
+    assert backup.BackupManager().perform_backup()
+    dst = tmp_path / "home" / "a1x4t0kj.default-release"
+    monkeypatch.setattr(restore, "RESTORE_PATHS", {"test-disk": {"profile_dst": str(dst)}})
+    monkeypatch.setattr(restore, "RESTORE_SOURCES", {"profile_dst": "profile_src"})
+    monkeypatch.setattr(restore, "SOURCE_PATHS", {"profile_src": str(src)})
+    monkeypatch.setattr(restore, "RESTORE_ENGINES", {"profile_dst": "native"})
+    monkeypatch.setattr(restore, "BACKUP_ROOT", os.path.dirname(str(backup_dir)))
+    monkeypatch.setattr(restore, "MIN_FREE_SPACE_GB", 0)
+    monkeypatch.setattr(restore, "apply_priority", lambda: None)
+    monkeypatch.setattr(restore.RunMetrics, "save", lambda self, directory=None: None)
+    return src, dst
+
+def _tree(root):
+    index = scan_tree(root)
+    return {rel_path: open(index.abspath(rel_path), "rb").read() for rel_path in index.files}
+
+@pytest.mark.parametrize("use_plan", [True, False])
+def test_restore_finds_backup_by_source_name(restore_env, monkeypatch, use_plan):
+    src, dst = restore_env
+    monkeypatch.setattr(restore, "RESTORE_PLAN", use_plan)
+    manager = restore.RestoreManager("test-disk")
+    assert manager.sources == {"profile_dst": "profile"}
+    assert manager.perform_restore()
+    assert _tree(dst) == _tree(src)
+
+def test_restore_selected_uses_configured_location(restore_env):
+    src, dst = restore_env
+    assert restore.RestoreManager("test-disk").restore_selected("profile/sub/*")
+    assert sorted(_tree(dst)) == sorted(rel_path for rel_path in _tree(src) if rel_path.startswith("sub/"))
+
+def test_backup_name_falls_back_to_restore_location(restore_env, monkeypatch):
+    monkeypatch.setattr(restore, "RESTORE_SOURCES", {})
+    manager = restore.RestoreManager("test-disk")
+    assert manager.sources == {"profile_dst": "a1x4t0kj.default-release"}
+
+def test_restore_skips_failed_backup(restore_env, tmp_path, monkeypatch):
+    src, dst = restore_env
+    backup_root = tmp_path / "usb" / "backup"
+    # 之后一次备份失败：只复制了部分文件，备份记录中为失败
+    os.remove(str(src / "f0"))
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(backup_root / "backup_2025-06-29"))
+    monkeypatch.setattr(backup.BackupManager, "_verify_backup", lambda self, *args, **kwargs: False)
+    assert not backup.BackupManager().perform_backup()
+
+    manager = restore.RestoreManager("test-disk")
+    assert manager._get_latest_backup() == backup_root / "backup_2025-06-28"
+    assert manager.perform_restore()
+    assert (dst / "f0").exists()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sqlite3
+import stat
+
+import pytest
+
+from core.scanner import scan_tree
+from core.sqlite_capture import capture_databases, snapshot_database
+
+def _create_wal_database(path):
+    """创建WAL模式的数据库，返回保持打开的写连接（提交的内容留在WAL文件中）"""
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA wal_autocheckpoint=0")
+    conn.execute("CREATE TABLE places (id INTEGER PRIMARY KEY, url TEXT)")
+    conn.executemany("INSERT INTO places (url) VALUES (?)", [(f"https://example.com/{i}",) for i in range(500)])
+    conn.commit()
+    return conn
+
+def _rows(path):
+    conn = sqlite3.connect(str(path))
+    try:
+        return conn.execute("SELECT count(*) FROM places").fetchone()[0]
+    finally:
+        conn.close()
+
+@pytest.mark.parametrize("method", ["backup", "vacuum"])
+def test_snapshot_database_reads_wal_while_in_use(tmp_path, method):
+    src = tmp_path / "places.sqlite"
+    writer = _create_wal_database(src)
+    try:
+        assert os.path.getsize(str(src) + "-wal") > 0
+        # 写连接上有未提交的事务，快照只包含已提交的内容
+        writer.execute("BEGIN")
+        writer.execute("INSERT INTO places (url) VALUES ('uncommitted')")
+        dst = tmp_path / "staging" / "places.sqlite"
+        snapshot_database(src, dst, method=method)
+    finally:
+        writer.rollback()
+        writer.close()
+
+    assert _rows(dst) == 500
+    assert not os.path.exists(str(dst) + ".tmp")
+    assert not os.path.exists(str(dst) + "-wal")
+    conn = sqlite3.connect(str(dst))
+    try:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+    finally:
+        conn.close()
+
+def test_capture_databases_vacuum_does_not_fall_back(tmp_path, monkeypatch):
+    profile = tmp_path / "profile"
+    profile.mkdir()
+    _create_wal_database(profile / "cookies.sqlite").close()
+    fallbacks = []
+    monkeypatch.setattr(
+        "core.sqlite_capture.snapshot_database",
+        lambda src, dst: snapshot_database(src, dst, method="vacuum")
+    )
+    monkeypatch.setattr("core.sqlite_capture._snapshot_from_copy", lambda *args: fallbacks.append(args))
+
+    index = scan_tree(profile)
+    overrides = capture_databases("profile", index, tmp_path / "staging")
+
+    # 在线快照成功时不会退回到复制数据库文件
+    assert fallbacks == []
+    assert list(overrides) == ["cookies.sqlite"]
+    assert _rows(overrides["cookies.sqlite"]) == 500
+
+def test_capture_databases_keeps_source_metadata(tmp_path):
+    profile = tmp_path / "profile"
+    profile.mkdir()
+    writer = _create_wal_database(profile / "places.sqlite")
+    try:
+        os.chmod(str(profile / "places.sqlite"), 0o600)
+        os.utime(str(profile / "places.sqlite"), ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000))
+        index = scan_tree(profile)
+        src_st = index.files["places.sqlite"]
+        wal_st = index.files["places.sqlite-wal"]
+        overrides = capture_databases("profile", index, tmp_path / "staging")
+    finally:
+        writer.close()
+
+    staged_st = os.stat(overrides["places.sqlite"])
+    assert stat.S_IMODE(staged_st.st_mode) == 0o600
+    assert (staged_st.st_uid, staged_st.st_gid) == (src_st.st_uid, src_st.st_gid)
+    # 提交只写入了WAL文件，快照的修改时间取较新的WAL文件
+    assert staged_st.st_mtime_ns == max(src_st.st_mtime_ns, wal_st.st_mtime_ns)
+    assert index.files["places.sqlite"].st_mtime_ns == staged_st.st_mtime_ns
+    assert "places.sqlite-wal" not in index.files
+    assert index.abspath("places.sqlite") == overrides["places.sqlite"]